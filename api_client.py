@@ -0,0 +1,619 @@
+"""
+Клиент API ГИС «Электронный знак» (Datamark)
+
+Все экземпляры APIClient с одинаковым API_BASE_URL используют один общий пул
+HTTP-соединений с keep-alive и общий потокобезопасный кэш токена, поэтому
+параллельные задания не повторяют авторизацию и TLS-рукопожатие.
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from config import (
+    API_BASE_URL, API_USERNAME, API_PASSWORD,
+    PRODUCT_GROUP, CODE_TYPE, COUNTRY_CODE, REASON_CODE,
+    MAX_WAIT_TIME, CHECK_INTERVAL,
+    HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_CONNECT_RETRIES, TOKEN_REFRESH_MARGIN,
+    CODES_PAGE_SIZE, API_MAX_RETRIES, API_RETRY_BACKOFF, API_RETRY_MAX_DELAY
+)
+from metrics import API_REQUESTS, API_REQUEST_SECONDS, API_RETRIES, current_call, timed_api_call
+from rate_limit import (
+    get_api_limiter, OUTCOME_SUCCESS, OUTCOME_OVERLOAD,
+    ENDPOINT_AUTH, ENDPOINT_ORDER, ENDPOINT_REPORT, ENDPOINT_DOWNLOAD, ENDPOINT_STATUS, ENDPOINT_OTHER
+)
+from shared_state import get_shared_store, worker_id
+
+logger = logging.getLogger(__name__)
+
+# Адреса методов API
+AUTH_PATH = '/api/v1/auth/login'
+ORDERS_PATH = '/api/v1/orders'
+ORDER_PATH = '/api/v1/orders/{order_id}'
+ORDER_CODES_PATH = '/api/v1/orders/{order_id}/codes'
+IMPORT_REPORTS_PATH = '/api/v1/reports/import'
+REPORT_PATH = '/api/v1/reports/{report_id}'
+
+# Статусы заказа и отчета в ответах API -> внутренние статусы
+ORDER_READY = 'ready'
+ORDER_FAILED = 'failed'
+ORDER_PENDING = 'pending'
+ORDER_STATUSES = {
+    'READY': ORDER_READY,
+    'COMPLETED': ORDER_READY,
+    'ERROR': ORDER_FAILED,
+    'REJECTED': ORDER_FAILED,
+}
+
+REPORT_COMPLETED = 'completed'
+REPORT_FAILED = 'failed'
+REPORT_PROCESSING = 'processing'
+REPORT_STATUSES = {
+    'ACCEPTED': REPORT_COMPLETED,
+    'COMPLETED': REPORT_COMPLETED,
+    'PROCESSED': REPORT_COMPLETED,
+    'REJECTED': REPORT_FAILED,
+    'ERROR': REPORT_FAILED,
+    'FAILED': REPORT_FAILED,
+}
+
+
+
+# Ответы, после которых запрос повторяется: 429 - для любых запросов, 502-504 - только
+# для GET (повтор POST мог бы создать второй заказ или отчет)
+THROTTLED_STATUSES = (429,)
+RETRY_GET_STATUSES = (502, 503, 504)
+
+
+def endpoint_class(method: str, path: str) -> str:
+    """Класс запроса для ограничителя частоты (см. rate_limit)"""
+    if path == AUTH_PATH:
+        return ENDPOINT_AUTH
+    if method == 'POST':
+        if path == ORDERS_PATH:
+            return ENDPOINT_ORDER
+        if path == IMPORT_REPORTS_PATH:
+            return ENDPOINT_REPORT
+        return ENDPOINT_OTHER
+    if path.endswith('/codes'):
+        return ENDPOINT_DOWNLOAD
+    return ENDPOINT_STATUS
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Заголовок Retry-After (секунды или HTTP-дата) -> секунды ожидания"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class OrderError(Exception):
+    """Заказ отклонен, не выполнен вовремя или его коды не удалось скачать"""
+
+
+# Время установления соединения текущего потока (обнуляется перед каждым запросом)
+_timings = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP-соединение, замеряющее время установления TCP-соединения"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        _timings.connect = time.perf_counter() - start
+        return sock
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS-соединение, замеряющее время TCP-соединения и TLS-рукопожатия"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        _timings.connect = time.perf_counter() - start
+        return sock
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _timings.tls = time.perf_counter() - start - getattr(_timings, 'connect', 0.0)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Адаптер requests с пулом соединений, замеряющих время connect и TLS"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class TokenCache:
+    """
+    Потокобезопасный кэш токена авторизации
+
+    Токен считается действительным до expires_at - TOKEN_REFRESH_MARGIN, после чего
+    первый обратившийся поток получает новый токен, а остальные ждут его результата.
+
+    Если задано общее хранилище (shared_state), токен общий для всех процессов:
+    действующий токен берется из хранилища, а новый получает только процесс,
+    взявший аренду на авторизацию; остальные ждут, пока он опубликует токен.
+    """
+
+    def __init__(self, refresh_margin: float = TOKEN_REFRESH_MARGIN, store=None, key: str = ''):
+        self.refresh_margin = refresh_margin
+        self.store = store
+        self.key = key
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[str]:
+        """Возвращает действующий токен или None"""
+        if self._token and time.time() < self._expires_at - self.refresh_margin:
+            return self._token
+        return None
+
+    def get_or_refresh(self, login) -> Optional[str]:
+        """
+        Возвращает действующий токен, при необходимости получая новый
+
+        Args:
+            login: функция без аргументов, возвращающая (token, expires_in) или None
+        """
+        token = self.get()
+        if token:
+            return token
+        with self._lock:
+            token = self.get() or self._adopt_shared()
+            if token:
+                return token
+            if self.store is None:
+                return self._issue(login)
+            return self._issue_shared(login)
+
+    def _issue(self, login) -> Optional[str]:
+        issued = login()
+        if not issued:
+            return None
+        self._token, expires_in = issued
+        self._expires_at = time.time() + expires_in
+        return self._token
+
+    def _adopt_shared(self) -> Optional[str]:
+        """Берет действующий токен из общего хранилища"""
+        if self.store is None:
+            return None
+        shared = self.store.get_token(self.key)
+        if shared and time.time() < shared[1] - self.refresh_margin:
+            self._token, self._expires_at = shared
+            return self._token
+        return None
+
+    def _issue_shared(self, login) -> Optional[str]:
+        """Получает токен под арендой, чтобы процессы не авторизовались одновременно"""
+        lease = f'auth:{self.key}'
+        deadline = time.time() + HTTP_TIMEOUT
+        while not self.store.claim_lease(lease, worker_id(), HTTP_TIMEOUT):
+            if time.time() >= deadline:
+                # Процесс с арендой не ответил вовремя - авторизуемся сами
+                return self._issue(login)
+            time.sleep(0.2)
+            token = self._adopt_shared()
+            if token:
+                return token
+        try:
+            # Токен мог появиться, пока аренда была у другого процесса
+            token = self._adopt_shared()
+            if token:
+                return token
+            token = self._issue(login)
+            if token:
+                self.store.save_token(self.key, token, self._expires_at)
+            return token
+        finally:
+            self.store.release_lease(lease, worker_id())
+
+    def invalidate(self, token: Optional[str] = None):
+        """Сбрасывает токен (если token указан - только если он еще текущий)"""
+        with self._lock:
+            if token is None or token == self._token:
+                if self.store is not None and self._token:
+                    self.store.delete_token(self.key, self._token)
+                self._token = None
+                self._expires_at = 0.0
+
+
+# Общие для всех клиентов пулы соединений и кэши токенов
+_sessions: Dict[str, requests.Session] = {}
+_token_caches: Dict[Tuple[str, str], TokenCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_session(base_url: str) -> requests.Session:
+    """Возвращает общую сессию (пул соединений с keep-alive) для base_url"""
+    with _shared_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=Retry(total=None, connect=HTTP_CONNECT_RETRIES, read=0, status=0,
+                                  other=0, backoff_factor=0.5)
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept': 'application/json'})
+            _sessions[base_url] = session
+        return session
+
+
+def get_token_cache(base_url: str, username: Optional[str]) -> TokenCache:
+    """Возвращает общий кэш токена для пары (base_url, username)"""
+    key = (base_url, username or '')
+    with _shared_lock:
+        cache = _token_caches.get(key)
+        if cache is None:
+            cache = _token_caches[key] = TokenCache(store=get_shared_store(), key='|'.join(key))
+        return cache
+
+
+class APIClient:
+    """Клиент API для заказа кодов маркировки и отправки отчетов о вводе в оборот"""
+
+    def __init__(self, base_url: str = API_BASE_URL, username: Optional[str] = API_USERNAME,
+                 password: Optional[str] = API_PASSWORD):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.session = get_shared_session(self.base_url)
+        self.token_cache = get_token_cache(self.base_url, username)
+        self.limiter = get_api_limiter(self.base_url)
+
+    # Низкоуровневые запросы
+
+    def _send(self, method: str, path: str, token: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Выполняет запрос через общий ограничитель нагрузки
+
+        Ответ 429 (и 502-504 на GET) повторяется до API_MAX_RETRIES раз: пауза
+        берется из Retry-After (тогда приостанавливается весь класс запросов) или
+        растет экспоненциально со случайным разбросом.
+        """
+        headers = kwargs.pop('headers', {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        endpoint = endpoint_class(method, path)
+
+        for attempt in range(API_MAX_RETRIES + 1):
+            with self.limiter.slot(endpoint) as slot:
+                try:
+                    response = self._send_once(method, path, headers, **kwargs)
+                except requests.Timeout:
+                    slot.outcome = OUTCOME_OVERLOAD
+                    raise
+                overloaded = response.status_code in THROTTLED_STATUSES or response.status_code >= 500
+                slot.outcome = OUTCOME_OVERLOAD if overloaded else OUTCOME_SUCCESS
+
+            retryable = response.status_code in THROTTLED_STATUSES or (
+                method == 'GET' and response.status_code in RETRY_GET_STATUSES)
+            if not retryable or attempt == API_MAX_RETRIES:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = min(retry_after, API_RETRY_MAX_DELAY)
+                self.limiter.pause(endpoint, delay)
+            else:
+                delay = min(API_RETRY_BACKOFF * 2 ** attempt, API_RETRY_MAX_DELAY) * random.uniform(0.5, 1.0)
+            reason = 'throttled' if response.status_code in THROTTLED_STATUSES else 'server_error'
+            API_RETRIES.labels('login' if path == AUTH_PATH else current_call(), reason).inc()
+            logger.warning(f"{method} {path} -> {response.status_code}, повтор через {delay:.1f} с "
+                           f"(попытка {attempt + 2} из {API_MAX_RETRIES + 1})")
+            time.sleep(delay)
+        return response
+
+    def _send_once(self, method: str, path: str, headers: dict, **kwargs) -> requests.Response:
+        """Выполняет запрос, записывает метрики и пишет в DEBUG-лог время connect, TLS и запроса"""
+        _timings.connect = 0.0
+        _timings.tls = 0.0
+
+        call = 'login' if path == AUTH_PATH else current_call()
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, headers=headers,
+                                            timeout=HTTP_TIMEOUT, **kwargs)
+        except requests.RequestException:
+            API_REQUESTS.labels(call, 'error').inc()
+            raise
+        total = time.perf_counter() - start
+        API_REQUESTS.labels(call, response.status_code).inc()
+        API_REQUEST_SECONDS.labels(call).observe(total)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            connect_ms = _timings.connect * 1000
+            tls_ms = _timings.tls * 1000
+            logger.debug(
+                f"{method} {path} -> {response.status_code}: "
+                f"connect {connect_ms:.1f} мс, TLS {tls_ms:.1f} мс, "
+                f"запрос {total * 1000 - connect_ms - tls_ms:.1f} мс, всего {total * 1000:.1f} мс"
+                + ('' if connect_ms else ' (соединение из пула)')
+            )
+        return response
+
+    def _request(self, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        """
+        Выполняет авторизованный запрос; при ответе 401 обновляет токен и повторяет запрос один раз
+
+        Returns:
+            requests.Response или None при ошибке сети/авторизации
+        """
+        for attempt in range(2):
+            token = self.token_cache.get_or_refresh(self._login)
+            if not token:
+                return None
+            try:
+                response = self._send(method, path, token=token, **kwargs)
+            except requests.RequestException as e:
+                logger.error(f"Ошибка запроса {method} {path}: {e}")
+                return None
+            if response.status_code != 401:
+                return response
+            logger.warning(f"Токен отклонен ({method} {path}), повторная авторизация")
+            self.token_cache.invalidate(token)
+            if attempt == 0:
+                API_RETRIES.labels(current_call(), 'unauthorized').inc()
+        return response
+
+    def _login(self) -> Optional[Tuple[str, float]]:
+        """Получает новый токен. Returns: (token, expires_in) или None"""
+        if not self.username or not self.password:
+            logger.error("Не заданы API_USERNAME и API_PASSWORD")
+            return None
+        try:
+            response = self._send('POST', AUTH_PATH, json={
+                'username': self.username,
+                'password': self.password
+            })
+        except requests.RequestException as e:
+            logger.error(f"Ошибка запроса авторизации: {e}")
+            return None
+        if response.status_code != 200:
+            logger.error(f"Ошибка авторизации: {response.status_code} - {response.text[:500]}")
+            return None
+        data = response.json()
+        token = data.get('token') or data.get('access_token')
+        if not token:
+            logger.error("Ответ авторизации не содержит токен")
+            return None
+        expires_in = float(data.get('expiresIn') or data.get('expires_in') or 3600)
+        logger.info(f"Получен новый токен, срок действия {expires_in:.0f} с")
+        return token, expires_in
+
+    @staticmethod
+    def _json(response: Optional[requests.Response], expected=(200, 201, 202)) -> Optional[dict]:
+        if response is None:
+            return None
+        if response.status_code not in expected:
+            logger.error(f"Ошибка API {response.request.method} {response.url}: "
+                         f"{response.status_code} - {response.text[:500]}")
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            logger.error(f"Некорректный JSON в ответе {response.url}")
+            return None
+
+    # Методы API
+
+    @timed_api_call
+    def authenticate(self) -> bool:
+        """
+        Авторизация в API. Используется общий кэш токена: новый токен запрашивается,
+        только если текущий отсутствует или истекает в ближайшие TOKEN_REFRESH_MARGIN секунд
+
+        Returns:
+            bool: True, если токен получен
+        """
+        return self.token_cache.get_or_refresh(self._login) is not None
+
+    @timed_api_call
+    def order_codes(self, codes_to_order: dict) -> Optional[str]:
+        """
+        Заказывает коды маркировки
+
+        Args:
+            codes_to_order: {gtin: количество}
+
+        Returns:
+            str: идентификатор заказа или None
+        """
+        data = self._json(self._request('POST', ORDERS_PATH, json={
+            'productGroup': PRODUCT_GROUP,
+            'products': [
+                {'gtin': gtin, 'quantity': quantity, 'codeType': CODE_TYPE}
+                for gtin, quantity in codes_to_order.items()
+            ]
+        }))
+        if not data:
+            return None
+        order_id = data.get('orderId') or data.get('order_id')
+        return str(order_id) if order_id else None
+
+    @timed_api_call
+    def get_order_status(self, order_id: str) -> Optional[str]:
+        """
+        Returns:
+            str: 'ready', 'failed', 'pending' или None при ошибке запроса
+        """
+        data = self._json(self._request('GET', ORDER_PATH.format(order_id=order_id)))
+        if not data:
+            return None
+        return ORDER_STATUSES.get(str(data.get('status', '')).upper(), ORDER_PENDING)
+
+    @timed_api_call
+    def wait_for_order_completion(self, order_id: str) -> bool:
+        """
+        Ожидает выполнения заказа, проверяя статус каждые CHECK_INTERVAL секунд
+
+        Returns:
+            bool: True, если заказ выполнен за MAX_WAIT_TIME секунд
+        """
+        deadline = time.monotonic() + MAX_WAIT_TIME
+        while True:
+            status = self.get_order_status(order_id)
+            if status == ORDER_READY:
+                return True
+            if status == ORDER_FAILED:
+                logger.error(f"Заказ {order_id} отклонен")
+                return False
+            if time.monotonic() + CHECK_INTERVAL > deadline:
+                return False
+            time.sleep(CHECK_INTERVAL)
+
+    @timed_api_call
+    def download_codes(self, order_id: str) -> List[str]:
+        """
+        Скачивает полные коды маркировки по выполненному заказу
+
+        Returns:
+            list: коды маркировки (пустой список при ошибке)
+        """
+        data = self._json(self._request('GET', ORDER_CODES_PATH.format(order_id=order_id)))
+        if not data:
+            return []
+        return list(data.get('codes') or [])
+
+    @timed_api_call
+    def download_codes_page(self, order_id: str, offset: int, limit: int = CODES_PAGE_SIZE) -> Optional[List[str]]:
+        """
+        Скачивает страницу кодов заказа, начиная с offset
+
+        Returns:
+            list: коды страницы (меньше limit, если больше кодов пока нет) или None при ошибке запроса
+        """
+        data = self._json(self._request('GET', ORDER_CODES_PATH.format(order_id=order_id),
+                                        params={'offset': offset, 'limit': limit}))
+        if data is None:
+            return None
+        return list(data.get('codes') or [])
+
+    def iter_order_codes(self, order_id: str, page_size: int = CODES_PAGE_SIZE,
+                         max_wait: float = MAX_WAIT_TIME) -> Iterator[List[str]]:
+        """
+        Скачивает коды заказа постранично по мере их выпуска
+
+        Полные страницы запрашиваются подряд; когда новых кодов нет, проверяется
+        статус заказа с интервалом CHECK_INTERVAL. После того как заказ выполнен,
+        скачивается остаток кодов.
+
+        Yields:
+            list: очередная непустая страница кодов
+
+        Raises:
+            OrderError: заказ отклонен, не выполнен за max_wait секунд или после
+                выполнения заказа коды не удалось скачать
+        """
+        deadline = time.monotonic() + max_wait
+        offset = 0
+        ready = False
+        while True:
+            page = self.download_codes_page(order_id, offset, page_size)
+            if page:
+                offset += len(page)
+                yield page
+                if len(page) >= page_size:
+                    continue
+            if ready:
+                if page is None:
+                    raise OrderError(f'Ошибка скачивания кодов заказа {order_id}')
+                return
+
+            status = self.get_order_status(order_id)
+            if status == ORDER_READY:
+                ready = True
+                continue
+            if status == ORDER_FAILED:
+                raise OrderError(f'Заказ {order_id} отклонен')
+            if time.monotonic() + CHECK_INTERVAL > deadline:
+                raise OrderError(f'Заказ {order_id} не выполнен в течение {max_wait} секунд')
+            time.sleep(CHECK_INTERVAL)
+
+    @timed_api_call
+    def submit_import_report(self, codes_list: list, gtin: str) -> Optional[str]:
+        """
+        Отправляет отчет о вводе в оборот товаров, ввезенных из ЕАЭС
+
+        Returns:
+            str: идентификатор отчета или None
+        """
+        data = self._json(self._request('POST', IMPORT_REPORTS_PATH, json={
+            'productGroup': PRODUCT_GROUP,
+            'reason': REASON_CODE,
+            'countryCode': COUNTRY_CODE,
+            'gtin': gtin,
+            'codes': list(codes_list)
+        }))
+        if not data:
+            return None
+        report_id = data.get('reportId') or data.get('report_id')
+        return str(report_id) if report_id else None
+
+    @timed_api_call
+    def get_report_status(self, report_id: str) -> Optional[str]:
+        """
+        Returns:
+            str: 'completed', 'failed', 'processing' или None при ошибке запроса
+        """
+        data = self._json(self._request('GET', REPORT_PATH.format(report_id=report_id)))
+        if not data:
+            return None
+        return REPORT_STATUSES.get(str(data.get('status', '')).upper(), REPORT_PROCESSING)
+
+    @timed_api_call
+    def wait_for_report_completion(self, report_id: str) -> bool:
+        """
+        Ожидает обработки отчета, проверяя статус каждые CHECK_INTERVAL секунд
+
+        Returns:
+            bool: True, если отчет успешно обработан за MAX_WAIT_TIME секунд
+        """
+        deadline = time.monotonic() + MAX_WAIT_TIME
+        while True:
+            status = self.get_report_status(report_id)
+            if status == REPORT_COMPLETED:
+                return True
+            if status == REPORT_FAILED:
+                logger.error(f"Отчет {report_id} отклонен")
+                return False
+            if time.monotonic() + CHECK_INTERVAL > deadline:
+                return False
+            time.sleep(CHECK_INTERVAL)
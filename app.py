@@ -4,11 +4,25 @@
 
 import os
 import logging
-from flask import Flask, request, jsonify, render_template
+import time
+import uuid
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-from file_parser import parse_product_file, parse_codes_file, group_products_by_gtin, match_codes_to_products
+from file_parser import iter_product_lines, iter_code_lines, read_product_table, read_code_batch, group_products_by_gtin, match_codes_to_products, deduplicate_codes
 from api_client import APIClient
-from config import LOG_LEVEL, LOG_FILE
+from config import LOG_LEVEL, LOG_FILE, JOB_WORKERS, JOB_TTL, LEDGER_ENABLED, LEDGER_DB, POOL_ENABLED, CODE_POOL_DB, REPLENISH_ENABLED
+from config import RUNS_ENABLED, RUN_STORE_DB, RUN_TTL, JOB_SYNC_INTERVAL
+from config import VALIDATION_ENABLED, VALIDATION_STRICT, VALIDATION_MAX_DIAGNOSTICS
+from code_ledger import CodeLedger
+from code_pool import CodePool
+from events import EventBus, iter_sse, iter_polled_sse
+from jobs import JobManager, JOB_FAILED, FINISHED_STATUSES
+from replenisher import Replenisher
+from pipeline import ImportPipeline, build_import_result
+from run_store import RunStore, RunCheckpoint, RUN_COMPLETED, RUN_RUNNING
+from shared_state import get_shared_store
+from validator import Validator
+import metrics
 import traceback
 
 # Настройка логирования
@@ -29,6 +43,71 @@ CORS(app)
 # Инициализация API клиента
 api_client = APIClient()
 
+# Общее хранилище состояния процессов (None - приложение работает одним процессом)
+shared_store = get_shared_store()
+
+# Очередь фоновых заданий и шина событий их выполнения
+event_bus = EventBus()
+job_manager = JobManager(max_workers=JOB_WORKERS, job_ttl=JOB_TTL, events=event_bus, store=shared_store)
+
+# Заголовки потока событий: без кэширования и буферизации в прокси
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Реестр отправленных кодов
+ledger = CodeLedger(LEDGER_DB) if LEDGER_ENABLED else None
+
+# Пул заказанных, но неиспользованных кодов
+code_pool = CodePool(CODE_POOL_DB) if POOL_ENABLED else None
+
+# Контрольные точки запусков для продолжения после сбоя
+run_store = RunStore(RUN_STORE_DB) if RUNS_ENABLED else None
+if run_store is not None:
+    run_store.prune(time.time() - RUN_TTL)
+
+# Фоновое пополнение пула для часто используемых GTIN (поток запускается start_background)
+replenisher = None
+if code_pool is not None and REPLENISH_ENABLED:
+    replenisher = Replenisher(APIClient(), code_pool, store=shared_store)
+
+
+def start_background():
+    """
+    Запускает фоновые задачи процесса (пополнение пула при REPLENISH_ENABLED)
+
+    Вызывается при старте воркера (asgi.py), а не при импорте модуля: импорт
+    в тестах, скриптах и родительском процессе потоков не запускает.
+    """
+    if replenisher is not None:
+        replenisher.start()
+
+
+def stop_background():
+    """Останавливает фоновые задачи процесса; аренда пополнения освобождается для других процессов"""
+    if replenisher is not None:
+        replenisher.stop()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Количество и длительность запросов по шаблону адреса (а не по идентификаторам)"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUESTS.labels('flask', request.method, route, response.status_code).inc()
+    started = g.get('request_started')
+    if started is not None:
+        metrics.HTTP_REQUEST_SECONDS.labels('flask', request.method, route).observe(time.perf_counter() - started)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики процесса в формате Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 
 @app.route('/')
 def index():
@@ -41,12 +120,22 @@ def process_files():
     """
     Основной эндпоинт для обработки файлов и выполнения процесса ввода в оборот
     
+    Файлы разбираются сразу, а сам процесс ввода в оборот выполняется фоновым
+    заданием; состояние задания доступно по /api/jobs/<job_id>
+    
     Ожидает:
     - product_file: файл с описаниями товаров (GTIN; описание; количество)
     - codes_file: файл с неполными кодами маркировки
     
+    Файлы принимаются как текст, CSV, XLSX, а также в архивах gzip и zip
+    (см. file_parser.iter_file_lines); кодировка - UTF-8 или CP1251.
+    
+    Строки с ошибками (GTIN, структура кода, повторы - см. validator.py)
+    отбрасываются до обращения к API, а диагностика возвращается в
+    result['validation']; при VALIDATION_STRICT такие файлы отклоняются целиком.
+    
     Returns:
-        JSON с результатами обработки
+        JSON с идентификатором задания (HTTP 202)
     """
     logger.info("Начало обработки файлов")
     try:
@@ -70,21 +159,28 @@ def process_files():
         
         logger.info(f"Загружены файлы: {product_file.filename}, {codes_file.filename}")
         
-        # Чтение и парсинг файлов
+        # Потоковое чтение и парсинг файлов: загруженные данные распаковываются и декодируются
+        # построчно и собираются в колоночные ProductTable и CodeBatch (columnar.py)
+        validator = Validator() if VALIDATION_ENABLED else None
         try:
-            product_content = product_file.read().decode('utf-8')
-            codes_content = codes_file.read().decode('utf-8')
+            started = time.perf_counter()
+            if validator is not None:
+                products = validator.validate_products(iter_product_lines(product_file.stream, product_file.filename))
+                parsed = time.perf_counter()
+                codes = validator.validate_codes(iter_code_lines(codes_file.stream, codes_file.filename))
+            else:
+                products = read_product_table(product_file.stream, filename=product_file.filename)
+                parsed = time.perf_counter()
+                codes = read_code_batch(codes_file.stream, filename=codes_file.filename)
+            metrics.observe_parse('flask', 'products', len(products), parsed - started)
+            metrics.observe_parse('flask', 'codes', len(codes), time.perf_counter() - parsed)
+            logger.info(f"Распарсено товаров: {len(products)}, кодов: {len(codes)}")
         except UnicodeDecodeError as e:
             logger.error(f"Ошибка декодирования файлов: {e}")
             return jsonify({
                 'success': False,
                 'error': f'Ошибка чтения файлов: {str(e)}'
             }), 400
-        
-        try:
-            products = parse_product_file(product_content)
-            codes = parse_codes_file(codes_content)
-            logger.info(f"Распарсено товаров: {len(products)}, кодов: {len(codes)}")
         except ValueError as e:
             logger.error(f"Ошибка парсинга файлов: {e}")
             return jsonify({
@@ -92,178 +188,48 @@ def process_files():
                 'error': f'Ошибка парсинга файлов: {str(e)}'
             }), 400
         
+        validation = validator.report(VALIDATION_MAX_DIAGNOSTICS) if validator is not None else None
+        if validation is not None and not validation['valid']:
+            logger.warning(f"Отброшено ошибочных строк: товаров {validation['products_rejected']}, "
+                           f"кодов {validation['codes_rejected']} ({validation['errors']})")
+            if VALIDATION_STRICT:
+                return jsonify({
+                    'success': False,
+                    'error': 'Файлы содержат ошибочные строки',
+                    'validation': validation
+                }), 400
+        
         # Группировка товаров по GTIN
         gtin_quantities = group_products_by_gtin(products)
+        if code_pool is not None:
+            code_pool.record_demand(gtin_quantities)
         
         # Сопоставление кодов с товарами
         gtin_to_codes = match_codes_to_products(codes, products)
+        duplicates = deduplicate_codes(gtin_to_codes)
+        if duplicates:
+            logger.warning(f"Удалено повторяющихся кодов: {duplicates}")
         
-        # Определяем, сколько кодов нужно заказать для каждого GTIN
-        codes_to_order = {}
-        for gtin, quantity in gtin_quantities.items():
-            existing_codes_count = len(gtin_to_codes.get(gtin, []))
-            needed = quantity - existing_codes_count
-            if needed > 0:
-                codes_to_order[gtin] = needed
-        
-        result = {
-            'success': True,
-            'products_count': len(products),
-            'codes_count': len(codes),
-            'gtins': list(gtin_quantities.keys()),
-            'codes_to_order': codes_to_order,
-            'steps': []
-        }
-        
-        # Шаг 1: Авторизация
-        result['steps'].append({
-            'step': 1,
-            'name': 'Авторизация в API',
-            'status': 'in_progress'
-        })
-        
-        if not api_client.authenticate():
-            logger.error("Ошибка авторизации в API")
-            result['success'] = False
-            result['steps'][-1]['status'] = 'failed'
-            result['steps'][-1]['error'] = 'Ошибка авторизации. Проверьте учетные данные в .env файле'
-            return jsonify(result), 500
+        result = build_import_result(len(products), len(codes), gtin_quantities, gtin_to_codes)
+        result['duplicates_removed'] = duplicates
+        if validation is not None:
+            result['validation'] = validation
         
-        logger.info("Авторизация успешна")
-        result['steps'][-1]['status'] = 'completed'
+        job_id = uuid.uuid4().hex
+        checkpoint = RunCheckpoint(run_store, job_id) if run_store is not None else None
         
-        # Шаг 2: Заказ недостающих кодов
-        if codes_to_order:
-            result['steps'].append({
-                'step': 2,
-                'name': 'Заказ недостающих кодов маркировки',
-                'status': 'in_progress'
-            })
-            
-            logger.info(f"Заказ кодов для GTIN: {list(codes_to_order.keys())}")
-            order_id = api_client.order_codes(codes_to_order)
-            
-            if not order_id:
-                logger.error("Не удалось создать заказ кодов")
-                result['success'] = False
-                result['steps'][-1]['status'] = 'failed'
-                result['steps'][-1]['error'] = 'Ошибка заказа кодов'
-                return jsonify(result), 500
-            
-            logger.info(f"Заказ создан: {order_id}")
-            result['steps'][-1]['status'] = 'completed'
-            result['steps'][-1]['order_id'] = order_id
-            
-            # Шаг 3: Ожидание выполнения заказа
-            result['steps'].append({
-                'step': 3,
-                'name': 'Ожидание выполнения заказа',
-                'status': 'in_progress',
-                'order_id': order_id
-            })
-            
-            logger.info(f"Ожидание выполнения заказа {order_id}")
-            if not api_client.wait_for_order_completion(order_id):
-                logger.error(f"Заказ {order_id} не выполнен в течение ожидаемого времени")
-                result['success'] = False
-                result['steps'][-1]['status'] = 'failed'
-                result['steps'][-1]['error'] = 'Заказ не выполнен в течение ожидаемого времени'
-                return jsonify(result), 500
-            
-            logger.info(f"Заказ {order_id} выполнен успешно")
-            result['steps'][-1]['status'] = 'completed'
-            
-            # Шаг 4: Скачивание полных кодов
-            result['steps'].append({
-                'step': 4,
-                'name': 'Скачивание полных кодов',
-                'status': 'in_progress'
-            })
-            
-            logger.info(f"Скачивание кодов для заказа {order_id}")
-            new_codes = api_client.download_codes(order_id)
-            
-            if not new_codes:
-                logger.error(f"Не удалось скачать коды для заказа {order_id}")
-                result['success'] = False
-                result['steps'][-1]['status'] = 'failed'
-                result['steps'][-1]['error'] = 'Ошибка скачивания кодов'
-                return jsonify(result), 500
-            
-            logger.info(f"Скачано кодов: {len(new_codes)}")
-            result['steps'][-1]['status'] = 'completed'
-            result['steps'][-1]['codes_count'] = len(new_codes)
-            
-            # Добавляем новые коды к существующим
-            for gtin, needed in codes_to_order.items():
-                if gtin not in gtin_to_codes:
-                    gtin_to_codes[gtin] = []
-                # Распределяем новые коды по GTIN (упрощенная логика)
-                # В реальности нужно более точное сопоставление
-                gtin_to_codes[gtin].extend(new_codes[:needed])
-                new_codes = new_codes[needed:]
+        def run_pipeline(result, on_update):
+            return ImportPipeline(api_client, gtin_to_codes, result, on_update, ledger=ledger, pool=code_pool,
+                                  checkpoint=checkpoint).run()
         
-        # Шаг 5: Отправка отчетов о вводе в оборот
-        result['steps'].append({
-            'step': 5,
-            'name': 'Отправка отчетов о вводе в оборот',
-            'status': 'in_progress',
-            'reports': []
-        })
+        job = job_manager.submit(result, run_pipeline, job_id=job_id)
         
-        report_ids = []
-        for gtin, codes_list in gtin_to_codes.items():
-            if codes_list:
-                logger.info(f"Отправка отчета для GTIN {gtin} ({len(codes_list)} кодов)")
-                report_id = api_client.submit_import_report(codes_list, gtin)
-                if report_id:
-                    logger.info(f"Отчет создан: {report_id} для GTIN {gtin}")
-                    report_ids.append({
-                        'gtin': gtin,
-                        'report_id': report_id,
-                        'codes_count': len(codes_list)
-                    })
-                else:
-                    logger.warning(f"Не удалось создать отчет для GTIN {gtin}")
-        
-        if not report_ids:
-            logger.error("Не удалось отправить ни одного отчета")
-            result['success'] = False
-            result['steps'][-1]['status'] = 'failed'
-            result['steps'][-1]['error'] = 'Не удалось отправить отчеты'
-            return jsonify(result), 500
-        
-        result['steps'][-1]['reports'] = report_ids
-        result['steps'][-1]['status'] = 'completed'
-        
-        # Шаг 6: Отслеживание статуса отчетов
-        result['steps'].append({
-            'step': 6,
-            'name': 'Отслеживание статуса отчетов',
-            'status': 'in_progress'
-        })
-        
-        logger.info("Ожидание завершения отчетов")
-        all_reports_completed = True
-        for report_info in report_ids:
-            logger.info(f"Проверка статуса отчета {report_info['report_id']}")
-            if not api_client.wait_for_report_completion(report_info['report_id']):
-                logger.warning(f"Отчет {report_info['report_id']} не завершен")
-                all_reports_completed = False
-                break
-        
-        if all_reports_completed:
-            logger.info("Все отчеты успешно завершены")
-            result['steps'][-1]['status'] = 'completed'
-        else:
-            logger.warning("Некоторые отчеты не завершены")
-            result['steps'][-1]['status'] = 'warning'
-            result['steps'][-1]['message'] = 'Некоторые отчеты не завершены'
-        
-        result['final_status'] = 'completed' if all_reports_completed else 'partial'
-        
-        logger.info("Обработка завершена успешно")
-        return jsonify(result), 200
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
         
     except Exception as e:
         error_trace = traceback.format_exc()
@@ -275,5 +241,256 @@ def process_files():
         }), 500
 
 
+@app.route('/api/validate', methods=['POST'])
+def validate_files():
+    """
+    Проверка файлов без запуска процесса ввода в оборот
+    
+    Ожидает product_file и/или codes_file (как /api/process). Если передан
+    файл товаров, GTIN кодов сверяются с ним.
+    
+    Returns:
+        JSON: valid, количество строк и отброшенных строк по файлам, ошибки
+        по видам и diagnostics - ошибочные строки (file, line, error, message, value)
+    """
+    product_file = request.files.get('product_file')
+    codes_file = request.files.get('codes_file')
+    if not product_file and not codes_file:
+        return jsonify({
+            'success': False,
+            'error': 'Необходимо загрузить файл товаров и/или файл кодов'
+        }), 400
+    
+    validator = Validator()
+    try:
+        if product_file:
+            validator.validate_products(iter_product_lines(product_file.stream, product_file.filename))
+        if codes_file:
+            validator.validate_codes(iter_code_lines(codes_file.stream, codes_file.filename))
+    except ValueError as e:
+        # UnicodeDecodeError - тоже ValueError; архив поврежден - ValueError из file_parser
+        return jsonify({
+            'success': False,
+            'error': f'Ошибка чтения файлов: {str(e)}'
+        }), 400
+    
+    return jsonify({'success': True, **validator.report(VALIDATION_MAX_DIAGNOSTICS)}), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Состояние задания обработки
+    
+    Returns:
+        JSON: job_id, status (queued, running, completed, failed), время и
+        result - результат обработки со списком steps. Задание, выполнявшееся
+        остановленным процессом, возвращается со статусом failed, признаком
+        interrupted и resume_url
+    """
+    snapshot = job_manager.lookup(job_id)
+    if snapshot is not None:
+        if snapshot.get('interrupted') and run_store is not None:
+            snapshot['resume_url'] = f'/api/jobs/{job_id}/resume'
+        return jsonify(snapshot), 200
+    
+    # Задание из сохраненного запуска (например, прерванного перезапуском сервера)
+    run = run_store.get(job_id) if run_store is not None else None
+    if run is None:
+        return jsonify({
+            'success': False,
+            'error': 'Задание не найдено'
+        }), 404
+    
+    interrupted = run['status'] == RUN_RUNNING
+    return jsonify({
+        'job_id': job_id,
+        'status': JOB_FAILED if interrupted else run['status'],
+        'created_at': run['created_at'],
+        'started_at': None,
+        'finished_at': run['updated_at'],
+        'error': 'Задание прервано, его можно продолжить' if interrupted else None,
+        'result': run['result'],
+        'resume_url': f'/api/jobs/{job_id}/resume'
+    }), 200
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Поток событий задания (text/event-stream)
+    
+    Первое событие snapshot - текущее состояние задания (как GET /api/jobs/<job_id>),
+    затем по мере выполнения: step (смена статуса шага), progress (счетчики шага),
+    report (создан отчет по GTIN), report_status (новый статус отчета) и job
+    (смена статуса задания; последнее событие содержит итоговый результат).
+    В каждом событии есть ts и elapsed - время от начала задания в секундах.
+    
+    Встроенный сервер Flask держит поток на каждое соединение; для большого
+    числа наблюдателей используйте asgi.py, где соединения не занимают потоков.
+    Задание другого процесса отслеживается опросом общего хранилища.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    job = job_manager.get(job_id)
+    if job is not None:
+        events = iter_sse(event_bus, job, last_event_id)
+    elif job_manager.lookup(job_id) is not None:
+        events = iter_polled_sse(lambda: job_manager.lookup(job_id), FINISHED_STATUSES, last_event_id,
+                                 JOB_SYNC_INTERVAL)
+    else:
+        return jsonify({
+            'success': False,
+            'error': 'Задание не найдено'
+        }), 404
+    
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """
+    Продолжает прерванный или завершившийся ошибкой запуск с последней контрольной точки
+    
+    Выполненные шаги пропускаются: созданный заказ не повторяется, скачанные
+    коды и отправленные отчеты берутся из контрольной точки, статус
+    отправленных отчетов продолжает отслеживаться.
+    
+    Returns:
+        JSON с идентификатором задания (HTTP 202)
+    """
+    if run_store is None:
+        return jsonify({
+            'success': False,
+            'error': 'Контрольные точки запусков отключены (RUNS_ENABLED)'
+        }), 404
+    
+    run = run_store.get(job_id)
+    if run is None:
+        return jsonify({
+            'success': False,
+            'error': 'Запуск не найден'
+        }), 404
+    if run['status'] == RUN_COMPLETED:
+        return jsonify({
+            'success': False,
+            'error': 'Запуск уже успешно завершен'
+        }), 409
+    
+    checkpoint = RunCheckpoint(run_store, job_id)
+    
+    def run_pipeline(result, on_update):
+        return ImportPipeline(api_client, {}, result, on_update, ledger=ledger, pool=code_pool,
+                              checkpoint=checkpoint, resume=True).run()
+    
+    try:
+        job = job_manager.submit(run['result'], run_pipeline, job_id=job_id)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+    
+    logger.info(f"Продолжение запуска {job_id}")
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}'
+    }), 202
+
+
+@app.route('/api/runs', methods=['GET'])
+def list_runs():
+    """Сохраненные запуски (status: running - выполняется или прерван, completed, failed)"""
+    if run_store is None:
+        return jsonify({
+            'success': False,
+            'error': 'Контрольные точки запусков отключены (RUNS_ENABLED)'
+        }), 404
+    status = request.args.get('status')
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({'success': True, 'runs': run_store.list_runs(status, limit)}), 200
+
+
+def _ledger_unavailable():
+    return jsonify({
+        'success': False,
+        'error': 'Реестр кодов отключен (LEDGER_ENABLED)'
+    }), 404
+
+
+@app.route('/api/pool', methods=['GET'])
+def pool_status():
+    """Количество неиспользованных кодов в пуле по GTIN"""
+    if code_pool is None:
+        return jsonify({
+            'success': False,
+            'error': 'Пул кодов отключен (POOL_ENABLED)'
+        }), 404
+    return jsonify({'success': True, 'available': code_pool.available()}), 200
+
+
+@app.route('/api/pool/replenishment', methods=['GET'])
+def pool_replenishment():
+    """
+    Состояние фонового пополнения пула
+    
+    Returns:
+        JSON: время последней проверки, последний заказ, ошибка и для каждого
+        популярного GTIN остаток, порог пополнения (low_water) и целевой объем
+    """
+    if replenisher is None:
+        return jsonify({
+            'success': False,
+            'error': 'Фоновое пополнение пула отключено (REPLENISH_ENABLED)'
+        }), 404
+    return jsonify({'success': True, **replenisher.state()}), 200
+
+
+@app.route('/api/ledger/stats', methods=['GET'])
+def ledger_stats():
+    """Количество кодов в реестре по GTIN и статусам"""
+    if ledger is None:
+        return _ledger_unavailable()
+    return jsonify({'success': True, 'stats': ledger.stats()}), 200
+
+
+@app.route('/api/ledger/codes', methods=['GET'])
+def ledger_codes():
+    """
+    Список кодов реестра
+    
+    Параметры запроса: gtin, status (submitted, accepted, rejected), limit
+    """
+    if ledger is None:
+        return _ledger_unavailable()
+    limit = min(request.args.get('limit', 100, type=int), 10000)
+    codes = ledger.list_codes(request.args.get('gtin'), request.args.get('status'), limit)
+    return jsonify({'success': True, 'codes': codes}), 200
+
+
+@app.route('/api/ledger/lookup', methods=['POST'])
+def ledger_lookup():
+    """
+    Пакетная проверка кодов по реестру
+    
+    Принимает JSON: {"codes": ["code1", "code2", ...]}
+    Возвращает JSON: {"statuses": {"code1": "accepted", ...}} только для найденных кодов
+    """
+    if ledger is None:
+        return _ledger_unavailable()
+    data = request.get_json(silent=True) or {}
+    codes = data.get('codes')
+    if not isinstance(codes, list):
+        return jsonify({
+            'success': False,
+            'error': 'Ожидается JSON со списком codes'
+        }), 400
+    return jsonify({'success': True, 'statuses': ledger.lookup(codes)}), 200
+
+
 if __name__ == '__main__':
+    # С debug=True приложение обслуживает дочерний процесс перезагрузчика (WERKZEUG_RUN_MAIN)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background()
     app.run(debug=True, host='0.0.0.0', port=5000)
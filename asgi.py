@@ -0,0 +1,68 @@
+"""
+ASGI-точка входа Flask-приложения
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Поток событий заданий /api/jobs/<job_id>/events обслуживается асинхронно:
+соединение наблюдателя держит только цикл событий, а не поток, поэтому сотни
+операторов могут следить за долгими импортами, не занимая пул потоков.
+Остальные запросы передаются Flask-приложению (WSGI) в пуле потоков через
+a2wsgi: тело запроса читается Flask по мере поступления, а не накапливается в
+памяти целиком, поэтому потоковый разбор загруженных файлов сохраняется.
+
+Несколько процессов (uvicorn asgi:app --workers 4) используют общее хранилище
+заданий (shared_state): поток событий задания другого процесса формируется
+опросом хранилища. Фоновые задачи процесса запускаются при старте воркера
+(lifespan), а не при импорте.
+"""
+
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app, event_bus, job_manager, start_background, stop_background, SSE_HEADERS
+from config import JOB_SYNC_INTERVAL
+from events import aiter_sse, aiter_polled_sse
+from jobs import FINISHED_STATUSES
+import metrics
+
+
+async def job_events(request: Request):
+    """Поток событий задания (см. app.job_events)"""
+    job_id = request.path_params['job_id']
+    last_event_id = request.headers.get('last-event-id')
+    job = job_manager.get(job_id)
+    if job is not None:
+        events = aiter_sse(event_bus, job, last_event_id)
+    elif await run_in_threadpool(job_manager.lookup, job_id) is not None:
+        events = aiter_polled_sse(lambda: job_manager.lookup(job_id), FINISHED_STATUSES, last_event_id,
+                                  JOB_SYNC_INTERVAL)
+    else:
+        return JSONResponse({'success': False, 'error': 'Задание не найдено'}, status_code=404)
+
+    return StreamingResponse(events, media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """
+    Запуск воркера: сохранение метрик процесса для /metrics других воркеров
+    (METRICS_MULTIPROC_DIR) и фоновые задачи приложения (app.start_background)
+    """
+    metrics.start_multiprocess()
+    start_background()
+    try:
+        yield
+    finally:
+        stop_background()
+
+
+app = Starlette(routes=[
+    Route('/api/jobs/{job_id}/events', job_events),
+    Mount('/', app=WSGIMiddleware(flask_app)),
+], lifespan=lifespan)
@@ -0,0 +1,381 @@
+"""
+Пакетная обработка партий из командной строки, без загрузки файлов через веб-формы
+
+Партия - пара файлов: описания товаров (GTIN; описание; количество) и коды
+маркировки. Разбор файлов, сопоставление кодов с товарами и преобразование
+кодов РФ -> РБ выполняются в пуле процессов (по партии на процесс). Ввод в
+оборот через API (--import) выполняется в пуле потоков основного процесса:
+все партии используют один клиент API, то есть общий пул соединений, общий
+токен и общий ограничитель частоты и одновременности запросов (rate_limit,
+API_CONCURRENCY_MAX), поэтому нагрузка на API не растет с числом партий.
+
+    python batch.py --input shipments/ --output out/
+    python batch.py --manifest shipments.csv --output out/ --import --jobs 8
+
+Каталог --input просматривается рекурсивно; партию образуют файлы
+<имя>_products.txt и <имя>_codes.txt (разделитель перед products/codes -
+«_», «.» или «-») или файлы products.txt и codes.txt в одном подкаталоге
+(имя партии - путь подкаталога). Вместо .txt допускаются .csv, .xlsx и
+.zip, а также любые из них, сжатые gzip (.gz) - см. file_parser.iter_file_lines. Манифест - текстовый файл со строками
+«имя; файл товаров; файл кодов» (относительные пути - от каталога манифеста).
+
+Строки с ошибками отбрасываются предварительной проверкой (validator.py) до
+обращения к API; с --strict партия с такими строками не обрабатывается.
+
+Для каждой партии в <output>/<имя>/ сохраняются converted_codes.txt,
+result.json и, если были ошибочные строки, diagnostics.csv; сводка по всем
+партиям - в <output>/summary.json. Код возврата 1, если хотя бы одна партия
+завершилась ошибкой.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from api_client import APIClient
+from code_ledger import CodeLedger
+from code_pool import CodePool
+from config import JOB_WORKERS, LOG_LEVEL, VALIDATION_ENABLED, VALIDATION_STRICT, VALIDATION_MAX_DIAGNOSTICS
+from config import LEDGER_ENABLED, LEDGER_DB, POOL_ENABLED, CODE_POOL_DB, RUNS_ENABLED, RUN_STORE_DB
+from file_parser import iter_product_lines, iter_code_lines, read_product_table, read_code_batch, group_products_by_gtin, match_codes_to_products, deduplicate_codes
+from pipeline import ImportPipeline, build_import_result
+from run_store import RunStore, RunCheckpoint
+from validator import Validator
+import gs1
+
+logger = logging.getLogger(__name__)
+
+# Статусы партии в сводке
+SHIPMENT_CONVERTED = 'converted'
+SHIPMENT_COMPLETED = 'completed'
+SHIPMENT_FAILED = 'failed'
+
+# Файл партии: <имя>_products.txt, <имя>.codes.csv.gz, products.xlsx, codes.zip ...
+_PAIR_FILE = re.compile(r'^(?:(?P<name>.+?)[._-])?(?P<kind>products?|codes)\.(?:txt|csv|xlsx|zip)(?:\.gz)?$',
+                        re.IGNORECASE)
+
+CONVERTED_FILE = 'converted_codes.txt'
+RESULT_FILE = 'result.json'
+DIAGNOSTICS_FILE = 'diagnostics.csv'
+SUMMARY_FILE = 'summary.json'
+
+
+class Shipment:
+    """Партия: имя и пути к файлу товаров и файлу кодов"""
+
+    def __init__(self, name: str, products_path: str, codes_path: str):
+        self.name = name
+        self.products_path = products_path
+        self.codes_path = codes_path
+
+
+def discover_shipments(directory: str) -> List[Shipment]:
+    """
+    Находит пары файлов партий в каталоге (рекурсивно)
+
+    Raises:
+        ValueError: для партии найден только один файл из пары
+    """
+    pairs: Dict[str, Dict[str, str]] = {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        relative = os.path.relpath(root, directory)
+        for filename in sorted(files):
+            match = _PAIR_FILE.match(filename)
+            if not match:
+                continue
+            name = match.group('name')
+            if relative != '.':
+                name = os.path.join(relative, name) if name else relative
+            elif not name:
+                name = os.path.basename(os.path.abspath(directory))
+            kind = 'codes' if match.group('kind').lower() == 'codes' else 'products'
+            pairs.setdefault(name, {})[kind] = os.path.join(root, filename)
+
+    shipments = []
+    for name, files in sorted(pairs.items()):
+        if 'products' not in files or 'codes' not in files:
+            found = next(iter(files.values()))
+            raise ValueError(f"Партия {name}: не найдена пара для файла {found}")
+        shipments.append(Shipment(name, files['products'], files['codes']))
+    return shipments
+
+
+def read_manifest(path: str) -> List[Shipment]:
+    """
+    Читает манифест: строки «имя; файл товаров; файл кодов», пустые строки и строки с # пропускаются
+
+    Raises:
+        ValueError: неверный формат строки
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    shipments = []
+    with open(path, encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.split(';')]
+            if len(parts) != 3 or not all(parts):
+                raise ValueError(f"Неверный формат строки {line_num} манифеста: ожидается 'имя; файл товаров; файл кодов'")
+            name, products_path, codes_path = parts
+            shipments.append(Shipment(name, os.path.join(base, products_path), os.path.join(base, codes_path)))
+    return shipments
+
+
+def prepare_shipment(shipment: Shipment, output_dir: str, keep_codes: bool,
+                     validate: bool = VALIDATION_ENABLED, strict: bool = VALIDATION_STRICT) -> dict:
+    """
+    Разбирает файлы партии, сопоставляет коды с товарами и сохраняет преобразованные коды
+
+    Выполняется в отдельном процессе; ошибки разбора возвращаются в результате.
+
+    Args:
+        keep_codes: вернуть коды по GTIN (нужны для ввода в оборот)
+        validate: отбросить ошибочные строки (validator.py), диагностика - в diagnostics.csv
+        strict: партия с ошибочными строками завершается ошибкой без преобразования
+
+    Returns:
+        dict: name, status, output_dir, seconds, result (build_import_result)
+            или error; с keep_codes - также gtin_to_codes и gtin_quantities
+    """
+    started = time.perf_counter()
+    shipment_dir = os.path.join(output_dir, shipment.name)
+    summary = {'name': shipment.name, 'output_dir': shipment_dir}
+    validator = Validator(max_diagnostics=None) if validate else None
+    try:
+        with open(shipment.products_path, 'rb') as f:
+            products = (validator.validate_products(iter_product_lines(f, shipment.products_path)) if validator
+                        else read_product_table(f, filename=shipment.products_path))
+        with open(shipment.codes_path, 'rb') as f:
+            codes = (validator.validate_codes(iter_code_lines(f, shipment.codes_path)) if validator
+                     else read_code_batch(f, filename=shipment.codes_path))
+
+        if validator is not None:
+            summary['validation'] = validator.report(VALIDATION_MAX_DIAGNOSTICS)
+            if not validator.valid:
+                os.makedirs(shipment_dir, exist_ok=True)
+                validator.write_diagnostics(os.path.join(shipment_dir, DIAGNOSTICS_FILE))
+            if strict and not validator.valid:
+                summary.update(status=SHIPMENT_FAILED, error=f"Файлы содержат ошибочные строки: "
+                                                             f"{sum(validator.rejected.values())}, см. {DIAGNOSTICS_FILE}")
+                summary['seconds'] = round(time.perf_counter() - started, 3)
+                return summary
+
+        gtin_quantities = group_products_by_gtin(products)
+        gtin_to_codes = match_codes_to_products(codes, products)
+        duplicates = deduplicate_codes(gtin_to_codes)
+        result = build_import_result(len(products), len(codes), gtin_quantities, gtin_to_codes)
+        result['duplicates_removed'] = duplicates
+
+        os.makedirs(shipment_dir, exist_ok=True)
+        # Буфер CodeBatch - строки кодов, завершенные '\n': преобразуется блоками без разбора на str
+        with open(os.path.join(shipment_dir, CONVERTED_FILE), 'wb') as f:
+            for block in codes.iter_buffers():
+                f.write(gs1.convert_buffer(block))
+
+        summary.update(status=SHIPMENT_CONVERTED, result=result)
+        if keep_codes:
+            summary.update(gtin_to_codes=gtin_to_codes, gtin_quantities=gtin_quantities)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        summary.update(status=SHIPMENT_FAILED, error=f'Ошибка чтения файлов: {e}')
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+class BatchImporter:
+    """
+    Ввод в оборот подготовленных партий через API в пуле потоков
+
+    Все партии используют один APIClient; реестр, пул кодов и контрольные
+    точки подключаются так же, как в app.py (по настройкам LEDGER_ENABLED,
+    POOL_ENABLED, RUNS_ENABLED).
+    """
+
+    def __init__(self, max_workers: int):
+        self.api_client = APIClient()
+        self.ledger = CodeLedger(LEDGER_DB) if LEDGER_ENABLED else None
+        self.pool = CodePool(CODE_POOL_DB) if POOL_ENABLED else None
+        self.run_store = RunStore(RUN_STORE_DB) if RUNS_ENABLED else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-import')
+
+    def submit(self, prepared: dict):
+        return self._executor.submit(self._run, prepared)
+
+    def _run(self, prepared: dict) -> dict:
+        started = time.perf_counter()
+        gtin_to_codes = prepared.pop('gtin_to_codes')
+        gtin_quantities = prepared.pop('gtin_quantities')
+        if self.pool is not None:
+            self.pool.record_demand(gtin_quantities)
+        run_id = uuid.uuid4().hex
+        checkpoint = RunCheckpoint(self.run_store, run_id) if self.run_store is not None else None
+        try:
+            result = ImportPipeline(self.api_client, gtin_to_codes, prepared['result'], ledger=self.ledger,
+                                    pool=self.pool, checkpoint=checkpoint).run()
+            status = SHIPMENT_COMPLETED if result.get('success') else SHIPMENT_FAILED
+            prepared.update(status=status, result=result)
+            if not result.get('success'):
+                prepared['error'] = result.get('error')
+        except Exception as e:
+            logger.error(f"Партия {prepared['name']}: критическая ошибка\n{traceback.format_exc()}")
+            prepared.update(status=SHIPMENT_FAILED, error=str(e))
+        if checkpoint is not None:
+            prepared['run_id'] = run_id
+        prepared['seconds'] = round(prepared['seconds'] + time.perf_counter() - started, 3)
+        return prepared
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def _write_result(shipment: dict):
+    os.makedirs(shipment['output_dir'], exist_ok=True)
+    with open(os.path.join(shipment['output_dir'], RESULT_FILE), 'w', encoding='utf-8') as f:
+        json.dump(shipment, f, ensure_ascii=False, indent=2)
+
+
+def _summary_entry(shipment: dict) -> dict:
+    result = shipment.get('result') or {}
+    return {
+        'name': shipment['name'],
+        'status': shipment['status'],
+        'products_count': result.get('products_count'),
+        'codes_count': result.get('codes_count'),
+        'rejected_lines': sum((shipment.get('validation') or {}).get(key, 0)
+                              for key in ('products_rejected', 'codes_rejected')),
+        'seconds': shipment['seconds'],
+        'error': shipment.get('error'),
+        'run_id': shipment.get('run_id'),
+        'output_dir': shipment['output_dir'],
+    }
+
+
+def _failed_shipment(shipment: Shipment, output_dir: str, error: Exception, started: float) -> dict:
+    """Запись партии, обработка которой прервана исключением (в том числе аварией процесса пула)"""
+    return {
+        'name': shipment.name,
+        'output_dir': os.path.join(output_dir, shipment.name),
+        'status': SHIPMENT_FAILED,
+        'error': str(error) or type(error).__name__,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_batch(shipments: List[Shipment], output_dir: str, workers: Optional[int] = None,
+              import_codes: bool = False, jobs: int = JOB_WORKERS, strict: bool = VALIDATION_STRICT) -> dict:
+    """
+    Обрабатывает партии: разбор и преобразование в пуле процессов, затем
+    (import_codes) ввод в оборот - каждая партия передается на ввод в оборот,
+    как только подготовлена, не дожидаясь остальных
+
+    Returns:
+        dict: сводка - количество партий по статусам, время и записи партий
+    """
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    importer = BatchImporter(jobs) if import_codes else None
+    finished = []
+
+    def finish(shipment: dict):
+        try:
+            _write_result(shipment)
+        except OSError as e:
+            logger.error(f"Партия {shipment['name']}: не удалось сохранить {RESULT_FILE}: {e}")
+            shipment.update(status=SHIPMENT_FAILED, error=str(e))
+        finished.append(shipment)
+        if shipment['status'] == SHIPMENT_FAILED:
+            logger.warning(f"Партия {shipment['name']}: {shipment.get('error')}")
+        else:
+            logger.info(f"Партия {shipment['name']}: {shipment['status']}, {shipment['seconds']} с")
+
+    def finish_import(future, shipment: Shipment):
+        try:
+            prepared = future.result()
+        except Exception as e:
+            logger.error(f"Партия {shipment.name}: сбой ввода в оборот\n{traceback.format_exc()}")
+            prepared = _failed_shipment(shipment, output_dir, e, started)
+        finish(prepared)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(prepare_shipment, shipment, output_dir, import_codes,
+                                       VALIDATION_ENABLED, strict): shipment
+                       for shipment in shipments}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shipment = futures[future]
+                    try:
+                        prepared = future.result()
+                    except Exception as e:
+                        # BrokenProcessPool и прочие сбои процесса не должны терять сводку по остальным партиям
+                        logger.error(f"Партия {shipment.name}: сбой подготовки\n{traceback.format_exc()}")
+                        finish(_failed_shipment(shipment, output_dir, e, started))
+                        continue
+                    if importer is not None and prepared['status'] != SHIPMENT_FAILED:
+                        # Подготовленная партия сразу уходит на ввод в оборот
+                        importer.submit(prepared).add_done_callback(
+                            lambda f, shipment=shipment: finish_import(f, shipment))
+                    else:
+                        finish(prepared)
+    finally:
+        if importer is not None:
+            importer.shutdown()
+
+    statuses: Dict[str, int] = {}
+    for shipment in finished:
+        statuses[shipment['status']] = statuses.get(shipment['status'], 0) + 1
+    summary = {
+        'shipments_count': len(shipments),
+        'statuses': statuses,
+        'seconds': round(time.perf_counter() - started, 3),
+        'shipments': [_summary_entry(shipment) for shipment in sorted(finished, key=lambda item: item['name'])],
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетная обработка партий (пар файлов товаров и кодов)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='каталог с парами файлов партий')
+    source.add_argument('--manifest', help='файл со строками «имя; файл товаров; файл кодов»')
+    parser.add_argument('--output', required=True, help='каталог для результатов партий и summary.json')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='процессов для разбора и преобразования (по умолчанию - число CPU)')
+    parser.add_argument('--import', dest='import_codes', action='store_true',
+                        help='ввести коды в оборот через API')
+    parser.add_argument('--jobs', type=int, default=JOB_WORKERS,
+                        help='партий, одновременно вводимых в оборот (запросы к API ограничены общим лимитом)')
+    parser.add_argument('--strict', action='store_true', default=VALIDATION_STRICT,
+                        help='не обрабатывать партии с ошибочными строками')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, LOG_LEVEL),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        shipments = discover_shipments(args.input) if args.input else read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not shipments:
+        parser.error('партии не найдены')
+
+    summary = run_batch(shipments, args.output, args.workers, args.import_codes, args.jobs, args.strict)
+    statuses = ', '.join(f'{status}: {count}' for status, count in sorted(summary['statuses'].items()))
+    print(f"Партий: {summary['shipments_count']} ({statuses}) за {summary['seconds']} с")
+    print(f"Сводка: {os.path.join(args.output, SUMMARY_FILE)}")
+    return 1 if summary['statuses'].get(SHIPMENT_FAILED) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
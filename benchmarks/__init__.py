@@ -0,0 +1,5 @@
+"""
+Нагрузочные замеры горячих участков: разбор файлов, сопоставление, преобразование кодов
+
+    python -m benchmarks.run --sizes 1000,10000,100000
+"""
@@ -0,0 +1,118 @@
+"""
+Генераторы синтетических файлов товаров и кодов маркировки
+
+Коды повторяют реальные формы GS1 DataMatrix: короткие неполные коды
+01<GTIN>21<серийный номер>, полные коды с ключом и криптохвостом через символ
+GS или его текстовую запись [GS], коды с коротким криптохвостом (AI 93) и коды
+с идентификатором символики ]d2 от сканера. GTIN имеют верную контрольную
+цифру, серийные номера начинаются с цифры страны РФ. Генерация
+детерминирована: одинаковые размер и seed дают одинаковые файлы.
+"""
+
+import os
+import random
+import string
+import tempfile
+from typing import Iterator, List, Tuple
+
+from gs1 import GS, GS_TEXT, RF_COUNTRY_DIGIT, SYMBOLOGY_ID, gtin_check_digit
+
+# Каталог, в котором сохраняются сгенерированные файлы (повторно используются между запусками)
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'datamark-benchmarks')
+
+# Среднее количество кодов на один GTIN (строку файла товаров)
+CODES_PER_GTIN = 20
+
+# Формы кодов и их доля в файле
+CODE_SHAPES = (
+    ('short', 0.55),        # 01<GTIN>21<серийный номер>
+    ('gs', 0.25),           # ...<GS>91<ключ><GS>92<криптохвост>
+    ('gs_text', 0.10),      # ...[GS]91<ключ>[GS]92<криптохвост>
+    ('crypto93', 0.07),     # ...<GS>93<короткий криптохвост>
+    ('symbology', 0.03),    # ]d2 в начале кода
+)
+
+SERIAL_LENGTH = 13
+# Символы серийного номера из набора GS1 (без ';' и пробелов)
+_SERIAL_ALPHABET = string.ascii_letters + string.digits + '!"%&\'()*+,-./:<=>?_'
+_CRYPTO_ALPHABET = string.ascii_letters + string.digits + '+/='
+
+_DESCRIPTIONS = (
+    'БОСОНОЖКИ Женские Pons Quintana арт. {art} SONIA цвет. ЧЕРНЫЙ р.{size}',
+    'ТУФЛИ Мужские Ecco арт. {art} HELSINKI цвет. КОРИЧНЕВЫЙ р.{size}',
+    'КРОССОВКИ Детские Kapika арт. {art} цвет. СИНИЙ р.{size}',
+    'САПОГИ Женские Marco Tozzi арт. {art} цвет. БЕЖЕВЫЙ р.{size}',
+)
+
+
+def make_gtins(count: int, rng: random.Random) -> List[str]:
+    """count различных GTIN-14 с префиксом 0 и кодом страны 46"""
+    gtins = set()
+    while len(gtins) < count:
+        body = '046' + ''.join(rng.choices(string.digits, k=10))
+        gtins.add(body + gtin_check_digit(body))
+    return sorted(gtins)
+
+
+def make_code(gtin: str, shape: str, rng: random.Random) -> str:
+    serial = RF_COUNTRY_DIGIT + ''.join(rng.choices(_SERIAL_ALPHABET, k=SERIAL_LENGTH - 1))
+    code = f'01{gtin}21{serial}'
+    if shape == 'short':
+        return code
+    if shape == 'crypto93':
+        return f"{code}{GS}93{''.join(rng.choices(_CRYPTO_ALPHABET, k=4))}"
+    key = ''.join(rng.choices(_CRYPTO_ALPHABET, k=4))
+    crypto = ''.join(rng.choices(_CRYPTO_ALPHABET, k=44))
+    separator = GS_TEXT if shape == 'gs_text' else GS
+    code = f'{code}{separator}91{key}{separator}92{crypto}'
+    return SYMBOLOGY_ID + code if shape == 'symbology' else code
+
+
+def plan_quantities(codes_count: int, rng: random.Random) -> List[Tuple[str, int]]:
+    """Распределяет codes_count кодов по GTIN: [(gtin, количество)]"""
+    gtins = make_gtins(max(1, codes_count // CODES_PER_GTIN), rng)
+    base, extra = divmod(codes_count, len(gtins))
+    return [(gtin, base + (1 if i < extra else 0)) for i, gtin in enumerate(gtins)]
+
+
+def iter_product_lines(quantities: List[Tuple[str, int]], rng: random.Random) -> Iterator[str]:
+    """Строки файла товаров: GTIN; описание; количество"""
+    for gtin, quantity in quantities:
+        description = rng.choice(_DESCRIPTIONS).format(art=rng.randint(10000000, 99999999),
+                                                       size=rng.choice(('36', '37', '37.5', '38', '39', '40')))
+        yield f'{gtin}; {description}; {quantity}'
+
+
+def iter_code_lines(quantities: List[Tuple[str, int]], rng: random.Random) -> Iterator[str]:
+    """Коды маркировки в перемешанном по GTIN порядке, как в выгрузке сканера"""
+    shapes = [shape for shape, _ in CODE_SHAPES]
+    weights = [weight for _, weight in CODE_SHAPES]
+    gtins = [gtin for gtin, quantity in quantities for _ in range(quantity)]
+    rng.shuffle(gtins)
+    for gtin, shape in zip(gtins, rng.choices(shapes, weights, k=len(gtins))):
+        yield make_code(gtin, shape, rng)
+
+
+def dataset_paths(codes_count: int, seed: int = 0, data_dir: str = DATA_DIR) -> Tuple[str, str]:
+    """
+    Файлы товаров и кодов для codes_count кодов; создаются при первом обращении
+
+    Returns:
+        tuple: (путь к файлу товаров, путь к файлу кодов)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    products_path = os.path.join(data_dir, f'products_{codes_count}_{seed}.txt')
+    codes_path = os.path.join(data_dir, f'codes_{codes_count}_{seed}.txt')
+    if os.path.exists(products_path) and os.path.exists(codes_path):
+        return products_path, codes_path
+
+    rng = random.Random(seed)
+    quantities = plan_quantities(codes_count, rng)
+    for path, lines in ((products_path, iter_product_lines(quantities, rng)),
+                        (codes_path, iter_code_lines(quantities, rng))):
+        partial = path + '.part'
+        with open(partial, 'w', encoding='utf-8', newline='\n') as f:
+            for line in lines:
+                f.write(line + '\n')
+        os.replace(partial, path)
+    return products_path, codes_path
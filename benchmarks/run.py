@@ -0,0 +1,370 @@
+"""
+Запуск замеров и сравнение с базовыми результатами
+
+    python -m benchmarks.run                                   # 1k, 10k, 100k кодов
+    python -m benchmarks.run --sizes 1000,1000000,10000000 --only parse_codes_file,convert_rf_to_rb
+    python -m benchmarks.run --output benchmarks/baseline.json # сохранить базовые результаты
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.25
+
+Для каждого замера и размера выводится лучшее время из --repeat прогонов,
+пропускная способность (элементов в секунду) и пиковый объем памяти Python
+(tracemalloc, отдельным прогоном). Эндпоинты main.py вызываются внутри процесса
+через httpx.ASGITransport, без сети. При сравнении замер считается регрессией,
+если пропускная способность упала или пиковая память выросла больше чем на
+threshold; в этом случае код возврата 1.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.generators import dataset_paths
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = '1000,10000,100000'
+
+# Эндпоинты получают все коды одним JSON или файлом, поэтому по умолчанию ограничены
+ENDPOINT_MAX_CODES = 1000000
+
+# Рост пиковой памяти меньше этого значения не считается регрессией (шум аллокатора)
+MEMORY_NOISE_BYTES = 1024 * 1024
+
+
+class Dataset:
+    """Сгенерированные файлы и их разобранное содержимое (загружается по требованию)"""
+
+    def __init__(self, codes_count: int, seed: int):
+        self.codes_count = codes_count
+        self.products_path, self.codes_path = dataset_paths(codes_count, seed)
+        self._cache = {}
+
+    def _load(self, key: str, loader: Callable):
+        if key not in self._cache:
+            self._cache[key] = loader()
+        return self._cache[key]
+
+    @property
+    def products_bytes(self) -> bytes:
+        return self._load('products_bytes', lambda: _read(self.products_path))
+
+    @property
+    def codes_bytes(self) -> bytes:
+        return self._load('codes_bytes', lambda: _read(self.codes_path))
+
+    @property
+    def products_text(self) -> str:
+        return self._load('products_text', lambda: self.products_bytes.decode('utf-8'))
+
+    @property
+    def codes_text(self) -> str:
+        return self._load('codes_text', lambda: self.codes_bytes.decode('utf-8'))
+
+    @property
+    def products(self) -> list:
+        from file_parser import parse_product_file
+        return self._load('products', lambda: parse_product_file(self.products_text))
+
+    @property
+    def codes(self) -> list:
+        from file_parser import parse_codes_file
+        return self._load('codes', lambda: parse_codes_file(self.codes_text))
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# Замеры: функция получает Dataset и возвращает (замеряемый вызов, количество элементов)
+
+def bench_parse_product_file(data: Dataset):
+    from file_parser import parse_product_file
+    text = data.products_text
+    return lambda: parse_product_file(text), len(data.products)
+
+
+def bench_parse_codes_file(data: Dataset):
+    from file_parser import parse_codes_file
+    text = data.codes_text
+    return lambda: parse_codes_file(text), data.codes_count
+
+
+def bench_read_product_table(data: Dataset):
+    from file_parser import read_product_table
+    content = data.products_bytes
+    return lambda: read_product_table(io.BytesIO(content)), len(data.products)
+
+
+def bench_read_code_batch(data: Dataset):
+    from file_parser import read_code_batch
+    content = data.codes_bytes
+    return lambda: read_code_batch(io.BytesIO(content)).groups(), data.codes_count
+
+
+def bench_read_code_batch_gzip(data: Dataset):
+    import gzip
+    from file_parser import read_code_batch
+    content = gzip.compress(data.codes_bytes, 6)
+    return lambda: read_code_batch(io.BytesIO(content), filename='codes.txt.gz').groups(), data.codes_count
+
+
+def bench_group_products_by_gtin(data: Dataset):
+    from file_parser import group_products_by_gtin
+    products = data.products
+    return lambda: group_products_by_gtin(products), len(products)
+
+
+def bench_match_codes_to_products(data: Dataset):
+    from file_parser import match_codes_to_products
+    codes, products = data.codes, data.products
+    return lambda: match_codes_to_products(codes, products), len(codes)
+
+
+def bench_validate_files(data: Dataset):
+    from validator import validate_files
+    products_lines, codes_lines = data.products_text.split('\n'), data.codes_text.split('\n')
+    return lambda: validate_files(products_lines, codes_lines), data.codes_count
+
+
+def bench_convert_rf_to_rb(data: Dataset):
+    from main import convert_rf_to_rb
+    codes = data.codes
+    return lambda: [convert_rf_to_rb(code) for code in codes], len(codes)
+
+
+def _asgi_request(method: str, url: str, **kwargs) -> Callable[[], int]:
+    """Запрос к main.app внутри процесса; вызов возвращает размер тела ответа"""
+    import httpx
+    from main import app
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code != 200:
+                raise RuntimeError(f'{method} {url}: {response.status_code} - {response.text[:500]}')
+            return len(response.content)
+
+    return lambda: asyncio.run(send())
+
+
+def bench_convert_endpoint(data: Dataset):
+    payload = {'codes': data.codes}
+    return _asgi_request('POST', '/convert', json=payload), len(data.codes)
+
+
+def _use_result_cache(enabled: bool):
+    """Замеры преобразования выполняются без кэша результатов, замеры кэша - с ним"""
+    from main import result_cache
+    result_cache.enabled = enabled
+
+
+def bench_convert_download_endpoint(data: Dataset, cached: bool = False):
+    _use_result_cache(cached)
+    payload = {'codes': data.codes}
+    return _asgi_request('POST', '/convert/download', json=payload), len(data.codes)
+
+
+def bench_process_endpoint(data: Dataset, cached: bool = False):
+    _use_result_cache(cached)
+    files = {
+        'product_file': ('products.txt', data.products_bytes, 'text/plain'),
+        'codes_file': ('codes.txt', data.codes_bytes, 'text/plain'),
+    }
+    return _asgi_request('POST', '/process', files=files), data.codes_count
+
+
+# Повторный запрос с теми же данными: первый прогон (замер памяти) заполняет кэш
+
+def bench_convert_download_cached(data: Dataset):
+    return bench_convert_download_endpoint(data, cached=True)
+
+
+def bench_process_cached(data: Dataset):
+    return bench_process_endpoint(data, cached=True)
+
+
+# {название: (функция замера, это эндпоинт)}
+BENCHMARKS: Dict[str, Tuple[Callable, bool]] = {
+    'parse_product_file': (bench_parse_product_file, False),
+    'parse_codes_file': (bench_parse_codes_file, False),
+    'read_product_table': (bench_read_product_table, False),
+    'read_code_batch': (bench_read_code_batch, False),
+    'read_code_batch (gzip)': (bench_read_code_batch_gzip, False),
+    'group_products_by_gtin': (bench_group_products_by_gtin, False),
+    'match_codes_to_products': (bench_match_codes_to_products, False),
+    'validate_files': (bench_validate_files, False),
+    'convert_rf_to_rb': (bench_convert_rf_to_rb, False),
+    'POST /convert': (bench_convert_endpoint, True),
+    'POST /convert/download': (bench_convert_download_endpoint, True),
+    'POST /process': (bench_process_endpoint, True),
+    'POST /convert/download (cached)': (bench_convert_download_cached, True),
+    'POST /process (cached)': (bench_process_cached, True),
+}
+
+
+def measure(call: Callable, items: int, repeat: int, memory: bool = True) -> dict:
+    """
+    Лучшее время из repeat прогонов и пиковая память отдельного прогона
+
+    Прогон с замером памяти выполняется первым и заодно прогревает импорты и кэши.
+    """
+    result = {'items': items}
+    if memory:
+        tracemalloc.start()
+        try:
+            call()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    result['seconds'] = round(best, 6)
+    result['items_per_sec'] = round(items / best, 1) if best > 0 else None
+    return result
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Сравнивает результаты с базовыми
+
+    Returns:
+        list: описания регрессий
+    """
+    regressions = []
+    for name, sizes in results['results'].items():
+        for size, current in sizes.items():
+            base = baseline.get('results', {}).get(name, {}).get(size)
+            if not base:
+                continue
+            if base.get('items_per_sec') and current.get('items_per_sec') is not None:
+                ratio = current['items_per_sec'] / base['items_per_sec']
+                current['baseline_ratio'] = round(ratio, 3)
+                if ratio < 1 - threshold:
+                    regressions.append(f'{name} [{size}]: пропускная способность {ratio:.0%} от базовой')
+            if base.get('peak_bytes') and current.get('peak_bytes') is not None:
+                growth = current['peak_bytes'] - base['peak_bytes']
+                if growth > MEMORY_NOISE_BYTES and current['peak_bytes'] > base['peak_bytes'] * (1 + threshold):
+                    regressions.append(f"{name} [{size}]: пиковая память {current['peak_bytes'] / base['peak_bytes']:.0%} "
+                                       f"от базовой")
+    return regressions
+
+
+def format_table(results: dict) -> str:
+    lines = [f"{'Замер':<32} {'Кодов':>9} {'Элементов':>10} {'Время, с':>10} {'Элем./с':>12} {'Память, МБ':>11} {'К базе':>7}"]
+    for name, sizes in results['results'].items():
+        for size, r in sizes.items():
+            peak = f"{r['peak_bytes'] / 1024 / 1024:.1f}" if 'peak_bytes' in r else '-'
+            ratio = f"{r['baseline_ratio']:.2f}" if 'baseline_ratio' in r else '-'
+            lines.append(f"{name:<32} {size:>9} {r['items']:>10} {r['seconds']:>10.4f} "
+                         f"{r['items_per_sec'] or 0:>12.0f} {peak:>11} {ratio:>7}")
+    return '\n'.join(lines)
+
+
+@contextmanager
+def temporary_artifacts():
+    """Результаты POST /process сохраняются во временный каталог (ARTIFACTS_DIR), удаляемый после замеров"""
+    directory = tempfile.mkdtemp(prefix='datamark-benchmark-artifacts-')
+    previous = os.environ.get('ARTIFACTS_DIR')
+    os.environ['ARTIFACTS_DIR'] = directory
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('ARTIFACTS_DIR', None)
+        else:
+            os.environ['ARTIFACTS_DIR'] = previous
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(sizes: List[int], names: List[str], repeat: int, seed: int, memory: bool,
+        endpoint_max_codes: int, log: Optional[Callable[[str], None]] = None) -> dict:
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': {},
+    }
+    for size in sizes:
+        data = Dataset(size, seed)
+        for name in names:
+            bench, is_endpoint = BENCHMARKS[name]
+            if is_endpoint and size > endpoint_max_codes:
+                continue
+            call, items = bench(data)
+            result = measure(call, items, repeat, memory)
+            results['results'].setdefault(name, {})[str(size)] = result
+            if log:
+                log(f"{name} [{size}]: {result['seconds']:.4f} с, {result['items_per_sec'] or 0:.0f} элем./с")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замеры разбора, сопоставления и преобразования кодов')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='количество кодов через запятую (до 10000000)')
+    parser.add_argument('--only', help='замеры через запятую: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3, help='количество прогонов каждого замера')
+    parser.add_argument('--seed', type=int, default=0, help='начальное значение генератора данных')
+    parser.add_argument('--no-memory', action='store_true', help='не замерять пиковую память')
+    parser.add_argument('--endpoint-max-codes', type=int, default=ENDPOINT_MAX_CODES,
+                        help='максимальный размер данных для замеров эндпоинтов')
+    parser.add_argument('--output', help='сохранить результаты в JSON (например, benchmarks/baseline.json)')
+    parser.add_argument('--compare', help='сравнить с базовыми результатами из JSON')
+    parser.add_argument('--threshold', type=float, default=0.25, help='допустимое ухудшение при сравнении (доля)')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(',')]
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # main.py подключает static и templates относительно текущего каталога
+    os.chdir(REPO_ROOT)
+    with temporary_artifacts():
+        results = run(sizes, names, args.repeat, args.seed, not args.no_memory, args.endpoint_max_codes,
+                      log=lambda message: print(message, file=sys.stderr))
+
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    print(format_table(results))
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'Результаты сохранены: {output_path}')
+    if regressions:
+        print('Регрессии:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+"""
+Локальный реестр отправленных кодов маркировки (SQLite)
+
+Для каждого кода хранится GTIN, статус (submitted, accepted, rejected) и
+идентификатор отчета. Перед отправкой отчетов реестр отсеивает коды, уже
+введенные в оборот, чтобы повторная загрузка того же файла не приводила к
+отклоненным отчетам.
+
+Запуск из командной строки:
+    python code_ledger.py stats
+    python code_ledger.py get <код>
+    python code_ledger.py list [--gtin GTIN] [--status STATUS] [--limit N]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from config import LEDGER_DB
+
+logger = logging.getLogger(__name__)
+
+STATUS_SUBMITTED = 'submitted'
+STATUS_ACCEPTED = 'accepted'
+STATUS_REJECTED = 'rejected'
+STATUSES = (STATUS_SUBMITTED, STATUS_ACCEPTED, STATUS_REJECTED)
+
+# Коды с этими статусами не отправляются повторно
+SKIP_STATUSES = (STATUS_ACCEPTED,)
+
+# Максимальное количество параметров в одном SQL-запросе
+_QUERY_CHUNK = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS codes (
+    code TEXT PRIMARY KEY,
+    gtin TEXT NOT NULL,
+    status TEXT NOT NULL,
+    report_id TEXT,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS codes_gtin_status ON codes (gtin, status);
+CREATE INDEX IF NOT EXISTS codes_report_id ON codes (report_id);
+"""
+
+
+def _chunks(items: List[str], size: int = _QUERY_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CodeLedger:
+    """Реестр кодов; потокобезопасен (отдельное соединение SQLite на поток)"""
+
+    def __init__(self, path: str = LEDGER_DB):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, codes: Iterable[str]) -> Dict[str, str]:
+        """
+        Пакетная проверка наличия кодов в реестре
+
+        Returns:
+            dict: {code: status} для найденных кодов
+        """
+        codes = list(codes)
+        found = {}
+        conn = self._connect()
+        for chunk in _chunks(codes):
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT code, status FROM codes WHERE code IN ({placeholders})', chunk)
+            found.update(rows)
+        return found
+
+    def filter_new(self, gtin_to_codes: dict) -> dict:
+        """
+        Исключает из {gtin: [коды]} коды, которые уже приняты (SKIP_STATUSES)
+
+        Returns:
+            dict: {gtin: количество исключенных кодов} для GTIN, где были исключения
+        """
+        skipped = {}
+        for gtin, codes_list in gtin_to_codes.items():
+            known = self.lookup(codes_list)
+            if not known:
+                continue
+            kept = [code for code in codes_list if known.get(code) not in SKIP_STATUSES]
+            if len(kept) != len(codes_list):
+                skipped[gtin] = len(codes_list) - len(kept)
+                gtin_to_codes[gtin] = kept
+        if skipped:
+            logger.info(f"Исключены коды, уже введенные в оборот: {skipped}")
+        return skipped
+
+    def mark_submitted(self, codes: Iterable[str], gtin: str, report_id: str):
+        """Записывает коды отправленного отчета со статусом submitted"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO codes (code, gtin, status, report_id, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(code) DO UPDATE SET gtin = excluded.gtin, status = excluded.status, '
+                'report_id = excluded.report_id, updated_at = excluded.updated_at',
+                ((code, gtin, STATUS_SUBMITTED, report_id, now) for code in codes)
+            )
+
+    def set_report_status(self, report_id: str, status: str) -> int:
+        """
+        Обновляет статус всех кодов отчета
+
+        Returns:
+            int: количество обновленных кодов
+        """
+        if status not in STATUSES:
+            raise ValueError(f"Неизвестный статус: {status}")
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute('UPDATE codes SET status = ?, updated_at = ? WHERE report_id = ?',
+                                  (status, time.time(), report_id))
+        return cursor.rowcount
+
+    def get(self, code: str) -> Optional[dict]:
+        row = self._connect().execute(
+            'SELECT code, gtin, status, report_id, updated_at FROM codes WHERE code = ?', (code,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('code', 'gtin', 'status', 'report_id', 'updated_at'), row))
+
+    def list_codes(self, gtin: Optional[str] = None, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        query = 'SELECT code, gtin, status, report_id, updated_at FROM codes'
+        conditions, params = [], []
+        if gtin:
+            conditions.append('gtin = ?')
+            params.append(gtin)
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY updated_at DESC LIMIT ?'
+        params.append(limit)
+        rows = self._connect().execute(query, params)
+        return [dict(zip(('code', 'gtin', 'status', 'report_id', 'updated_at'), row)) for row in rows]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns:
+            dict: {gtin: {status: количество кодов}}
+        """
+        result = {}
+        rows = self._connect().execute('SELECT gtin, status, COUNT(*) FROM codes GROUP BY gtin, status')
+        for gtin, status, count in rows:
+            result.setdefault(gtin, {})[status] = count
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Реестр отправленных кодов маркировки')
+    parser.add_argument('--db', default=LEDGER_DB, help='путь к базе реестра')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='количество кодов по GTIN и статусам')
+    get_parser = commands.add_parser('get', help='статус кода')
+    get_parser.add_argument('code')
+    list_parser = commands.add_parser('list', help='список кодов')
+    list_parser.add_argument('--gtin')
+    list_parser.add_argument('--status', choices=STATUSES)
+    list_parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    ledger = CodeLedger(args.db)
+    if args.command == 'stats':
+        result = ledger.stats()
+    elif args.command == 'get':
+        result = ledger.get(args.code)
+        if result is None:
+            print('Код не найден в реестре', file=sys.stderr)
+            return 1
+    else:
+        result = ledger.list_codes(args.gtin, args.status, args.limit)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Пул заказанных, но неиспользованных кодов маркировки (SQLite)
+
+Излишки выполненных заказов сохраняются по GTIN и расходуются при следующих
+запусках до того, как заказывать новые коды: это экономит заказы и время
+ожидания их выполнения. Там же хранится история потребности по GTIN, по
+которой фоновое пополнение (replenisher) заранее заказывает коды.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from config import CODE_POOL_DB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pool (
+    code TEXT PRIMARY KEY,
+    gtin TEXT NOT NULL,
+    order_id TEXT,
+    added_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pool_gtin_added ON pool (gtin, added_at);
+CREATE TABLE IF NOT EXISTS demand (
+    gtin TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS demand_recorded ON demand (recorded_at);
+"""
+
+
+class CodePool:
+    """Пул кодов по GTIN; потокобезопасен (отдельное соединение SQLite на поток)"""
+
+    def __init__(self, path: str = CODE_POOL_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, gtin: str, codes: Iterable[str], order_id: Optional[str] = None) -> int:
+        """
+        Добавляет коды GTIN в пул (повторно добавленные коды игнорируются)
+
+        Returns:
+            int: количество добавленных кодов
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO pool (code, gtin, order_id, added_at) VALUES (?, ?, ?, ?)',
+                ((code, gtin, order_id, now) for code in codes)
+            )
+            added = conn.total_changes - before
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if added:
+            logger.info(f"В пул добавлено {added} кодов для GTIN {gtin}")
+        return added
+
+    def take(self, gtin: str, count: int) -> List[str]:
+        """
+        Забирает из пула до count кодов GTIN (сначала самые старые)
+
+        Returns:
+            list: выданные коды (может быть меньше count)
+        """
+        if count <= 0:
+            return []
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            codes = [row[0] for row in conn.execute(
+                'SELECT code FROM pool WHERE gtin = ? ORDER BY added_at LIMIT ?', (gtin, count)
+            )]
+            conn.executemany('DELETE FROM pool WHERE code = ?', ((code,) for code in codes))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return codes
+
+    def allocate(self, needs: Dict[str, int]) -> Dict[str, List[str]]:
+        """
+        Выдает коды из пула под потребность {gtin: количество}
+
+        Returns:
+            dict: {gtin: [выданные коды]} только для GTIN, по которым что-то выдано
+        """
+        allocated = {}
+        for gtin, count in needs.items():
+            codes = self.take(gtin, count)
+            if codes:
+                allocated[gtin] = codes
+        if allocated:
+            logger.info(f"Из пула выдано кодов: { {gtin: len(codes) for gtin, codes in allocated.items()} }")
+        return allocated
+
+    def available(self, gtin: Optional[str] = None) -> Dict[str, int]:
+        """
+        Returns:
+            dict: {gtin: количество кодов в пуле}
+        """
+        conn = self._connect()
+        if gtin:
+            rows = conn.execute('SELECT gtin, COUNT(*) FROM pool WHERE gtin = ? GROUP BY gtin', (gtin,))
+        else:
+            rows = conn.execute('SELECT gtin, COUNT(*) FROM pool GROUP BY gtin')
+        return dict(rows)
+
+    def record_demand(self, gtin_quantities: Dict[str, int]):
+        """Записывает потребность запуска {gtin: количество} (вывод group_products_by_gtin)"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT INTO demand (gtin, quantity, recorded_at) VALUES (?, ?, ?)',
+                             ((gtin, quantity, now) for gtin, quantity in gtin_quantities.items()))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def demand(self, since: float) -> Dict[str, Dict[str, float]]:
+        """
+        Статистика потребности с момента since
+
+        Returns:
+            dict: {gtin: {'runs': количество запусков, 'total': сумма, 'average': среднее за запуск}}
+        """
+        rows = self._connect().execute(
+            'SELECT gtin, COUNT(*), SUM(quantity) FROM demand WHERE recorded_at >= ? GROUP BY gtin', (since,)
+        )
+        return {gtin: {'runs': runs, 'total': total, 'average': total / runs} for gtin, runs, total in rows}
+
+    def prune_demand(self, before: float):
+        """Удаляет историю потребности старше before"""
+        conn = self._connect()
+        conn.execute('DELETE FROM demand WHERE recorded_at < ?', (before,))
@@ -0,0 +1,283 @@
+"""
+Компактное колоночное представление товаров и кодов маркировки
+
+Список словарей на строку файла товаров и словарь списков строк для кодов
+требуют отдельного объекта Python на каждое значение: миллион кодов в списках
+занимает около сотни мегабайт и миллионы выделений памяти. Здесь данные
+хранятся колонками:
+
+- ProductTable - GTIN (интернированные строки), описания и количества (array);
+- CodeBatch - все коды в одном буфере (строки UTF-8, завершенные '\\n'),
+  смещения строк в array и позиции кодов каждого GTIN в array;
+- CodeView - последовательность кодов части пакета (одного GTIN, среза) без
+  копирования: срез представления - тоже представление, а строка str
+  создается только при обращении к коду.
+
+    batch = CodeBatch.from_codes(codes)
+    gtin_to_codes = batch.groups()        # {gtin: CodeView}
+    taken, rest = gtin_to_codes[gtin].split(10)
+"""
+
+import sys
+from array import array
+from collections.abc import Sequence
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gs1 import AI_GTIN, extract_gtin
+
+# Количество кодов, декодируемых за один раз при последовательном чтении
+DECODE_CHUNK = 4096
+
+# Наибольшее смещение, которое помещается в array('I')
+_MAX_UINT32 = 0xFFFFFFFF
+
+
+def code_gtin(code: str) -> Optional[str]:
+    """GTIN (AI 01) кода или None; стандартная позиция проверяется без разбора кода"""
+    if code.startswith(AI_GTIN) and len(code) >= 16 and code[2:16].isdigit():
+        return code[2:16]
+    return extract_gtin(code)
+
+
+class ProductTable:
+    """
+    Товары из файла товаров по колонкам: gtins, descriptions, quantities
+
+    Итерация и индексация возвращают словари {'gtin', 'description', 'quantity'},
+    как file_parser.parse_product_file, поэтому таблица заменяет список товаров.
+    """
+
+    __slots__ = ('gtins', 'descriptions', 'quantities')
+
+    def __init__(self):
+        self.gtins: List[str] = []
+        self.descriptions: List[str] = []
+        self.quantities = array('q')
+
+    @classmethod
+    def from_products(cls, products: Iterable[dict]) -> 'ProductTable':
+        table = cls()
+        for product in products:
+            table.append(product['gtin'], product['description'], product['quantity'])
+        return table
+
+    def append(self, gtin: str, description: str, quantity: int):
+        self.gtins.append(sys.intern(gtin))
+        self.descriptions.append(description)
+        self.quantities.append(quantity)
+
+    def __len__(self) -> int:
+        return len(self.gtins)
+
+    def __getitem__(self, index: int) -> dict:
+        return {'gtin': self.gtins[index], 'description': self.descriptions[index],
+                'quantity': self.quantities[index]}
+
+    def __iter__(self) -> Iterator[dict]:
+        for gtin, description, quantity in zip(self.gtins, self.descriptions, self.quantities):
+            yield {'gtin': gtin, 'description': description, 'quantity': quantity}
+
+    def gtin_set(self) -> set:
+        return set(self.gtins)
+
+    def quantities_by_gtin(self) -> Dict[str, int]:
+        """{gtin: суммарное количество} без создания словарей строк"""
+        grouped: Dict[str, int] = {}
+        for gtin, quantity in zip(self.gtins, self.quantities):
+            grouped[gtin] = grouped.get(gtin, 0) + quantity
+        return grouped
+
+
+class CodeBatch:
+    """
+    Коды маркировки в одном буфере
+
+    buffer - строки кодов в UTF-8, каждая завершается '\\n' (в исходном порядке,
+    то есть буфер - готовое содержимое файла кодов); offsets - смещения начала
+    строк и конца буфера (len(offsets) == len(batch) + 1); positions - номера
+    кодов каждого GTIN в порядке добавления. Коды без GTIN хранятся в буфере,
+    но не входят ни в одну группу.
+
+    Пакет заполняется через append/extend, после чего из него получают
+    представления (view, groups); коды после добавления не изменяются.
+    """
+
+    __slots__ = ('buffer', 'offsets', 'positions')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('I', (0,))
+        self.positions: Dict[str, array] = {}
+
+    @classmethod
+    def from_codes(cls, codes: Iterable[str]) -> 'CodeBatch':
+        """Пакет из кодов; GTIN извлекается из каждого кода"""
+        batch = cls()
+        batch.extend(codes)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[str]:
+        return self._iter_range(0, len(self))
+
+    def __repr__(self) -> str:
+        return f'CodeBatch({len(self)} кодов, {len(self.positions)} GTIN, {len(self.buffer)} байт)'
+
+    def _grow_offsets(self):
+        # Буфер больше 4 ГБ - смещения переводятся в 64-битные
+        if self.offsets.typecode == 'I':
+            self.offsets = array('Q', self.offsets)
+
+    def _index(self, gtin: str, index: int):
+        positions = self.positions.get(gtin)
+        if positions is None:
+            positions = self.positions[sys.intern(gtin)] = array('I')
+        positions.append(index)
+
+    def append(self, code: str, gtin: Optional[str] = None):
+        """
+        Добавляет код
+
+        Args:
+            gtin: GTIN кода, если уже известен (иначе извлекается из кода)
+        """
+        index = len(self)
+        self.buffer += (code + '\n').encode('utf-8')
+        try:
+            self.offsets.append(len(self.buffer))
+        except OverflowError:
+            self._grow_offsets()
+            self.offsets.append(len(self.buffer))
+        if gtin is None:
+            gtin = code_gtin(code)
+        if gtin:
+            self._index(gtin, index)
+
+    def extend(self, codes: Iterable[str], gtins: Optional[Iterable[Optional[str]]] = None):
+        """
+        Добавляет коды одним кодированием и одним расширением массива смещений
+
+        Args:
+            codes: коды (последовательность или итерируемый набор)
+            gtins: GTIN кодов в том же порядке, если уже известны
+        """
+        if not isinstance(codes, (list, tuple)):
+            codes = list(codes)
+        if not codes:
+            return
+        start = len(self)
+        data = ('\n'.join(codes) + '\n').encode('utf-8')
+        if len(data) == sum(map(len, codes)) + len(codes):
+            # Только ASCII: длина строки в байтах равна длине str
+            lengths = map(len, codes)
+        else:
+            lengths = (len(code.encode('utf-8')) for code in codes)
+        ends = accumulate(map((1).__add__, lengths), initial=len(self.buffer))
+        next(ends)
+        self.buffer += data
+        if len(self.buffer) > _MAX_UINT32:
+            self._grow_offsets()
+        self.offsets.extend(ends)
+
+        positions = self.positions
+        if gtins is None:
+            gtins = map(code_gtin, codes)
+        for index, gtin in enumerate(gtins, start):
+            group = positions.get(gtin)
+            if group is None:
+                if not gtin:
+                    continue
+                group = positions[sys.intern(gtin)] = array('I')
+            group.append(index)
+
+    def code(self, index: int) -> str:
+        offsets = self.offsets
+        return self.buffer[offsets[index]:offsets[index + 1] - 1].decode('utf-8')
+
+    def _iter_range(self, start: int, stop: int) -> Iterator[str]:
+        """Коды с номерами start..stop-1; декодируются блоками по DECODE_CHUNK"""
+        offsets = self.offsets
+        buffer = self.buffer
+        for chunk_start in range(start, stop, DECODE_CHUNK):
+            chunk_stop = min(stop, chunk_start + DECODE_CHUNK)
+            block = buffer[offsets[chunk_start]:offsets[chunk_stop] - 1].decode('utf-8')
+            yield from block.split('\n')
+
+    def iter_buffers(self, codes_per_block: int = DECODE_CHUNK * 16) -> Iterator[bytes]:
+        """Содержимое буфера блоками из целых строк (для gs1.convert_buffer и записи в файл)"""
+        offsets = self.offsets
+        for start in range(0, len(self), codes_per_block):
+            stop = min(len(self), start + codes_per_block)
+            yield bytes(self.buffer[offsets[start]:offsets[stop]])
+
+    def view(self) -> 'CodeView':
+        """Все коды пакета в исходном порядке"""
+        return CodeView(self, None, 0, len(self))
+
+    def groups(self) -> Dict[str, 'CodeView']:
+        """{gtin: CodeView} - коды по GTIN, как gs1.split_by_gtin, но без копирования кодов"""
+        return {gtin: CodeView(self, positions, 0, len(positions)) for gtin, positions in self.positions.items()}
+
+    @property
+    def nbytes(self) -> int:
+        """Объем данных пакета в байтах (буфер и массивы)"""
+        return (len(self.buffer) + self.offsets.itemsize * len(self.offsets)
+                + sum(positions.itemsize * len(positions) for positions in self.positions.values()))
+
+
+class CodeView(Sequence):
+    """
+    Последовательность кодов CodeBatch без копирования
+
+    Коды берутся из пакета по номерам positions[start:stop] (positions=None -
+    подряд идущие номера start..stop-1). Срез с шагом 1 и split возвращают
+    новые представления над теми же данными; сравнение со списком - по
+    содержимому, поэтому представление заменяет список кодов GTIN.
+    """
+
+    __slots__ = ('batch', 'positions', 'start', 'stop')
+
+    def __init__(self, batch: CodeBatch, positions: Optional[array], start: int, stop: int):
+        self.batch = batch
+        self.positions = positions
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return CodeView(self.batch, self.positions, self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('индекс кода вне представления')
+        index += self.start
+        return self.batch.code(index if self.positions is None else self.positions[index])
+
+    def __iter__(self) -> Iterator[str]:
+        if self.positions is None:
+            return self.batch._iter_range(self.start, self.stop)
+        code = self.batch.code
+        return (code(index) for index in self.positions[self.start:self.stop])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CodeView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f'CodeView({len(self)} кодов)'
+
+    def split(self, count: int) -> Tuple['CodeView', 'CodeView']:
+        """(первые count кодов, остальные) - выдача части кодов без копирования"""
+        return self[:count], self[count:]
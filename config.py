@@ -12,6 +12,21 @@ API_BASE_URL = os.getenv('API_BASE_URL', 'https://sandbox-api.datamark.by')
 API_USERNAME = os.getenv('API_USERNAME')
 API_PASSWORD = os.getenv('API_PASSWORD')
 
+# HTTP-клиент
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))  # Максимум соединений keep-alive к API
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))  # Таймаут запроса к API в секундах
+HTTP_CONNECT_RETRIES = int(os.getenv('HTTP_CONNECT_RETRIES', '2'))  # Повторы при ошибке соединения
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', '60'))  # Обновлять токен за N секунд до истечения
+
+# Ограничение нагрузки на API (общее для всех заданий процесса)
+API_RATE_LIMITS = os.getenv('API_RATE_LIMITS', 'auth=1,order=2,report=5,download=10,status=20')  # Запросов в секунду по классам (0 - без ограничения)
+API_CONCURRENCY_INITIAL = int(os.getenv('API_CONCURRENCY_INITIAL', '4'))  # Начальный лимит одновременных запросов
+API_CONCURRENCY_MIN = int(os.getenv('API_CONCURRENCY_MIN', '1'))  # Минимальный лимит одновременных запросов
+API_CONCURRENCY_MAX = int(os.getenv('API_CONCURRENCY_MAX', '16'))  # Максимальный лимит одновременных запросов
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', '3'))  # Повторы запроса после ответа 429 или 5xx
+API_RETRY_BACKOFF = float(os.getenv('API_RETRY_BACKOFF', '1'))  # Начальная пауза перед повтором без Retry-After в секундах
+API_RETRY_MAX_DELAY = float(os.getenv('API_RETRY_MAX_DELAY', '60'))  # Максимальная пауза перед повтором в секундах
+
 # Константы из документации API
 PRODUCT_GROUP = "shoes"  # Таблица 4.2.1.2
 CODE_TYPE = 20  # п. В.2.1.1
@@ -21,6 +36,57 @@ REASON_CODE = "import"  # Таблица 4.3.5
 # Настройки приложения
 MAX_WAIT_TIME = int(os.getenv('MAX_WAIT_TIME', '300'))  # Максимальное время ожидания в секундах
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '5'))  # Интервал проверки статуса в секундах
+CODES_PAGE_SIZE = int(os.getenv('CODES_PAGE_SIZE', '1000'))  # Размер страницы при скачивании кодов заказа
+UNPACKED_MAX_BYTES = int(os.getenv('UNPACKED_MAX_BYTES', str(1024 ** 3)))  # Предельный размер распакованных данных gzip (защита от gzip-бомб)
+
+# Отправка и отслеживание отчетов
+REPORT_CONCURRENCY = int(os.getenv('REPORT_CONCURRENCY', '8'))  # Количество одновременных запросов к API по отчетам
+POLL_INITIAL_DELAY = float(os.getenv('POLL_INITIAL_DELAY', '1'))  # Начальная пауза между опросами статуса в секундах
+POLL_MAX_DELAY = float(os.getenv('POLL_MAX_DELAY', '30'))  # Максимальная пауза между опросами статуса в секундах
+REPORT_BATCH_MAX_CODES = int(os.getenv('REPORT_BATCH_MAX_CODES', '10000'))  # Максимум кодов в одном отчете
+REPORT_BATCH_MAX_BYTES = int(os.getenv('REPORT_BATCH_MAX_BYTES', '5000000'))  # Максимальный размер отчета в байтах
+
+# Предварительная проверка файлов (validator.py)
+VALIDATION_ENABLED = os.getenv('VALIDATION_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # Отбрасывать ошибочные строки до обращения к API
+VALIDATION_STRICT = os.getenv('VALIDATION_STRICT', 'false').lower() in ('1', 'true', 'yes')  # Отклонять файлы целиком, если есть ошибочные строки
+VALIDATION_MAX_DIAGNOSTICS = int(os.getenv('VALIDATION_MAX_DIAGNOSTICS', '1000'))  # Сколько ошибочных строк включать в ответ
+
+# Фоновые задания
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))  # Количество одновременно выполняемых заданий
+JOB_TTL = int(os.getenv('JOB_TTL', '3600'))  # Время хранения завершенных заданий в секундах
+
+# Локальное хранилище
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+LEDGER_ENABLED = os.getenv('LEDGER_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # Реестр отправленных кодов
+LEDGER_DB = os.getenv('LEDGER_DB', os.path.join(DATA_DIR, 'ledger.sqlite3'))
+POOL_ENABLED = os.getenv('POOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # Пул неиспользованных кодов
+CODE_POOL_DB = os.getenv('CODE_POOL_DB', os.path.join(DATA_DIR, 'code_pool.sqlite3'))
+RUNS_ENABLED = os.getenv('RUNS_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # Контрольные точки запусков
+RUN_STORE_DB = os.getenv('RUN_STORE_DB', os.path.join(DATA_DIR, 'runs.sqlite3'))
+RUN_TTL = int(os.getenv('RUN_TTL', '604800'))  # Время хранения запусков в секундах (7 дней)
+
+# Общее состояние нескольких процессов (воркеров или контейнеров)
+SHARED_STORE = os.getenv('SHARED_STORE', 'sqlite')  # Хранилище заданий, токенов и аренд: sqlite или none (только память процесса)
+SHARED_STORE_DB = os.getenv('SHARED_STORE_DB', os.path.join(DATA_DIR, 'shared.sqlite3'))
+JOB_SYNC_INTERVAL = float(os.getenv('JOB_SYNC_INTERVAL', '0.5'))  # Как часто состояние задания сохраняется в общее хранилище, с
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', '5'))  # Период отметки активности выполняемых заданий, с
+ARTIFACTS_DIR = os.getenv('ARTIFACTS_DIR', os.path.join(DATA_DIR, 'artifacts'))  # Результаты преобразования для скачивания
+ARTIFACT_TTL = int(os.getenv('ARTIFACT_TTL', '86400'))  # Время хранения результата с последнего обращения в секундах
+ARTIFACTS_MAX_BYTES = int(os.getenv('ARTIFACTS_MAX_BYTES', str(2 * 1024 ** 3)))  # Предельный размер каталога результатов
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # Повторные запросы с теми же данными - из кэша
+
+# Фоновое пополнение пула кодов для часто используемых GTIN
+REPLENISH_ENABLED = os.getenv('REPLENISH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+REPLENISH_INTERVAL = int(os.getenv('REPLENISH_INTERVAL', '300'))  # Период проверки остатков в секундах
+REPLENISH_WINDOW_DAYS = float(os.getenv('REPLENISH_WINDOW_DAYS', '7'))  # За сколько дней учитывается потребность
+REPLENISH_MIN_RUNS = int(os.getenv('REPLENISH_MIN_RUNS', '2'))  # Минимум запусков, чтобы GTIN считался популярным
+REPLENISH_LOW_WATER_RUNS = float(os.getenv('REPLENISH_LOW_WATER_RUNS', '1'))  # Порог пополнения в средних запусках
+REPLENISH_TARGET_RUNS = float(os.getenv('REPLENISH_TARGET_RUNS', '3'))  # Целевой остаток в средних запусках
+REPLENISH_MAX_ORDER = int(os.getenv('REPLENISH_MAX_ORDER', '10000'))  # Максимум кодов одного GTIN в заказе
+
+# Метрики Prometheus нескольких процессов (uvicorn --workers)
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')  # Каталог значений процессов (локальный для контейнера); пусто - метрики только своего процесса
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))  # Период сохранения значений процесса в каталог, с
 
 # Логирование
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -0,0 +1,71 @@
+"""
+Общие фикстуры тестов: локальная замена API Datamark (fake_datamark.py)
+
+Настройки сервера задаются маркером теста:
+    @pytest.mark.fake_datamark(rate_limit=5, report_delay=0.2)
+    def test_...(fake_server, api_client):
+        ...
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# test_api.py - скрипт ручной проверки запущенного сервера, а не набор тестов
+collect_ignore = ['test_api.py']
+
+# Настройки сервера по умолчанию: быстрые заказы и отчеты, воспроизводимые коды
+FAKE_SERVER_DEFAULTS = {'order_delay': 0.2, 'report_delay': 0.1, 'seed': 1}
+
+# Локальное хранилище тестов (config.py): базы SQLite, результаты и журнал - во временном
+# каталоге, а не в ./data рабочей копии. Переменные задаются до импорта модулей приложения
+_DATA_DIR = tempfile.mkdtemp(prefix='datamark-tests-')
+_DATA_ENV = {
+    'DATA_DIR': _DATA_DIR,
+    'LEDGER_DB': os.path.join(_DATA_DIR, 'ledger.sqlite3'),
+    'CODE_POOL_DB': os.path.join(_DATA_DIR, 'code_pool.sqlite3'),
+    'RUN_STORE_DB': os.path.join(_DATA_DIR, 'runs.sqlite3'),
+    'SHARED_STORE_DB': os.path.join(_DATA_DIR, 'shared.sqlite3'),
+    'ARTIFACTS_DIR': os.path.join(_DATA_DIR, 'artifacts'),
+    'LOG_FILE': os.path.join(_DATA_DIR, 'app.log'),
+}
+os.environ.update(_DATA_ENV)
+
+from api_client import APIClient  # noqa: E402
+from fake_datamark import run_fake_server  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'fake_datamark(**options): настройки сервера fake_server (см. FakeDatamarkState)')
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def data_dir():
+    """Каталог локального хранилища тестов (DATA_DIR и пути *_DB из config.py)"""
+    import config
+    for name, value in _DATA_ENV.items():
+        assert getattr(config, name) == value, f'{name} указывает не на каталог тестов'
+    return _DATA_DIR
+
+
+@pytest.fixture
+def fake_server(request):
+    """Сервер fake_datamark на свободном порту на время теста"""
+    options = dict(FAKE_SERVER_DEFAULTS)
+    marker = request.node.get_closest_marker('fake_datamark')
+    if marker is not None:
+        options.update(marker.kwargs)
+    with run_fake_server(**options) as server:
+        yield server
+
+
+@pytest.fixture
+def api_client(fake_server):
+    """Клиент API, настроенный на fake_server"""
+    return APIClient(fake_server.base_url, 'test', 'test')
@@ -0,0 +1,351 @@
+"""
+События хода выполнения заданий для потоковой передачи клиентам (SSE)
+
+Снимки результата задания сравниваются с предыдущими, и из разницы
+формируются события: смена статуса шага, счетчики шага, созданный отчет по
+GTIN, новый статус отчета, смена статуса задания. События публикуются в
+EventBus из потоков заданий и читаются подписчиками: синхронно (поток на
+клиента, для встроенного сервера Flask) или асинхронно (asgi.py - без потока
+на клиента, соединение держит только цикл событий).
+
+Задание, которое выполняет другой процесс приложения, в EventBus этого
+процесса не попадает; для него события формируются из снимков общего
+хранилища, которые опрашиваются с интервалом (iter_polled_sse).
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+# Типы событий
+EVENT_SNAPSHOT = 'snapshot'
+EVENT_JOB = 'job'
+EVENT_STEP = 'step'
+EVENT_PROGRESS = 'progress'
+EVENT_REPORT = 'report'
+EVENT_REPORT_STATUS = 'report_status'
+
+# Сколько последних событий задания хранится для переподключения (Last-Event-ID)
+HISTORY_SIZE = 1000
+
+# Интервал комментариев keep-alive в потоке SSE в секундах
+KEEPALIVE_INTERVAL = 15
+
+# Поля шага, изменение которых публикуется как progress
+_PROGRESS_FIELDS = ('codes_count', 'pooled_codes')
+
+
+def _report_statuses(steps: List[dict]) -> Dict[str, tuple]:
+    """{report_id: (gtin, статус)} по записям report_statuses шагов"""
+    reports = {}
+    for step in steps:
+        for entry in step.get('report_statuses') or ():
+            for report_id, status in entry.get('batch_statuses', {}).items():
+                reports[report_id] = (entry['gtin'], status)
+    return reports
+
+
+def diff_result(previous: Optional[dict], current: dict) -> List[tuple]:
+    """
+    События между двумя снимками результата задания
+
+    Returns:
+        list: [(тип события, данные)]
+    """
+    events = []
+    previous_steps = {step['step']: step for step in (previous or {}).get('steps', ())}
+    for step in current.get('steps', ()):
+        before = previous_steps.get(step['step'])
+        if before is None or before.get('status') != step.get('status'):
+            events.append((EVENT_STEP, step))
+        elif any(before.get(field) != step.get(field) for field in _PROGRESS_FIELDS):
+            events.append((EVENT_PROGRESS, step))
+
+    previous_reports = _report_statuses((previous or {}).get('steps', ()))
+    for report_id, (gtin, status) in _report_statuses(current.get('steps', ())).items():
+        before = previous_reports.get(report_id)
+        data = {'gtin': gtin, 'report_id': report_id, 'status': status}
+        if before is None:
+            events.append((EVENT_REPORT, data))
+        elif before[1] != status:
+            events.append((EVENT_REPORT_STATUS, data))
+    return events
+
+
+class _Channel:
+    def __init__(self):
+        self.events = deque(maxlen=HISTORY_SIZE)
+        self.seq = 0
+        self.closed = False
+        self.started_at = time.time()
+        self.condition = threading.Condition()
+        self.waiters = set()
+
+    def read(self, after: int) -> List[dict]:
+        """
+        События с номером больше after. Если часть из них уже вытеснена из
+        истории, возвращается одно событие snapshot без данных: подписчику
+        нужно отправить клиенту текущий снимок задания
+        """
+        if self.events and self.events[0]['id'] > after + 1:
+            return [{'id': self.seq, 'event': EVENT_SNAPSHOT, 'data': None}]
+        return [event for event in self.events if event['id'] > after]
+
+
+class EventBus:
+    """Потокобезопасная шина событий заданий с историей для переподключения"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels: Dict[str, _Channel] = {}
+
+    def _channel(self, channel_id: str) -> _Channel:
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = _Channel()
+            return channel
+
+    def publish(self, channel_id: str, event_type: str, data: dict, final: bool = False):
+        """
+        Публикует событие; final=True - последнее событие задания (поток подписчиков завершается)
+        """
+        channel = self._channel(channel_id)
+        now = time.time()
+        with channel.condition:
+            channel.seq += 1
+            channel.events.append({
+                'id': channel.seq,
+                'event': event_type,
+                'data': data,
+                'ts': now,
+                'elapsed': round(now - channel.started_at, 3)
+            })
+            # Продолженный запуск публикует события в тот же канал
+            channel.closed = final
+            channel.condition.notify_all()
+            waiters = list(channel.waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def publish_result(self, channel_id: str, previous: Optional[dict], current: dict):
+        for event_type, data in diff_result(previous, current):
+            self.publish(channel_id, event_type, data)
+
+    def last_id(self, channel_id: str) -> int:
+        """Номер последнего события (для подписки после отправки снимка)"""
+        channel = self._channel(channel_id)
+        with channel.condition:
+            return channel.seq
+
+    def discard(self, channel_id: str):
+        with self._lock:
+            self._channels.pop(channel_id, None)
+
+    def subscribe(self, channel_id: str, after: int = 0,
+                  keepalive: float = KEEPALIVE_INTERVAL) -> Iterator[Optional[dict]]:
+        """
+        Синхронная подписка: события с номером больше after, затем новые по мере публикации
+
+        Yields:
+            dict: событие (см. _Channel.read); None - нет событий за keepalive секунд
+        """
+        channel = self._channel(channel_id)
+        while True:
+            with channel.condition:
+                events = channel.read(after)
+                if not events and not channel.closed:
+                    channel.condition.wait(keepalive)
+                    events = channel.read(after)
+                closed = channel.closed
+            for event in events:
+                after = event['id']
+                yield event
+            if closed and not events:
+                return
+            if not events:
+                yield None
+
+    async def subscribe_async(self, channel_id: str, after: int = 0,
+                              keepalive: float = KEEPALIVE_INTERVAL) -> AsyncIterator[Optional[dict]]:
+        """Асинхронная подписка (см. subscribe): ожидание не занимает поток"""
+        channel = self._channel(channel_id)
+        loop = asyncio.get_running_loop()
+        waiter = asyncio.Event()
+        entry = (loop, waiter)
+        with channel.condition:
+            channel.waiters.add(entry)
+        try:
+            while True:
+                waiter.clear()
+                with channel.condition:
+                    events = channel.read(after)
+                    closed = channel.closed
+                for event in events:
+                    after = event['id']
+                    yield event
+                if events:
+                    continue
+                if closed:
+                    return
+                try:
+                    await asyncio.wait_for(waiter.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with channel.condition:
+                channel.waiters.discard(entry)
+
+
+SSE_KEEPALIVE = ': keepalive\n\n'
+
+
+def format_sse(event: dict) -> str:
+    """Событие в формате text/event-stream"""
+    data = json.dumps({**event['data'], 'ts': event['ts'], 'elapsed': event['elapsed']}, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+def format_snapshot(snapshot: dict, event_id: int) -> str:
+    """Текущее состояние задания (Job.to_dict) - первое событие потока"""
+    data = json.dumps(snapshot, ensure_ascii=False)
+    return f"id: {event_id}\nevent: {EVENT_SNAPSHOT}\ndata: {data}\n\n"
+
+
+def _parse_event_id(last_event_id: Optional[str]) -> Optional[int]:
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+
+def _start(bus: EventBus, job, last_event_id: Optional[str]):
+    """Номер, с которого читать события, и снимок задания (если клиент подключается впервые)"""
+    after = _parse_event_id(last_event_id)
+    if after is not None:
+        return after, None
+    after = bus.last_id(job.id)
+    return after, format_snapshot(job.to_dict(), after)
+
+
+def iter_sse(bus: EventBus, job, last_event_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Поток text/event-stream задания: снимок состояния, затем события до завершения задания
+
+    Args:
+        job: задание (jobs.Job)
+        last_event_id: заголовок Last-Event-ID при переподключении - поток
+            продолжается с пропущенных событий без повторного снимка
+    """
+    after, snapshot = _start(bus, job, last_event_id)
+    if snapshot:
+        yield snapshot
+    for event in bus.subscribe(job.id, after):
+        if event is None:
+            yield SSE_KEEPALIVE
+        elif event['event'] == EVENT_SNAPSHOT:
+            yield format_snapshot(job.to_dict(), event['id'])
+        else:
+            yield format_sse(event)
+
+
+async def aiter_sse(bus: EventBus, job, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Асинхронный вариант iter_sse"""
+    after, snapshot = _start(bus, job, last_event_id)
+    if snapshot:
+        yield snapshot
+    async for event in bus.subscribe_async(job.id, after):
+        if event is None:
+            yield SSE_KEEPALIVE
+        elif event['event'] == EVENT_SNAPSHOT:
+            yield format_snapshot(job.to_dict(), event['id'])
+        else:
+            yield format_sse(event)
+
+
+class _PolledStream:
+    """
+    События задания по снимкам, которые возвращает load() (Job.to_dict или None)
+
+    Номера событий локальны для соединения; при переподключении клиент
+    получает новый снимок, а нумерация продолжается с Last-Event-ID.
+    """
+
+    def __init__(self, load: Callable[[], Optional[dict]], finished_statuses: Sequence[str],
+                 last_event_id: Optional[str]):
+        self.load = load
+        self.finished_statuses = finished_statuses
+        self.seq = _parse_event_id(last_event_id) or 0
+        self.previous = None
+        self.finished = False
+
+    def _event(self, event_type: str, data: dict, started_at: float) -> str:
+        self.seq += 1
+        now = time.time()
+        return format_sse({'id': self.seq, 'event': event_type, 'data': data,
+                           'ts': now, 'elapsed': round(now - started_at, 3)})
+
+    def poll(self) -> List[str]:
+        """Сообщения text/event-stream с прошлого опроса"""
+        current = self.load()
+        if current is None:
+            self.finished = True
+            return []
+        previous, self.previous = self.previous, current
+        self.finished = current['status'] in self.finished_statuses
+        if previous is None:
+            self.seq += 1
+            return [format_snapshot(current, self.seq)]
+        started_at = current.get('started_at') or current['created_at']
+        messages = [self._event(event_type, data, started_at)
+                    for event_type, data in diff_result(previous['result'], current['result'])]
+        if current['status'] != previous['status']:
+            data = current if self.finished else {'job_id': current['job_id'], 'status': current['status']}
+            messages.append(self._event(EVENT_JOB, data, started_at))
+        return messages
+
+
+def iter_polled_sse(load: Callable[[], Optional[dict]], finished_statuses: Sequence[str],
+                    last_event_id: Optional[str] = None, interval: float = 1.0) -> Iterator[str]:
+    """
+    Поток text/event-stream задания другого процесса: снимок, затем события,
+    найденные сравнением снимков load() каждые interval секунд
+    """
+    stream = _PolledStream(load, finished_statuses, last_event_id)
+    last_sent = time.monotonic()
+    while True:
+        messages = stream.poll()
+        yield from messages
+        now = time.monotonic()
+        if messages:
+            last_sent = now
+        elif now - last_sent >= KEEPALIVE_INTERVAL:
+            last_sent = now
+            yield SSE_KEEPALIVE
+        if stream.finished:
+            return
+        time.sleep(interval)
+
+
+async def aiter_polled_sse(load: Callable[[], Optional[dict]], finished_statuses: Sequence[str],
+                           last_event_id: Optional[str] = None, interval: float = 1.0) -> AsyncIterator[str]:
+    """Асинхронный вариант iter_polled_sse (load выполняется в пуле потоков)"""
+    stream = _PolledStream(load, finished_statuses, last_event_id)
+    loop = asyncio.get_running_loop()
+    last_sent = time.monotonic()
+    while True:
+        messages = await loop.run_in_executor(None, stream.poll)
+        for message in messages:
+            yield message
+        now = time.monotonic()
+        if messages:
+            last_sent = now
+        elif now - last_sent >= KEEPALIVE_INTERVAL:
+            last_sent = now
+            yield SSE_KEEPALIVE
+        if stream.finished:
+            return
+        await asyncio.sleep(interval)
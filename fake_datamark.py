@@ -0,0 +1,355 @@
+"""
+Локальная замена API ГИС «Электронный знак» (Datamark) для нагрузочных проверок
+
+Поддерживает методы, которые использует api_client.APIClient: авторизацию,
+заказ кодов, статус заказа, постраничное скачивание кодов, отправку отчетов о
+вводе в оборот и статус отчета. Задержка ответа, время выполнения заказа и
+обработки отчета, доля ошибок 500, доля отклоненных заказов и отчетов и
+ограничение частоты запросов (ответ 429) настраиваются, а генератор случайных
+чисел можно зафиксировать (seed), чтобы прогоны были воспроизводимы.
+
+Запуск отдельным процессом:
+    python fake_datamark.py --port 8081 --latency 0.05 --order-delay 2 --rate-limit 50
+    API_BASE_URL=http://127.0.0.1:8081 API_USERNAME=test API_PASSWORD=test python app.py
+
+Запуск в тестах и скриптах:
+    with run_fake_server(latency=0.01, order_delay=0.5) as server:
+        client = APIClient(server.base_url, 'test', 'test')
+        ...
+        print(server.state.stats())
+
+Служебные адреса: GET /_fake/stats - счетчики запросов, ответов и пиковое
+количество одновременных запросов; POST /_fake/reset - сброс счетчиков.
+"""
+
+import argparse
+import asyncio
+import random
+import string
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+from api_client import (
+    AUTH_PATH, ORDERS_PATH, ORDER_PATH, ORDER_CODES_PATH, IMPORT_REPORTS_PATH, REPORT_PATH
+)
+from gs1 import GS
+
+# Префикс служебных адресов (без задержек, ошибок и ограничения частоты)
+CONTROL_PREFIX = '/_fake'
+
+_SERIAL_ALPHABET = string.ascii_letters + string.digits
+_CRYPTO_ALPHABET = string.ascii_letters + string.digits + '+/='
+
+
+class FakeDatamarkState:
+    """Настройки и состояние сервера: токены, заказы, отчеты и счетчики"""
+
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, order_delay: float = 1.0,
+                 report_delay: float = 1.0, error_rate: float = 0.0, order_reject_rate: float = 0.0,
+                 report_reject_rate: float = 0.0, rate_limit: float = 0.0, token_ttl: int = 3600,
+                 max_report_codes: Optional[int] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, seed: Optional[int] = None):
+        """
+        Args:
+            latency: задержка каждого ответа в секундах
+            latency_jitter: случайная добавка к задержке (от 0 до latency_jitter секунд)
+            order_delay: время выполнения заказа; коды выпускаются равномерно за это время
+            report_delay: время обработки отчета
+            error_rate: доля запросов, на которые отвечается 500
+            order_reject_rate: доля заказов, которые завершаются ошибкой
+            report_reject_rate: доля отчетов, которые отклоняются
+            rate_limit: максимум запросов в секунду (0 - без ограничения); сверх него - 429
+            token_ttl: срок действия токена в секундах
+            max_report_codes: максимум кодов в отчете (сверх него - 413)
+            username, password: ожидаемые учетные данные (None - принимаются любые)
+            seed: начальное значение генератора случайных чисел
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.order_delay = order_delay
+        self.report_delay = report_delay
+        self.error_rate = error_rate
+        self.order_reject_rate = order_reject_rate
+        self.report_reject_rate = report_reject_rate
+        self.rate_limit = rate_limit
+        self.token_ttl = token_ttl
+        self.max_report_codes = max_report_codes
+        self.username = username
+        self.password = password
+        self.random = random.Random(seed)
+
+        self.tokens: Dict[str, float] = {}
+        self.orders: Dict[str, dict] = {}
+        self.reports: Dict[str, dict] = {}
+
+        self._tokens_available = rate_limit
+        self._tokens_updated = time.monotonic()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.requests = Counter()
+        self.responses = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def stats(self) -> dict:
+        return {
+            'requests': dict(self.requests),
+            'responses': dict(self.responses),
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'orders': len(self.orders),
+            'reports': len(self.reports),
+        }
+
+    def throttled(self) -> bool:
+        """Ограничение частоты: корзина маркеров емкостью rate_limit запросов"""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        self._tokens_available = min(self.rate_limit,
+                                     self._tokens_available + (now - self._tokens_updated) * self.rate_limit)
+        self._tokens_updated = now
+        if self._tokens_available < 1:
+            return True
+        self._tokens_available -= 1
+        return False
+
+    def make_code(self, gtin: str) -> str:
+        serial = ''.join(self.random.choices(_SERIAL_ALPHABET, k=13))
+        key = ''.join(self.random.choices(_SERIAL_ALPHABET, k=4))
+        crypto = ''.join(self.random.choices(_CRYPTO_ALPHABET, k=44))
+        return f'01{gtin}21{serial}{GS}91{key}{GS}92{crypto}'
+
+    def produced_codes(self, order: dict) -> List[str]:
+        """Коды, выпущенные к текущему моменту (равномерно за order_delay)"""
+        if order['rejected']:
+            return []
+        elapsed = time.monotonic() - order['created_at']
+        share = 1.0 if self.order_delay <= 0 else min(1.0, elapsed / self.order_delay)
+        return order['codes'][:int(len(order['codes']) * share)]
+
+
+def _error(status_code: int, message: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse({'error': message}, status_code=status_code, headers=headers)
+
+
+def create_app(state: Optional[FakeDatamarkState] = None, **options) -> FastAPI:
+    """
+    Создает приложение сервера
+
+    Args:
+        state: состояние сервера; по умолчанию создается из options (см. FakeDatamarkState)
+    """
+    state = state or FakeDatamarkState(**options)
+    app = FastAPI(title='Fake Datamark API')
+    app.state.fake = state
+
+    def route_path(request: Request) -> str:
+        """Шаблон адреса запроса (счетчики ведутся по методам API, а не по идентификаторам)"""
+        for route in app.router.routes:
+            if route.matches(request.scope)[0] == Match.FULL:
+                return route.path
+        return request.url.path
+
+    @app.middleware('http')
+    async def simulate_network(request: Request, call_next):
+        path = request.url.path
+        if path.startswith(CONTROL_PREFIX):
+            return await call_next(request)
+
+        state.requests[f'{request.method} {route_path(request)}'] += 1
+        state.in_flight += 1
+        state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+        try:
+            if state.throttled():
+                response = _error(429, 'Too Many Requests', {'Retry-After': '1'})
+            else:
+                delay = state.latency + state.random.uniform(0, state.latency_jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if state.error_rate and state.random.random() < state.error_rate:
+                    response = _error(500, 'Internal Server Error')
+                else:
+                    response = await call_next(request)
+        finally:
+            state.in_flight -= 1
+        state.responses[str(response.status_code)] += 1
+        return response
+
+    def authorized(request: Request) -> bool:
+        header = request.headers.get('authorization', '')
+        token = header[len('Bearer '):] if header.startswith('Bearer ') else None
+        expires_at = state.tokens.get(token)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    @app.post(AUTH_PATH)
+    async def login(request: Request):
+        data = await request.json()
+        if (state.username is not None and data.get('username') != state.username) or \
+                (state.password is not None and data.get('password') != state.password):
+            return _error(401, 'Invalid credentials')
+        token = uuid.uuid4().hex
+        state.tokens[token] = time.monotonic() + state.token_ttl
+        return {'token': token, 'expiresIn': state.token_ttl}
+
+    @app.post(ORDERS_PATH)
+    async def create_order(request: Request):
+        if not authorized(request):
+            return _error(401, 'Unauthorized')
+        data = await request.json()
+        products = data.get('products') or []
+        if not products:
+            return _error(400, 'products is required')
+        codes = []
+        for product in products:
+            codes.extend(state.make_code(product['gtin']) for _ in range(int(product['quantity'])))
+        order_id = uuid.uuid4().hex
+        state.orders[order_id] = {
+            'codes': codes,
+            'created_at': time.monotonic(),
+            'rejected': state.random.random() < state.order_reject_rate,
+        }
+        return JSONResponse({'orderId': order_id}, status_code=201)
+
+    @app.get(ORDER_PATH)
+    async def order_status(order_id: str, request: Request):
+        if not authorized(request):
+            return _error(401, 'Unauthorized')
+        order = state.orders.get(order_id)
+        if order is None:
+            return _error(404, 'Order not found')
+        if order['rejected']:
+            status = 'REJECTED'
+        elif len(state.produced_codes(order)) == len(order['codes']):
+            status = 'READY'
+        else:
+            status = 'PENDING'
+        return {'orderId': order_id, 'status': status}
+
+    @app.get(ORDER_CODES_PATH)
+    async def order_codes(order_id: str, request: Request, offset: int = 0, limit: Optional[int] = None):
+        if not authorized(request):
+            return _error(401, 'Unauthorized')
+        order = state.orders.get(order_id)
+        if order is None:
+            return _error(404, 'Order not found')
+        produced = state.produced_codes(order)
+        end = len(produced) if limit is None else min(len(produced), offset + limit)
+        return {'orderId': order_id, 'codes': produced[offset:end]}
+
+    @app.post(IMPORT_REPORTS_PATH)
+    async def submit_report(request: Request):
+        if not authorized(request):
+            return _error(401, 'Unauthorized')
+        data = await request.json()
+        codes = data.get('codes') or []
+        if not data.get('gtin') or not codes:
+            return _error(400, 'gtin and codes are required')
+        if state.max_report_codes and len(codes) > state.max_report_codes:
+            return _error(413, f'Report exceeds {state.max_report_codes} codes')
+        report_id = uuid.uuid4().hex
+        state.reports[report_id] = {
+            'gtin': data['gtin'],
+            'codes_count': len(codes),
+            'created_at': time.monotonic(),
+            'rejected': state.random.random() < state.report_reject_rate,
+        }
+        return JSONResponse({'reportId': report_id}, status_code=202)
+
+    @app.get(REPORT_PATH)
+    async def report_status(report_id: str, request: Request):
+        if not authorized(request):
+            return _error(401, 'Unauthorized')
+        report = state.reports.get(report_id)
+        if report is None:
+            return _error(404, 'Report not found')
+        if time.monotonic() - report['created_at'] < state.report_delay:
+            status = 'PROCESSING'
+        else:
+            status = 'REJECTED' if report['rejected'] else 'ACCEPTED'
+        return {'reportId': report_id, 'status': status}
+
+    @app.get(CONTROL_PREFIX + '/stats')
+    async def stats():
+        return state.stats()
+
+    @app.post(CONTROL_PREFIX + '/reset')
+    async def reset():
+        state.reset_stats()
+        return {'success': True}
+
+    return app
+
+
+class FakeDatamarkServer:
+    """Запущенный в фоновом потоке сервер: адрес и состояние"""
+
+    def __init__(self, base_url: str, state: FakeDatamarkState):
+        self.base_url = base_url
+        self.state = state
+
+
+@contextmanager
+def run_fake_server(host: str = '127.0.0.1', port: int = 0, **options) -> Iterator[FakeDatamarkServer]:
+    """
+    Запускает сервер в фоновом потоке на время блока with
+
+    Args:
+        port: порт (0 - любой свободный)
+        options: настройки сервера (см. FakeDatamarkState)
+    """
+    app = create_app(**options)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='fake-datamark', daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError('Не удалось запустить сервер')
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield FakeDatamarkServer(f'http://{host}:{port}', app.state.fake)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальная замена API Datamark')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, с')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='случайная добавка к задержке, с')
+    parser.add_argument('--order-delay', type=float, default=1.0, help='время выполнения заказа, с')
+    parser.add_argument('--report-delay', type=float, default=1.0, help='время обработки отчета, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--order-reject-rate', type=float, default=0.0, help='доля отклоненных заказов')
+    parser.add_argument('--report-reject-rate', type=float, default=0.0, help='доля отклоненных отчетов')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='максимум запросов в секунду (0 - без ограничения)')
+    parser.add_argument('--token-ttl', type=int, default=3600, help='срок действия токена, с')
+    parser.add_argument('--max-report-codes', type=int, default=None, help='максимум кодов в отчете')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    options = vars(args)
+    host, port = options.pop('host'), options.pop('port')
+    print(f'API_BASE_URL=http://{host}:{port}')
+    uvicorn.run(create_app(**options), host=host, port=port, log_level='info')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
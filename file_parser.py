@@ -2,8 +2,602 @@
 Модуль для парсинга файлов из РФ
 - Файл 1: GTIN; описание; количество
 - Файл 2: неполные коды маркировки
+
+Парсеры работают потоково: файл читается блоками и декодируется построчно,
+поэтому расход памяти не зависит от размера загруженного файла. Если данные
+нужно держать в памяти целиком, read_product_table и read_code_batch собирают
+их в колоночные ProductTable и CodeBatch (columnar.py).
+
+Кроме текстовых файлов поддерживаются выгрузки поставщиков (iter_file_lines):
+
+- gzip (в том числе из нескольких членов) - распаковывается блоками;
+- zip - файлы архива читаются по очереди, каждый своим форматом;
+- CSV (по расширению .csv) - разделитель ';', табуляция или ','; в файле
+  кодов строка не делится на колонки (коды могут содержать ';', ',', '"');
+- XLSX - строки первого листа читаются по одной, без загрузки листа целиком.
+
+Формат определяется по первым байтам файла, текст и CSV - по расширению имени.
+Кодировка текста определяется автоматически: UTF-8 (с BOM или без), а если
+строка не декодируется - CP1251. Строки таблиц (CSV, XLSX) приводятся к
+текстовому формату («GTIN; описание; количество» или код), поэтому все
+форматы читаются одними и теми же iter_products/iter_codes и Validator.
 """
 
+import csv
+import logging
+import posixpath
+import tempfile
+import zipfile
+import zlib
+from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Optional, Union
+from xml.etree import ElementTree
+
+from columnar import CodeBatch, ProductTable
+from config import UNPACKED_MAX_BYTES
+from gs1 import split_by_gtin
+
+logger = logging.getLogger(__name__)
+
+# Размер блока при чтении загруженного файла
+CHUNK_SIZE = 64 * 1024
+
+# Кодировка "определить автоматически": UTF-8, при ошибке декодирования - FALLBACK_ENCODING
+ENCODING_AUTO = 'auto'
+FALLBACK_ENCODING = 'cp1251'
+
+# Форматы текстового содержимого (по расширению имени файла)
+FORMAT_LINES = 'lines'
+FORMAT_CSV = 'csv'
+
+# Колонки таблиц (CSV, XLSX), из которых составляется строка файла
+PRODUCT_COLUMNS = 3
+CODE_COLUMNS = 1
+
+# Архив zip, выгруженный не из файла, копируется во временный файл (в памяти до этого размера)
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZIP_MAGIC = b'PK\x03\x04'
+_UTF8_BOM = b'\xef\xbb\xbf'
+_CSV_DELIMITERS = (';', '\t', ',')
+
+_XLSX_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_XLSX_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_XLSX_PACKAGE_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_XLSX_WORKBOOK = 'xl/workbook.xml'
+_XLSX_DEFAULT_SHEET = 'xl/worksheets/sheet1.xml'
+
+
+def iter_lines(source, encoding: str = 'utf-8', chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Построчно читает и декодирует бинарный источник
+
+    Args:
+        source: бинарный файлоподобный объект (с методом read) или итерируемый набор блоков bytes
+        encoding: кодировка файла; ENCODING_AUTO - UTF-8 без BOM, а после первой
+            строки, которая не декодируется как UTF-8, - FALLBACK_ENCODING
+        chunk_size: размер блока при чтении из файлоподобного объекта
+
+    Yields:
+        str: декодированные строки без символа перевода строки
+    """
+    auto = encoding == ENCODING_AUTO
+    if auto:
+        encoding = 'utf-8'
+    first = auto
+
+    tail = b''
+    for chunk in _iter_chunks(source, chunk_size):
+        if not chunk:
+            continue
+        if first:
+            # BOM может прийти по частям - ждем, пока накопятся три байта
+            chunk = tail + chunk
+            if len(chunk) < len(_UTF8_BOM):
+                tail = chunk
+                continue
+            tail = b''
+            chunk = chunk.removeprefix(_UTF8_BOM)
+            first = False
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            try:
+                yield line.decode(encoding)
+            except UnicodeDecodeError:
+                if not auto or encoding == FALLBACK_ENCODING:
+                    raise
+                # Предыдущие строки - ASCII или корректный UTF-8, дальше файл читается в CP1251
+                encoding = FALLBACK_ENCODING
+                logger.info(f"Файл не в UTF-8, чтение в кодировке {encoding}")
+                yield line.decode(encoding)
+    if first:
+        tail = tail.removeprefix(_UTF8_BOM)
+    if tail:
+        try:
+            yield tail.decode(encoding)
+        except UnicodeDecodeError:
+            if not auto or encoding == FALLBACK_ENCODING:
+                raise
+            yield tail.decode(FALLBACK_ENCODING)
+
+
+def _iter_chunks(source, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Блоки bytes из файлоподобного объекта или итерируемого набора блоков"""
+    if hasattr(source, 'read'):
+        return iter(lambda: source.read(chunk_size), b'')
+    return iter(source)
+
+
+def _seekable_offset(source) -> Optional[int]:
+    """Текущая позиция файлоподобного объекта, если к ней можно вернуться, иначе None"""
+    try:
+        if source.seekable():
+            return source.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
+
+
+def text_format(filename: Optional[str]) -> str:
+    """
+    Формат текстового содержимого файла по имени: FORMAT_CSV для *.csv и *.csv.gz,
+    иначе FORMAT_LINES (строки файла товаров или кодов)
+    """
+    name = (filename or '').lower().removesuffix('.gz')
+    return FORMAT_CSV if name.endswith('.csv') else FORMAT_LINES
+
+
+class GzipDecompressor:
+    """
+    Потоковая распаковка gzip: члены gzip, записанные подряд (cat a.gz b.gz,
+    pigz), распаковываются друг за другом. За один вызов zlib выдает не больше
+    chunk_size байт (остаток входа - в unconsumed_tail), а общий размер
+    распакованных данных ограничен max_output, поэтому несколько килобайт
+    входа не разворачиваются в гигабайты в памяти.
+    """
+
+    def __init__(self, max_output: int = UNPACKED_MAX_BYTES, chunk_size: int = CHUNK_SIZE):
+        self.max_output = max_output
+        self.chunk_size = chunk_size
+        self.output_size = 0
+        self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self._pending = False
+
+    def decompress(self, chunk: bytes) -> Iterator[bytes]:
+        """
+        Распаковывает очередной блок входа
+
+        Yields:
+            bytes: распакованные данные блоками не больше chunk_size
+
+        Raises:
+            ValueError: данные повреждены или распакованные данные больше max_output
+        """
+        try:
+            more = bool(chunk)
+            while more:
+                self._pending = True
+                data = self._decompressor.decompress(chunk, self.chunk_size)
+                if data:
+                    self.output_size += len(data)
+                    if self.max_output and self.output_size > self.max_output:
+                        raise ValueError(f"Распакованные данные gzip больше {self.max_output} байт")
+                    yield data
+                if self._decompressor.eof:
+                    # Остаток блока - начало следующего члена
+                    chunk = self._decompressor.unused_data
+                    self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                    self._pending = False
+                    more = bool(chunk)
+                else:
+                    # Выход заполнен целиком - в zlib могут оставаться данные и без нового входа
+                    chunk = self._decompressor.unconsumed_tail
+                    more = bool(chunk) or len(data) == self.chunk_size
+        except zlib.error as e:
+            raise ValueError(f"Ошибка распаковки gzip: {e}") from e
+
+    def finish(self):
+        """
+        Raises:
+            ValueError: поток закончился внутри члена gzip
+        """
+        if self._pending:
+            raise ValueError("Архив gzip обрезан")
+
+
+def iter_gunzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Распаковывает поток gzip блоками не больше CHUNK_SIZE (см. GzipDecompressor)
+
+    Raises:
+        ValueError: данные повреждены, обрезаны или больше UNPACKED_MAX_BYTES
+    """
+    decompressor = GzipDecompressor()
+    for chunk in chunks:
+        yield from decompressor.decompress(chunk)
+    decompressor.finish()
+
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Строки CSV как списки значений; разделитель (';', табуляция или ',') -
+    первый из них, найденный в первой непустой строке вне кавычек
+    """
+    lines = iter(lines)
+    head = []
+    for line in lines:
+        head.append(line)
+        if line.strip():
+            break
+    if not head:
+        return
+    unquoted = head[-1].split('"')[::2]
+    delimiter = next((d for d in _CSV_DELIMITERS if any(d in part for part in unquoted)), ';')
+    yield from csv.reader(chain(head, lines), delimiter=delimiter)
+
+
+def _xlsx_sheet_path(archive: zipfile.ZipFile) -> str:
+    """Путь к первому листу книги (по workbook.xml и его связям)"""
+    try:
+        workbook = ElementTree.fromstring(archive.read(_XLSX_WORKBOOK))
+        sheet_id = workbook.find(f'{_XLSX_MAIN}sheets/{_XLSX_MAIN}sheet').get(f'{_XLSX_REL}id')
+        relations = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        for relation in relations.iter(f'{_XLSX_PACKAGE_REL}Relationship'):
+            if relation.get('Id') == sheet_id:
+                target = relation.get('Target')
+                return target.lstrip('/') if target.startswith('/') else posixpath.normpath(f'xl/{target}')
+    except (KeyError, AttributeError, ElementTree.ParseError):
+        pass
+    return _XLSX_DEFAULT_SHEET
+
+
+def _xlsx_shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    """Общие строки книги (на них ссылаются ячейки с t="s")"""
+    try:
+        f = archive.open('xl/sharedStrings.xml')
+    except KeyError:
+        return []
+    strings = []
+    with f:
+        for _, element in ElementTree.iterparse(f):
+            if element.tag == f'{_XLSX_MAIN}si':
+                # Текст ячейки - <t> или несколько фрагментов форматированного текста <r><t>
+                strings.append(''.join(t.text or '' for t in element.iter(f'{_XLSX_MAIN}t')))
+                element.clear()
+    return strings
+
+
+def _xlsx_column(reference: str) -> int:
+    """Номер колонки (с нуля) по адресу ячейки: A1 -> 0, AB7 -> 27"""
+    column = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        column = column * 26 + ord(char.upper()) - ord('A') + 1
+    return column - 1
+
+
+def _xlsx_value(cell: ElementTree.Element, shared_strings: List[str]) -> str:
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(f'{_XLSX_MAIN}t'))
+    value = cell.find(f'{_XLSX_MAIN}v')
+    text = value.text if value is not None and value.text else ''
+    if cell_type == 's':
+        try:
+            return shared_strings[int(text)] if text else ''
+        except IndexError:
+            raise ValueError(f"Ячейка {cell.get('r')} ссылается на отсутствующую общую строку {text}")
+    if cell_type is None or cell_type == 'n':
+        # Числа (GTIN, количество) хранятся как 4601234567890 или 4.60123456789E+12
+        try:
+            number = Decimal(text)
+        except InvalidOperation:
+            return text
+        if number.is_finite() and number == number.to_integral_value():
+            return str(int(number))
+    return text
+
+
+def iter_xlsx_rows(source) -> Iterator[List[str]]:
+    """
+    Строки первого листа книги XLSX как списки значений ячеек (пустые ячейки - '')
+
+    Лист разбирается потоково (iterparse): в памяти находятся только текущая
+    строка и общие строки книги.
+
+    Args:
+        source: путь, бинарный файл с произвольным доступом или zipfile.ZipFile
+
+    Raises:
+        ValueError: книга повреждена (нет листа, неверная ссылка на общую строку)
+    """
+    archive = source if isinstance(source, zipfile.ZipFile) else zipfile.ZipFile(source)
+    shared_strings = _xlsx_shared_strings(archive)
+    row_tag = f'{_XLSX_MAIN}row'
+    cell_tag = f'{_XLSX_MAIN}c'
+    sheet_path = _xlsx_sheet_path(archive)
+    try:
+        sheet = archive.open(sheet_path)
+    except KeyError:
+        raise ValueError(f"В книге XLSX нет листа {sheet_path}")
+    with sheet as f:
+        sheet_data = None
+        for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == f'{_XLSX_MAIN}sheetData':
+                    sheet_data = element
+                continue
+            if element.tag != row_tag:
+                continue
+            row = []
+            for cell in element.iter(cell_tag):
+                reference = cell.get('r')
+                if reference:
+                    # Пустые ячейки в файле не записываются
+                    row.extend([''] * (_xlsx_column(reference) - len(row)))
+                row.append(_xlsx_value(cell, shared_strings))
+            yield row
+            # Разобранные строки удаляются из дерева, чтобы оно не росло
+            if sheet_data is not None:
+                sheet_data.clear()
+
+
+def _iter_table_lines(rows: Iterable[List[str]], columns: int) -> Iterator[str]:
+    """
+    Строки таблицы в текстовом формате: первые columns значений через ';'
+    (';' внутри значений заменяется на ','). Первая строка без цифр в первом
+    значении считается заголовком и пропускается. GTIN товара короче 14 цифр
+    (число в таблице теряет ведущие нули) дополняется нулями слева.
+    """
+    rows = iter(rows)
+    for row in rows:
+        if not any(cell.strip() for cell in row):
+            yield ''
+            continue
+        if not any(char.isdigit() for char in row[0]):
+            yield ''
+        else:
+            rows = chain((row,), rows)
+        break
+    for row in rows:
+        if columns == CODE_COLUMNS:
+            yield row[0] if row else ''
+        else:
+            cells = [cell.replace(';', ',') for cell in row[:columns]]
+            gtin = cells[0].strip() if cells else ''
+            if gtin.isdigit() and len(gtin) < 14:
+                cells[0] = gtin.zfill(14)
+            yield ';'.join(cells)
+
+
+def _iter_csv_code_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Строки файла кодов в CSV: каждая строка - один код целиком
+
+    Серийный номер и криптохвост могут содержать ';', ',' и '"', поэтому строка
+    не делится на колонки; снимаются только внешние кавычки, если в них
+    заключена вся строка. Первая непустая строка без цифр считается заголовком
+    и пропускается.
+    """
+    header = True
+    for line in lines:
+        code = line.strip()
+        if header and code:
+            header = False
+            if not any(char.isdigit() for char in code):
+                yield ''
+                continue
+        if len(code) >= 2 and code[0] == code[-1] == '"' and '"' not in code[1:-1].replace('""', ''):
+            code = code[1:-1].replace('""', '"')
+        yield code
+
+
+def _iter_zip_lines(archive: zipfile.ZipFile, columns: int, encoding: str) -> Iterator[str]:
+    """Строки всех файлов архива по порядку (каталоги и служебные файлы macOS пропускаются)"""
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith('__MACOSX/') or posixpath.basename(name).startswith('.'):
+            continue
+        with archive.open(info) as member:
+            yield from iter_file_lines(_iter_chunks(member), name, columns, encoding)
+
+
+def iter_file_lines(source, filename: Optional[str] = None, columns: int = PRODUCT_COLUMNS,
+                    encoding: str = ENCODING_AUTO) -> Iterator[str]:
+    """
+    Строки загруженного файла любого поддерживаемого формата (gzip, zip, XLSX, CSV, текст)
+
+    Формат определяется по первым байтам, для текста - по имени файла
+    (text_format). Распаковка и чтение потоковые; архив zip, переданный не
+    файлом с произвольным доступом, копируется во временный файл.
+
+    Args:
+        source: бинарный файлоподобный объект или итерируемый набор блоков bytes
+        filename: имя загруженного файла
+        columns: сколько колонок таблицы составляют строку (PRODUCT_COLUMNS, CODE_COLUMNS)
+        encoding: кодировка текста
+
+    Yields:
+        str: строки в формате текстового файла (для iter_products, iter_codes, Validator)
+
+    Raises:
+        ValueError: архив поврежден
+    """
+    offset = _seekable_offset(source) if hasattr(source, 'read') else None
+    chunks = _iter_chunks(source)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(_ZIP_MAGIC):
+            break
+    chunks = chain((head,), chunks)
+
+    if head.startswith(_GZIP_MAGIC):
+        name = filename or ''
+        if name.lower().endswith('.gz'):
+            name = name[:-3]
+        yield from iter_file_lines(iter_gunzip(chunks), name, columns, encoding)
+    elif head.startswith(_ZIP_MAGIC):
+        if offset is not None:
+            source.seek(offset)
+            archive_file = source
+        else:
+            archive_file = tempfile.SpooledTemporaryFile(SPOOL_MAX_MEMORY)
+            for chunk in chunks:
+                archive_file.write(chunk)
+            archive_file.seek(0)
+        try:
+            archive = zipfile.ZipFile(archive_file)
+            if _XLSX_WORKBOOK in archive.namelist():
+                yield from _iter_table_lines(iter_xlsx_rows(archive), columns)
+            else:
+                yield from _iter_zip_lines(archive, columns, encoding)
+        except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError,
+                ElementTree.ParseError) as e:
+            raise ValueError(f"Ошибка чтения архива {filename}: {e}" if filename else f"Ошибка чтения архива: {e}") from e
+        finally:
+            if archive_file is not source:
+                archive_file.close()
+    elif text_format(filename) == FORMAT_CSV:
+        lines = iter_lines(chunks, encoding)
+        if columns == CODE_COLUMNS:
+            yield from _iter_csv_code_lines(lines)
+        else:
+            yield from _iter_table_lines(iter_csv_rows(lines), columns)
+    else:
+        yield from iter_lines(chunks, encoding)
+
+
+def iter_product_lines(source, filename: Optional[str] = None, encoding: str = ENCODING_AUTO) -> Iterator[str]:
+    """Строки файла товаров любого поддерживаемого формата (см. iter_file_lines)"""
+    return iter_file_lines(source, filename, PRODUCT_COLUMNS, encoding)
+
+
+def iter_code_lines(source, filename: Optional[str] = None, encoding: str = ENCODING_AUTO) -> Iterator[str]:
+    """Строки файла кодов любого поддерживаемого формата (см. iter_file_lines)"""
+    return iter_file_lines(source, filename, CODE_COLUMNS, encoding)
+
+
+def _as_lines(file_content: Union[str, Iterable[str]]) -> Iterable[str]:
+    """Разбивает строку на строки; итерируемые источники возвращает как есть"""
+    if isinstance(file_content, str):
+        return file_content.split('\n')
+    return file_content
+
+
+def iter_products(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Лениво парсит строки файла с описаниями товаров (Файл 1)
+    Формат: GTIN; описание; количество
+
+    Yields:
+        dict: Словарь с ключами: gtin, description, quantity
+    """
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if line:
+            yield parse_product_line(line, line_num)
+
+
+def parse_product_line(line: str, line_num: int) -> dict:
+    """
+    Разбирает одну непустую строку файла товаров
+
+    Raises:
+        ValueError: неверный формат строки или количество
+    """
+    parts = line.split(';')
+    if len(parts) < 3:
+        raise ValueError(f"Неверный формат строки {line_num}: ожидается формат 'GTIN; описание; количество'")
+
+    gtin = parts[0].strip()
+    description = parts[1].strip()
+    try:
+        quantity = int(parts[2].strip())
+    except ValueError:
+        raise ValueError(f"Неверное количество в строке {line_num}: {parts[2]}")
+
+    return {
+        'gtin': gtin,
+        'description': description,
+        'quantity': quantity
+    }
+
+
+def iter_codes(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Лениво парсит строки файла с кодами маркировки (Файл 2)
+    Формат: одна строка = один неполный код
+
+    Yields:
+        str: Неполный код маркировки
+    """
+    for line in lines:
+        code = line.strip()
+        if code:
+            yield code
+
+
+def iter_product_file(source, encoding: str = ENCODING_AUTO, filename: Optional[str] = None) -> Iterator[dict]:
+    """
+    Потоково парсит загруженный файл с описаниями товаров
+
+    Args:
+        source: бинарный файлоподобный объект или итерируемый набор блоков bytes
+        filename: имя файла (определяет формат CSV, см. iter_file_lines)
+    """
+    return iter_products(iter_product_lines(source, filename, encoding))
+
+
+def iter_codes_file(source, encoding: str = ENCODING_AUTO, filename: Optional[str] = None) -> Iterator[str]:
+    """
+    Потоково парсит загруженный файл с кодами маркировки
+
+    Args:
+        source: бинарный файлоподобный объект или итерируемый набор блоков bytes
+        filename: имя файла (определяет формат CSV, см. iter_file_lines)
+    """
+    return iter_codes(iter_code_lines(source, filename, encoding))
+
+
+def read_product_table(source, encoding: str = ENCODING_AUTO, filename: Optional[str] = None) -> ProductTable:
+    """
+    Читает загруженный файл с описаниями товаров в колоночную таблицу
+
+    Args:
+        source: бинарный файлоподобный объект или итерируемый набор блоков bytes
+        filename: имя файла (определяет формат CSV, см. iter_file_lines)
+    """
+    table = ProductTable()
+    for product in iter_product_file(source, encoding, filename):
+        table.append(product['gtin'], product['description'], product['quantity'])
+    return table
+
+
+def read_code_batch(source, encoding: str = ENCODING_AUTO, chunk_codes: int = 65536,
+                    filename: Optional[str] = None) -> CodeBatch:
+    """
+    Читает загруженный файл с кодами маркировки в CodeBatch
+
+    Коды добавляются в пакет блоками по chunk_codes штук, поэтому одновременно
+    в памяти отдельными строками находится не больше одного блока.
+
+    Args:
+        source: бинарный файлоподобный объект или итерируемый набор блоков bytes
+        filename: имя файла (определяет формат CSV, см. iter_file_lines)
+    """
+    batch = CodeBatch()
+    codes = iter_codes_file(source, encoding, filename)
+    while True:
+        chunk = list(islice(codes, chunk_codes))
+        if not chunk:
+            return batch
+        batch.extend(chunk)
+
 
 def parse_product_file(file_content: str) -> list:
     """
@@ -13,32 +607,7 @@ def parse_product_file(file_content: str) -> list:
     Returns:
         list: Список словарей с ключами: gtin, description, quantity
     """
-    products = []
-    lines = file_content.strip().split('\n')
-    
-    for line_num, line in enumerate(lines, 1):
-        line = line.strip()
-        if not line:
-            continue
-            
-        parts = line.split(';')
-        if len(parts) < 3:
-            raise ValueError(f"Неверный формат строки {line_num}: ожидается формат 'GTIN; описание; количество'")
-        
-        gtin = parts[0].strip()
-        description = parts[1].strip()
-        try:
-            quantity = int(parts[2].strip())
-        except ValueError:
-            raise ValueError(f"Неверное количество в строке {line_num}: {parts[2]}")
-        
-        products.append({
-            'gtin': gtin,
-            'description': description,
-            'quantity': quantity
-        })
-    
-    return products
+    return list(iter_products(_as_lines(file_content)))
 
 
 def parse_codes_file(file_content: str) -> list:
@@ -49,15 +618,7 @@ def parse_codes_file(file_content: str) -> list:
     Returns:
         list: Список неполных кодов маркировки
     """
-    codes = []
-    lines = file_content.strip().split('\n')
-    
-    for line in lines:
-        code = line.strip()
-        if code:
-            codes.append(code)
-    
-    return codes
+    return list(iter_codes(_as_lines(file_content)))
 
 
 def group_products_by_gtin(products: list) -> dict:
@@ -65,11 +626,13 @@ def group_products_by_gtin(products: list) -> dict:
     Группирует товары по GTIN для заказа кодов
     
     Args:
-        products: Список товаров из parse_product_file
+        products: Список товаров из parse_product_file или ProductTable
         
     Returns:
         dict: {gtin: total_quantity}
     """
+    if isinstance(products, ProductTable):
+        return products.quantities_by_gtin()
     grouped = {}
     for product in products:
         gtin = product['gtin']
@@ -85,22 +648,35 @@ def match_codes_to_products(codes: list, products: list) -> dict:
     Сопоставляет коды маркировки с товарами по GTIN
     
     Args:
-        codes: Список неполных кодов из parse_codes_file
+        codes: Список неполных кодов из parse_codes_file или CodeBatch
         products: Список товаров из parse_product_file
         
     Returns:
-        dict: {gtin: [список кодов для этого GTIN]}
+        dict: {gtin: [список кодов для этого GTIN]}; для CodeBatch - {gtin: CodeView}
+            (коды не копируются, GTIN уже извлечены при заполнении пакета)
     """
-    # Извлекаем GTIN из кодов (первые 14 цифр после 01)
-    gtin_to_codes = {}
-    
-    for code in codes:
-        # Формат кода: 01<GTIN>21<serial>...
-        # GTIN обычно начинается после "01" и имеет длину 14 символов
-        if code.startswith('01'):
-            gtin = code[2:16]  # Извлекаем GTIN (14 символов)
-            if gtin not in gtin_to_codes:
-                gtin_to_codes[gtin] = []
-            gtin_to_codes[gtin].append(code)
-    
-    return gtin_to_codes
+    if isinstance(codes, CodeBatch):
+        return codes.groups()
+    # GTIN извлекается разбором кода GS1 (AI 01) одним проходом по всем кодам
+    return split_by_gtin(codes)
+
+
+def deduplicate_codes(gtin_to_codes: dict) -> int:
+    """
+    Удаляет повторы кодов внутри каждого GTIN, сохраняя порядок
+
+    Представление CodeView заменяется списком только для GTIN с повторами.
+
+    Args:
+        gtin_to_codes: {gtin: [коды]} из match_codes_to_products (изменяется на месте)
+
+    Returns:
+        int: количество удаленных повторов
+    """
+    removed = 0
+    for gtin, codes_list in gtin_to_codes.items():
+        unique = list(dict.fromkeys(codes_list))
+        if len(unique) != len(codes_list):
+            removed += len(codes_list) - len(unique)
+            gtin_to_codes[gtin] = unique
+    return removed
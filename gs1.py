@@ -0,0 +1,324 @@
+"""
+Разбор кодов маркировки GS1 DataMatrix (element string)
+
+Код состоит из последовательности элементов <AI><значение>. Элементы переменной
+длины завершаются разделителем GS (символ 0x1D) или его текстовой записью [GS].
+Типовой код: 01<GTIN 14 цифр>21<серийный номер>[GS]91<ключ>[GS]92<криптохвост>
+
+Кроме разбора одного кода модуль предоставляет пакетный API: коды в стандартной
+форме преобразуются без разбора (серийный номер находится по фиксированному
+смещению), буфер из строк одинаковой длины преобразуется по столбцам за несколько
+операций над байтами, а посимвольный разбор применяется только к нестандартным строкам.
+"""
+
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+GS = '\x1d'
+GS_TEXT = '[GS]'
+
+# Идентификатор символики, который некоторые сканеры добавляют в начало кода
+SYMBOLOGY_ID = ']d2'
+
+# Таблица идентификаторов применения: AI -> (фиксированная длина или None, максимальная длина, описание)
+AI_TABLE = {
+    '01': (14, 14, 'GTIN'),
+    '21': (None, 20, 'Серийный номер'),
+    '91': (None, 90, 'Ключ проверки'),
+    '92': (None, 90, 'Код проверки (криптохвост)'),
+    '93': (None, 90, 'Код проверки (короткий криптохвост)'),
+}
+
+AI_GTIN = '01'
+AI_SERIAL = '21'
+
+# Первый символ серийного номера обозначает страну: 5 - РФ, 2 - Беларусь
+RF_COUNTRY_DIGIT = '5'
+RB_COUNTRY_DIGIT = '2'
+
+# Количество кодов в одном пакете при потоковом преобразовании
+BATCH_SIZE = 10000
+
+# Стандартная форма: код начинается с 01<GTIN>21, серийный номер начинается с 19-го символа
+_SERIAL_OFFSET = 18
+_RF_DIGIT_BYTES = RF_COUNTRY_DIGIT.encode()
+_RB_DIGIT_BYTES = RB_COUNTRY_DIGIT.encode()
+# Пробельные символы ASCII вокруг кода в строке (GS 0x1D - часть кода и не снимается)
+_LINE_WHITESPACE = b' \t\r\x0b\x0c'
+_UTF8_BOM = b'\xef\xbb\xbf'
+
+
+class GS1Error(ValueError):
+    """Ошибка разбора кода GS1"""
+
+
+def gtin_check_digit(digits: str) -> str:
+    """Контрольная цифра GTIN (алгоритм GS1 mod 10) для цифр без контрольной"""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_gtin(gtin: str) -> bool:
+    """GTIN-14: 14 цифр с верной контрольной цифрой"""
+    return len(gtin) == 14 and gtin.isdigit() and gtin_check_digit(gtin[:13]) == gtin[13]
+
+
+def _separator_at(code: str, pos: int) -> int:
+    """Возвращает длину разделителя в позиции pos (0, если разделителя нет)"""
+    if code.startswith(GS, pos):
+        return len(GS)
+    if code.startswith(GS_TEXT, pos):
+        return len(GS_TEXT)
+    return 0
+
+
+def _next_separator(code: str, pos: int) -> int:
+    """Позиция ближайшего разделителя GS или [GS] начиная с pos (len(code), если нет)"""
+    positions = [p for p in (code.find(GS, pos), code.find(GS_TEXT, pos)) if p != -1]
+    return min(positions) if positions else len(code)
+
+
+def iter_elements(code: str, serial_length: Optional[int] = None) -> Iterator[Tuple[str, int, int]]:
+    """
+    Разбирает код на элементы
+
+    Args:
+        code: код маркировки с разделителями GS, [GS] или без них
+        serial_length: длина серийного номера для товарной группы; нужна, если после
+            серийного номера нет разделителя, а за ним следуют другие элементы
+
+    Yields:
+        tuple: (AI, начало значения, конец значения) - позиции в исходной строке
+
+    Raises:
+        GS1Error: если встречен неизвестный AI или значение неверной длины
+    """
+    pos = len(SYMBOLOGY_ID) if code.startswith(SYMBOLOGY_ID) else 0
+    end = len(code)
+
+    while pos < end:
+        sep = _separator_at(code, pos)
+        if sep:
+            pos += sep
+            continue
+
+        ai = code[pos:pos + 2]
+        if ai not in AI_TABLE:
+            raise GS1Error(f"Неизвестный идентификатор применения '{ai}' в позиции {pos}")
+        fixed_length, max_length, name = AI_TABLE[ai]
+        start = pos + 2
+
+        if fixed_length is not None:
+            stop = start + fixed_length
+            if stop > end:
+                raise GS1Error(f"Недостаточная длина значения AI {ai} ({name})")
+        else:
+            stop = _next_separator(code, start)
+            if ai == AI_SERIAL and serial_length is not None:
+                stop = min(stop, start + serial_length)
+            if stop - start > max_length:
+                raise GS1Error(f"Превышена длина значения AI {ai} ({name}): {stop - start} > {max_length}")
+
+        yield ai, start, stop
+        pos = stop
+
+
+def parse_element_string(code: str, serial_length: Optional[int] = None) -> Dict[str, str]:
+    """
+    Разбирает код маркировки в словарь {AI: значение}
+
+    Raises:
+        GS1Error: если код не соответствует структуре GS1
+    """
+    return {ai: code[start:stop] for ai, start, stop in iter_elements(code, serial_length)}
+
+
+def extract_gtin(code: str) -> Optional[str]:
+    """Возвращает GTIN (AI 01) из кода или None, если его нет или код некорректен"""
+    if code.startswith(AI_GTIN) and code[2:16].isdigit() and len(code) >= 16:
+        return code[2:16]
+    try:
+        for ai, start, stop in iter_elements(code):
+            if ai == AI_GTIN:
+                return code[start:stop]
+    except GS1Error:
+        return None
+    return None
+
+
+def convert_code(code: str) -> str:
+    """
+    Преобразует код РФ в код РБ: заменяет первый символ серийного номера (AI 21)
+    с 5 на 2
+
+    Для кода в стандартной форме (01<GTIN>21...) серийный номер находится по
+    фиксированному смещению без разбора - в том числе когда разбор невозможен
+    (например, нет разделителя GS перед криптохвостом). Остальные коды
+    разбираются как строки элементов GS1; код, который не удалось разобрать,
+    возвращается без изменений.
+    """
+    if code.startswith(AI_GTIN) and code.startswith(AI_SERIAL, 16):
+        if code.startswith(RF_COUNTRY_DIGIT, _SERIAL_OFFSET):
+            return code[:_SERIAL_OFFSET] + RB_COUNTRY_DIGIT + code[_SERIAL_OFFSET + 1:]
+        return code
+    try:
+        for ai, start, stop in iter_elements(code):
+            if ai == AI_SERIAL:
+                if stop > start and code[start] == RF_COUNTRY_DIGIT:
+                    return code[:start] + RB_COUNTRY_DIGIT + code[start + 1:]
+                return code
+    except GS1Error:
+        return code
+    return code
+
+
+def convert_codes(codes: Iterable[str]) -> List[str]:
+    """
+    Пакетно преобразует список кодов РФ в коды РБ (по правилам convert_code)
+
+    Returns:
+        list: преобразованные коды в исходном порядке
+    """
+    return list(map(convert_code, codes))
+
+
+def iter_convert(codes: Iterable[str], batch_size: int = BATCH_SIZE) -> Iterator[str]:
+    """
+    Лениво преобразует поток кодов пакетами по batch_size штук
+
+    Yields:
+        str: преобразованный код
+    """
+    codes = iter(codes)
+    while True:
+        batch = list(islice(codes, batch_size))
+        if not batch:
+            return
+        yield from convert_codes(batch)
+
+
+def _strip_line(line: bytes) -> bytes:
+    """Снимает пробелы, табуляцию, \\r вокруг кода и BOM в начале строки"""
+    line = line.strip(_LINE_WHITESPACE)
+    if line.startswith(_UTF8_BOM):
+        line = line[len(_UTF8_BOM):].lstrip(_LINE_WHITESPACE)
+    return line
+
+
+def _convert_line_bytes(line: bytes) -> bytes:
+    line = _strip_line(line)
+    try:
+        code = line.decode('utf-8')
+    except UnicodeDecodeError:
+        return line
+    return convert_code(code).encode('utf-8')
+
+
+def _convert_fixed_width(data: bytes, width: int) -> Optional[bytearray]:
+    """
+    Преобразует буфер из строк одинаковой длины по столбцам
+
+    Каждый столбец (i-й байт всех строк) извлекается срезом с шагом width, поэтому
+    проверка структуры и замена цифры страны выполняются за несколько операций над
+    всем буфером без цикла по кодам. Возвращает None, если хотя бы один код не в
+    стандартной форме или строку нужно очистить (пробелы, \\r, BOM): первый
+    столбец - цифра 0, а перед переводом строки нет пробельного символа.
+    """
+    rows = len(data) // width
+    if width <= _SERIAL_OFFSET + 1:
+        return None
+    if data[width - 1::width] != b'\n' * rows:
+        return None
+    if data[0::width] != b'0' * rows or data[1::width] != b'1' * rows:
+        return None
+    if data[16::width] != b'2' * rows or data[17::width] != b'1' * rows:
+        return None
+    if len(data[width - 2::width].translate(None, _LINE_WHITESPACE)) != rows:
+        return None
+
+    buffer = bytearray(data)
+    buffer[_SERIAL_OFFSET::width] = data[_SERIAL_OFFSET::width].replace(_RF_DIGIT_BYTES, _RB_DIGIT_BYTES)
+    return buffer
+
+
+def convert_buffer(data: bytes) -> bytes:
+    """
+    Преобразует буфер байт с кодами (один код на строку, UTF-8) одним проходом
+
+    Буфер должен заканчиваться переводом строки; переводы строк сохраняются, а
+    пробелы, табуляция и \\r вокруг кода и BOM в начале строки снимаются (выгрузки
+    сканеров с CRLF, лишними пробелами или BOM). Если все строки одной длины и в стандартной форме (типичный файл одной
+    товарной группы), замена выполняется побайтно по столбцам, иначе - построчно.
+
+    Returns:
+        bytes-подобный объект (bytes или bytearray) с преобразованными кодами
+    """
+    if not data:
+        return data
+
+    width = data.find(b'\n') + 1
+    if width and len(data) % width == 0:
+        converted = _convert_fixed_width(data, width)
+        if converted is not None:
+            return converted
+
+    return b'\n'.join(_convert_line_bytes(line) if line else line for line in data.split(b'\n'))
+
+
+def split_by_gtin(codes: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Группирует коды по GTIN (AI 01)
+
+    Коды без GTIN в стандартной позиции разбираются посимвольно; коды, в которых
+    GTIN не найден, пропускаются.
+
+    Returns:
+        dict: {gtin: [список кодов для этого GTIN]}
+    """
+    gtin_to_codes = {}
+    for code in codes:
+        if code.startswith(AI_GTIN) and code[2:16].isdigit() and len(code) >= 16:
+            gtin = code[2:16]
+        else:
+            gtin = extract_gtin(code)
+            if not gtin:
+                continue
+        codes_list = gtin_to_codes.get(gtin)
+        if codes_list is None:
+            gtin_to_codes[gtin] = codes_list = []
+        codes_list.append(code)
+
+    return gtin_to_codes
+
+
+class StreamConverter:
+    """
+    Потоковый конвертер кодов, принимающий данные блоками произвольного размера
+
+    Каждый блок обрезается по последнему переводу строки, полные строки
+    преобразуются через convert_buffer, а неполная строка переносится в следующий
+    блок. Объем памяти ограничен размером одного блока.
+    """
+
+    def __init__(self):
+        self._tail = b''
+        self.lines = 0
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Принимает очередной блок и возвращает преобразованные полные строки"""
+        data = self._tail + chunk if self._tail else chunk
+        cut = data.rfind(b'\n') + 1
+        self._tail = data[cut:]
+        if not cut:
+            return b''
+        block = data[:cut]
+        self.lines += block.count(b'\n')
+        return convert_buffer(block)
+
+    def flush(self) -> bytes:
+        """Преобразует последнюю строку без завершающего перевода строки"""
+        if not self._tail:
+            return b''
+        data, self._tail = self._tail + b'\n', b''
+        self.lines += 1
+        return convert_buffer(data)
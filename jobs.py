@@ -0,0 +1,257 @@
+"""
+Очередь фоновых заданий для процесса ввода в оборот
+
+Задания выполняются ограниченным пулом потоков; HTTP-запрос только ставит
+задание в очередь и сразу возвращает его идентификатор, а состояние и
+промежуточные шаги доступны по идентификатору задания.
+
+Если задано общее хранилище (shared_state), снимки заданий сохраняются в
+него, поэтому состояние задания доступно любому процессу приложения, а не
+только выполняющему его. Выполняющий процесс периодически отмечает активность
+своих заданий; задание без отметки дольше трех периодов считается прерванным
+(процесс остановлен) и может быть продолжено.
+"""
+
+import copy
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from config import JOB_SYNC_INTERVAL, JOB_HEARTBEAT_INTERVAL
+from events import EVENT_JOB
+from metrics import JOBS, JOB_SECONDS, JOB_QUEUE_SECONDS
+from shared_state import worker_id
+
+logger = logging.getLogger(__name__)
+
+# Статусы задания
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+# Через сколько периодов без отметки активности задание считается прерванным
+HEARTBEAT_MISSES = 3
+
+
+def is_interrupted(snapshot: dict, now: Optional[float] = None) -> bool:
+    """Незавершенное задание из общего хранилища, процесс которого перестал отмечать активность"""
+    if snapshot['status'] in FINISHED_STATUSES:
+        return False
+    return (now or time.time()) - snapshot['heartbeat_at'] > JOB_HEARTBEAT_INTERVAL * HEARTBEAT_MISSES
+
+
+class Job:
+    """Задание: идентификатор, статус и снимок результата обработки"""
+
+    def __init__(self, result: dict, job_id: Optional[str] = None, events=None, store=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.events = events
+        self.store = store
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._result = copy.deepcopy(result)
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+        self._dirty = False
+
+    def update(self, result: dict):
+        """Сохраняет снимок результата (вызывается из потока задания)"""
+        snapshot = copy.deepcopy(result)
+        with self._lock:
+            previous, self._result = self._result, snapshot
+        if self.events is not None:
+            self.events.publish_result(self.id, previous, snapshot)
+        self.sync()
+
+    def set_status(self, status: str):
+        self.status = status
+        self.sync(force=True)
+        if self.events is not None:
+            finished = status in FINISHED_STATUSES
+            data = self.to_dict() if finished else {'job_id': self.id, 'status': status}
+            self.events.publish(self.id, EVENT_JOB, data, final=finished)
+
+    def sync(self, force: bool = False):
+        """
+        Сохраняет снимок в общее хранилище - не чаще JOB_SYNC_INTERVAL, если не force;
+        отложенный снимок сохраняется при следующей отметке активности
+        """
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < JOB_SYNC_INTERVAL:
+            self._dirty = True
+            return
+        self._synced_at = now
+        self._dirty = False
+        try:
+            self.store.save_job(self.to_dict(), worker_id())
+        except Exception as e:
+            self._dirty = True
+            logger.warning(f"Не удалось сохранить задание {self.id} в общее хранилище: {e}")
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'error': self.error,
+                'result': self._result
+            }
+
+
+class JobManager:
+    """
+    Выполняет задания в ограниченном пуле потоков и хранит их состояние
+
+    Завершенные задания хранятся job_ttl секунд, после чего удаляются. Если
+    передана шина событий (events.EventBus), в нее публикуются изменения шагов
+    и статуса заданий. Если передано общее хранилище (shared_state.SharedStore),
+    в него сохраняются снимки заданий и отметки активности.
+    """
+
+    def __init__(self, max_workers: int, job_ttl: int, events=None, store=None):
+        self.job_ttl = job_ttl
+        self.events = events
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if store is not None:
+            threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+
+    def submit(self, result: dict, target: Callable[[dict, Callable[[dict], None]], dict],
+               job_id: Optional[str] = None) -> Job:
+        """
+        Ставит задание в очередь
+
+        Args:
+            result: начальный результат обработки (со списком steps)
+            target: функция target(result, on_update) -> result, выполняющая обработку
+            job_id: идентификатор задания (при продолжении запуска - прежний); по умолчанию новый
+
+        Returns:
+            Job: созданное задание
+
+        Raises:
+            ValueError: задание с таким идентификатором еще выполняется (в этом или другом процессе)
+        """
+        self._cleanup()
+        if job_id and self.store is not None:
+            shared = self.store.get_job(job_id)
+            if shared is not None and shared['owner'] != worker_id() and \
+                    shared['status'] not in FINISHED_STATUSES and not is_interrupted(shared):
+                raise ValueError(f"Задание {job_id} еще выполняется другим процессом")
+        job = Job(result, job_id, self.events, self.store)
+        with self._lock:
+            current = self._jobs.get(job.id)
+            if current is not None and current.status not in FINISHED_STATUSES:
+                raise ValueError(f"Задание {job.id} еще выполняется")
+            self._jobs[job.id] = job
+        job.sync(force=True)
+        self._executor.submit(self._run, job, result, target)
+        logger.info(f"Задание {job.id} поставлено в очередь")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Задание, выполняемое (или выполненное) этим процессом"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def lookup(self, job_id: str) -> Optional[dict]:
+        """
+        Снимок задания (Job.to_dict) этого процесса или, если его нет, из общего хранилища
+
+        Задание другого процесса, переставшего отмечать активность, возвращается
+        со статусом failed и признаком interrupted.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.store is None:
+            return None
+        snapshot = self.store.get_job(job_id)
+        if snapshot is None:
+            return None
+        if is_interrupted(snapshot):
+            snapshot.update(status=JOB_FAILED, interrupted=True,
+                            error='Процесс, выполнявший задание, остановлен')
+        snapshot.pop('owner', None)
+        snapshot.pop('heartbeat_at', None)
+        return snapshot
+
+    def stop(self):
+        """Останавливает отметку активности (задания этого процесса станут прерванными)"""
+        self._stop.set()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(JOB_HEARTBEAT_INTERVAL):
+            with self._lock:
+                active = [job for job in self._jobs.values() if job.status not in FINISHED_STATUSES]
+            try:
+                for job in active:
+                    if job.dirty:
+                        job.sync(force=True)
+                self.store.touch_jobs([job.id for job in active], worker_id())
+            except Exception as e:
+                logger.warning(f"Не удалось отметить активность заданий: {e}")
+
+    def _run(self, job: Job, result: dict, target):
+        job.started_at = time.time()
+        JOB_QUEUE_SECONDS.observe(job.started_at - job.created_at)
+        job.set_status(JOB_RUNNING)
+        logger.info(f"Задание {job.id} запущено")
+        status = JOB_FAILED
+        try:
+            result = target(result, job.update)
+            job.update(result)
+            status = JOB_COMPLETED if result.get('success') else JOB_FAILED
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            logger.error(f"Критическая ошибка в задании {job.id}: {e}\n{error_trace}")
+            result['success'] = False
+            result['error'] = str(e)
+            result['trace'] = error_trace
+            job.update(result)
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            JOBS.labels(status).inc()
+            JOB_SECONDS.labels(status).observe(job.finished_at - job.started_at)
+            job.set_status(status)
+            logger.info(f"Задание {job.id} завершено со статусом {job.status}")
+
+    def _cleanup(self):
+        """Удаляет завершенные задания старше job_ttl"""
+        deadline = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.status in FINISHED_STATUSES and job.finished_at < deadline]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.prune_jobs(deadline)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить старые задания из общего хранилища: {e}")
+        if self.events is not None:
+            for job_id in expired:
+                self.events.discard(job_id)
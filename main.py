@@ -1,14 +1,69 @@
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import List
-import tempfile
-import os
-from file_parser import parse_product_file, parse_codes_file
+from starlette.routing import Match
+from contextlib import asynccontextmanager
+from itertools import chain
+from typing import AsyncIterator, Iterator, List
+import time
+import zlib
+from config import ARTIFACTS_DIR, ARTIFACT_TTL, ARTIFACTS_MAX_BYTES, RESULT_CACHE_ENABLED
+from file_parser import GzipDecompressor, iter_product_file, iter_codes_file, text_format
+from result_cache import CONVERSION_PARAMS, ResultCache, cache_key, etag, etag_matches, iter_code_list
+import gs1
+import metrics
 
-app = FastAPI(title="RF to RB Code Converter", description="Преобразование российских кодов маркировки в белорусский стандарт")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запуск воркера: сохранение метрик процесса для /metrics других воркеров (METRICS_MULTIPROC_DIR)"""
+    metrics.start_multiprocess()
+    yield
+
+
+app = FastAPI(title="RF to RB Code Converter", description="Преобразование российских кодов маркировки в белорусский стандарт",
+              lifespan=lifespan)
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: количество и длительность запросов по шаблону адреса.
+    Не перехватывает тело запроса, поэтому не мешает потоковым эндпоинтам.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        route = _route_path(scope)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.HTTP_REQUESTS.labels('fastapi', scope['method'], route, status).inc()
+            metrics.HTTP_REQUEST_SECONDS.labels('fastapi', scope['method'], route).observe(time.perf_counter() - started)
+
+
+def _route_path(scope) -> str:
+    for route in app.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+app.add_middleware(MetricsMiddleware)
 
 # Монтирование статических файлов
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -16,39 +71,44 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Шаблоны
 templates = Jinja2Templates(directory="templates")
 
+# Размер блока при чтении загруженного файла в потоковом режиме
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Количество кодов в одном блоке ответа /convert/download
+DOWNLOAD_BATCH_SIZE = 10000
+
+# Результаты преобразования для скачивания: файл на каждый различный вход (ключ -
+# хэш содержимого) в общем каталоге, поэтому результат доступен любому процессу
+# (uvicorn --workers), а повторный запрос с теми же данными отдается из кэша
+result_cache = ResultCache(ARTIFACTS_DIR, ARTIFACT_TTL, ARTIFACTS_MAX_BYTES, RESULT_CACHE_ENABLED)
+
+
 class ConvertRequest(BaseModel):
     codes: List[str]
 
+
 def convert_rf_to_rb(code: str) -> str:
     """
     Преобразует российский код маркировки в белорусский стандарт.
-    Заменяет первую цифру после '21' с 5 (РФ) на 2 (Беларусь).
-    
+    Заменяет первую цифру серийного номера (AI 21) с 5 (РФ) на 2 (Беларусь).
+    Позиция серийного номера определяется так же, как в пакетном преобразовании
+    (gs1.convert_code): по фиксированному смещению для стандартной формы, иначе разбором кода GS1.
+
     Args:
         code (str): Исходный код маркировки
-        
+
     Returns:
         str: Преобразованный код
     """
-    # Найти позицию '21'
-    pos = code.find('21')
-    if pos == -1:
-        # Если '21' не найдено, вернуть без изменений
-        return code
-    
-    # Проверить, что после '21' есть хотя бы один символ и он равен '5'
-    if pos + 2 < len(code) and code[pos + 2] == '5':
-        # Заменить '5' на '2'
-        return code[:pos + 2] + '2' + code[pos + 3:]
-    else:
-        # Если не '5', вернуть без изменений
-        return code
+    return gs1.convert_code(code)
+
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """Главная страница с формой загрузки файлов"""
     return templates.TemplateResponse("index.html", {"request": request})
 
+
 @app.post("/process", response_class=HTMLResponse)
 async def process_files(
     request: Request,
@@ -58,95 +118,303 @@ async def process_files(
     """
     Обрабатывает загруженные файлы и преобразует коды.
     Возвращает страницу с результатом и ссылкой на скачивание.
+    Файлы - текст, CSV или XLSX, в том числе в архивах gzip и zip (UTF-8 или CP1251).
     """
     try:
         # Проверка файлов
         if not product_file.filename or not codes_file.filename:
             raise HTTPException(status_code=400, detail="Необходимо загрузить оба файла")
-        
-        # Чтение содержимого файлов
-        product_content = await product_file.read()
-        codes_content = await codes_file.read()
-        
-        # Декодирование
-        product_text = product_content.decode('utf-8')
-        codes_text = codes_content.decode('utf-8')
-        
-        # Парсинг файлов
-        products = parse_product_file(product_text)
-        codes = parse_codes_file(codes_text)
-        
-        # Преобразование кодов
-        converted_codes = [convert_rf_to_rb(code) for code in codes]
-        
-        # Создание файла для скачивания в static
-        file_path = "static/converted_codes.txt"
-        with open(file_path, 'w', encoding='utf-8') as f:
-            for code in converted_codes:
-                f.write(code + '\n')
-        
-        download_url = "/static/converted_codes.txt"
-        
+
+        # Хэширование, разбор и преобразование - блокирующие чтение файлов и работа процессора:
+        # выполняются в пуле потоков, чтобы не останавливать цикл событий для других запросов
+        products_count, key, codes_count = await run_in_threadpool(_process_uploads, product_file, codes_file)
+
+        download_url = f"/download/{key}"
+
         return templates.TemplateResponse("result.html", {
             "request": request,
-            "products_count": len(products),
-            "codes_count": len(codes),
-            "converted_count": len(converted_codes),
+            "products_count": products_count,
+            "codes_count": codes_count,
+            "converted_count": codes_count,
             "download_url": download_url
         })
-        
+
     except Exception as e:
         return templates.TemplateResponse("error.html", {
             "request": request,
             "error": str(e)
         })
 
+
+@app.get("/download/{artifact_id}")
+async def download_result(artifact_id: str, request: Request):
+    """
+    Скачивание результата /process (хранится ARTIFACT_TTL секунд с последнего обращения).
+    Идентификатор результата - его ETag: при совпадении If-None-Match возвращается 304.
+    """
+    path = result_cache.path(artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Результат не найден или устарел")
+    if etag_matches(request.headers.get('if-none-match'), artifact_id):
+        metrics.RESULT_CACHE_REQUESTS.labels('/download', 'not_modified').inc()
+        return Response(status_code=304, headers=_cache_headers(artifact_id))
+    return FileResponse(path, media_type='text/plain; charset=utf-8', filename='converted_codes.txt',
+                        headers=_cache_headers(artifact_id))
+
+
+def _process_uploads(product_file: UploadFile, codes_file: UploadFile):
+    """
+    Разбирает файл товаров и преобразует коды (с записью в кэш результатов)
+
+    Returns:
+        tuple: (количество товаров, ключ результата, количество кодов)
+    """
+    # Потоковый парсинг файлов: содержимое читается (и распаковывается) блоками и не хранится целиком в памяти
+    started = time.perf_counter()
+    products_count = sum(1 for _ in iter_product_file(product_file.file, filename=product_file.filename))
+    metrics.observe_parse('fastapi', 'products', products_count, time.perf_counter() - started)
+
+    # Ключ результата - хэш содержимого файла кодов: повторно загруженный файл не преобразуется.
+    # Архивы и XLSX определяются по содержимому, CSV - по имени файла, поэтому оно тоже входит в ключ
+    params = {**CONVERSION_PARAMS, 'input': text_format(codes_file.filename)}
+    key = cache_key(params, _iter_file_chunks(codes_file.file))
+    codes_file.file.seek(0)
+    entry = result_cache.get(key)
+    if entry is not None:
+        codes_count = entry.meta['codes_count']
+        metrics.RESULT_CACHE_REQUESTS.labels('/process', 'hit').inc()
+    else:
+        metrics.RESULT_CACHE_REQUESTS.labels('/process', 'miss').inc()
+        # Преобразование кодов с записью в файл результата для скачивания
+        codes_count = 0
+        started = time.perf_counter()
+        with result_cache.create(key) as (f, meta):
+            for code in gs1.iter_convert(iter_codes_file(codes_file.file, filename=codes_file.filename)):
+                f.write(code + '\n')
+                codes_count += 1
+            meta['codes_count'] = codes_count
+        _observe_conversion('/process', codes_count, time.perf_counter() - started)
+    return products_count, key, codes_count
+
+
+def _iter_file_chunks(f) -> Iterator[bytes]:
+    return iter(lambda: f.read(STREAM_CHUNK_SIZE), b'')
+
+
+def _cache_headers(key: str) -> dict:
+    # Содержимое результата определяется ключом и не меняется
+    return {'ETag': etag(key), 'Cache-Control': f'private, max-age={ARTIFACT_TTL}'}
+
+
+def _observe_conversion(endpoint: str, codes_count: int, seconds: float):
+    metrics.CONVERT_BATCH_CODES.labels(endpoint).observe(codes_count)
+    metrics.CONVERT_SECONDS.labels(endpoint).observe(seconds)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики процесса в формате Prometheus"""
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
 # Старые endpoints для API (опционально)
 @app.post("/convert")
 async def convert_codes(request: ConvertRequest):
     """
     Преобразует список кодов из РФ в РБ стандарт.
-    
+
     Принимает JSON: {"codes": ["code1", "code2", ...]}
     Возвращает JSON: {"converted_codes": ["new_code1", "new_code2", ...]}
     """
     if not request.codes:
         raise HTTPException(status_code=400, detail="Список кодов не может быть пустым")
-    
-    converted_codes = [convert_rf_to_rb(code) for code in request.codes]
-    
+
+    started = time.perf_counter()
+    converted_codes = gs1.convert_codes(request.codes)
+    _observe_conversion('/convert', len(request.codes), time.perf_counter() - started)
+
     return {"converted_codes": converted_codes}
 
+
 @app.post("/convert/download")
-async def convert_and_download(request: ConvertRequest):
+async def convert_and_download(request: ConvertRequest, http_request: Request):
     """
     Преобразует список кодов и возвращает файл для скачивания.
-    
+
     Принимает JSON: {"codes": ["code1", "code2", ...]}
-    Возвращает файл converted_codes.txt
+    Возвращает файл converted_codes.txt с ETag - хэшем списка кодов. Повторный
+    запрос с тем же списком отдается из кэша, а с If-None-Match - ответом 304.
     """
     if not request.codes:
         raise HTTPException(status_code=400, detail="Список кодов не может быть пустым")
-    
-    converted_codes = [convert_rf_to_rb(code) for code in request.codes]
-    
-    # Создать временный файл
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
-        for code in converted_codes:
-            f.write(code + '\n')
-        temp_file_path = f.name
-    
-    # Вернуть файл для скачивания
-    response = FileResponse(
-        path=temp_file_path,
-        filename="converted_codes.txt",
-        media_type='text/plain'
+
+    key = cache_key({**CONVERSION_PARAMS, 'input': 'list'}, iter_code_list(request.codes))
+    entry = result_cache.get(key)
+    if etag_matches(http_request.headers.get('if-none-match'), key, exists=entry is not None):
+        metrics.RESULT_CACHE_REQUESTS.labels('/convert/download', 'not_modified').inc()
+        return Response(status_code=304, headers=_cache_headers(key))
+    headers = {"Content-Disposition": "attachment; filename=converted_codes.txt", **_cache_headers(key)}
+    if entry is not None:
+        metrics.RESULT_CACHE_REQUESTS.labels('/convert/download', 'hit').inc()
+        return FileResponse(entry.path, media_type='text/plain', headers=headers)
+    metrics.RESULT_CACHE_REQUESTS.labels('/convert/download', 'miss').inc()
+
+    def iter_content():
+        # Ответ формируется блоками и одновременно сохраняется в кэш результатов
+        elapsed = 0.0
+        with result_cache.create(key, encoding=None) as (f, meta):
+            for start in range(0, len(request.codes), DOWNLOAD_BATCH_SIZE):
+                started = time.perf_counter()
+                batch = gs1.convert_codes(request.codes[start:start + DOWNLOAD_BATCH_SIZE])
+                elapsed += time.perf_counter() - started
+                data = ('\n'.join(batch) + '\n').encode('utf-8')
+                f.write(data)
+                yield data
+            meta['codes_count'] = len(request.codes)
+        _observe_conversion('/convert/download', len(request.codes), elapsed)
+
+    return StreamingResponse(iter_content(), media_type='text/plain', headers=headers)
+
+
+async def _iter_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    """Читает загруженный файл блоками"""
+    while True:
+        chunk = await upload.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _iter_gunzip(chunks: AsyncIterator[bytes], decompressor: GzipDecompressor,
+                       started: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Распаковывает поток gzip по мере поступления блоков (см. file_parser.GzipDecompressor);
+    started - уже начатая распаковка первого блока
+    """
+    for data in started:
+        yield data
+    async for chunk in chunks:
+        for data in decompressor.decompress(chunk):
+            yield data
+    decompressor.finish()
+
+
+async def _iter_converted(chunks: AsyncIterator[bytes], gzip_output: bool, endpoint: str) -> AsyncIterator[bytes]:
+    """
+    Преобразует поток блоков с кодами (один код на строку) на лету.
+    При необходимости сжимает результат gzip.
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip_output else None
+    converter = gs1.StreamConverter()
+
+    def emit(data: bytes) -> bytes:
+        # convert_buffer может вернуть bytearray, а StreamingResponse принимает только bytes и str
+        return compressor.compress(data) if compressor else bytes(data)
+
+    elapsed = 0.0
+    async for chunk in chunks:
+        started = time.perf_counter()
+        out = emit(converter.feed(chunk))
+        elapsed += time.perf_counter() - started
+        if out:
+            yield out
+
+    tail = emit(converter.flush())
+    if compressor:
+        tail += compressor.flush()
+    _observe_conversion(endpoint, converter.lines, elapsed)
+    if tail:
+        yield tail
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Chunked-ответ, который отправляется одновременно с чтением тела запроса.
+    Стандартный StreamingResponse параллельно ожидает отключения клиента через
+    receive() и перехватывает блоки еще не прочитанного тела запроса.
+    """
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Принимает ли клиент gzip по Accept-Encoding с учетом q (gzip;q=0 и *;q=0 - не принимает)"""
+    qualities = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+async def _streaming_convert_response(request: Request, chunks: AsyncIterator[bytes], gzip_input: bool,
+                                      endpoint: str) -> DuplexStreamingResponse:
+    """
+    Формирует chunked-ответ с преобразованными кодами, сжатый gzip, если клиент его поддерживает.
+    Сжатый вход распаковывается с ограничением размера; первый блок - до начала ответа,
+    чтобы поврежденный gzip получил ответ 400, а не оборванный поток с кодом 200.
+    """
+    if gzip_input:
+        decompressor = GzipDecompressor()
+        chunks = chunks.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = b''
+        started = decompressor.decompress(first)
+        try:
+            head = next(started, b'')
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        chunks = _iter_gunzip(chunks, decompressor, chain((head,), started))
+    gzip_output = _accepts_gzip(request.headers.get('accept-encoding', ''))
+    headers = {"Content-Disposition": "attachment; filename=converted_codes.txt"}
+    if gzip_output:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return DuplexStreamingResponse(
+        _iter_converted(chunks, gzip_output, endpoint),
+        media_type='text/plain; charset=utf-8',
+        headers=headers
     )
-    
-    response.headers["Content-Disposition"] = "attachment; filename=converted_codes.txt"
-    
-    return response
+
+
+@app.post("/convert/stream")
+async def convert_stream(request: Request):
+    """
+    Потоковое преобразование кодов.
+
+    Принимает тело запроса с кодами (text/plain, один код на строку), в том числе
+    сжатое gzip (Content-Encoding: gzip). Тело читается по мере поступления,
+    коды преобразуются на лету и возвращаются chunked-ответом; результат не
+    хранится целиком ни в памяти, ни на диске. Если клиент передал
+    Accept-Encoding: gzip, ответ сжимается.
+    """
+    gzip_input = request.headers.get('content-encoding', '').lower() == 'gzip'
+    return await _streaming_convert_response(request, request.stream(), gzip_input, '/convert/stream')
+
+
+@app.post("/convert/stream/file")
+async def convert_stream_file(request: Request, codes_file: UploadFile = File(...)):
+    """
+    Потоковое преобразование загруженного файла с кодами (multipart/form-data).
+
+    Файл читается блоками и возвращается chunked-ответом так же, как в /convert/stream.
+    Файлы с расширением .gz распаковываются на лету.
+    """
+    gzip_input = (codes_file.filename or '').lower().endswith('.gz')
+    return await _streaming_convert_response(request, _iter_upload(codes_file), gzip_input, '/convert/stream/file')
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
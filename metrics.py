@@ -0,0 +1,490 @@
+"""
+Метрики приложения в формате Prometheus (text exposition format 0.0.4)
+
+Счетчики и гистограммы хранятся в памяти процесса и отдаются эндпоинтом
+/metrics (app.py и main.py). Запись значения - поиск ячейки в словаре и
+инкремент под блокировкой метрики, поэтому на горячих участках метрики
+обновляются один раз на запрос, пакет или шаг, а не на каждый код.
+
+    API_CALL_SECONDS.labels('order_codes', 'ok').observe(0.25)
+    with PIPELINE_STEP_SECONDS.labels(...).time(): ...
+
+Несколько процессов (uvicorn --workers): при заданном METRICS_MULTIPROC_DIR
+каждый процесс раз в METRICS_FLUSH_INTERVAL секунд сохраняет свои значения в
+файл этого каталога (start_multiprocess), а /metrics любого процесса отдает
+значения всех процессов: счетчики и гистограммы суммируются (в том числе
+завершившихся процессов, чтобы счетчики не уменьшались), текущие значения
+(Gauge) отдаются по работающим процессам с меткой worker. Горячие участки при
+этом не меняются - запись в файл идет в отдельном потоке.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import METRICS_MULTIPROC_DIR, METRICS_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм длительности в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+# Границы корзин размеров (количество кодов, строк)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+# Границы корзин пропускной способности разбора (строк в секунду)
+RATE_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 2e6, 5e6, 1e7)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ''
+    # Значения процессов отдаются по отдельности (метка worker), а не суммируются
+    per_process = False
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Значение метрики для набора меток (в порядке labelnames)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f'{self.name}: ожидаются метки {self.labelnames}')
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Новое значение метрики для набора меток"""
+
+    @abstractmethod
+    def _read(self, child):
+        """Значение для набора меток в виде, сохраняемом в JSON"""
+
+    @abstractmethod
+    def _samples(self, labelnames: Sequence[str], values: Dict[Tuple[str, ...], object]) -> List[str]:
+        """Строки значений метрики в текстовом формате Prometheus"""
+
+    def _merge(self, total, value):
+        """Сумма значений двух процессов"""
+        return total + value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        """Значения метрики процесса по наборам меток"""
+        return {key: self._read(child) for key, child in list(self._children.items())}
+
+    def render(self, values: Optional[Dict[Tuple[str, ...], object]] = None,
+               labelnames: Optional[Sequence[str]] = None) -> str:
+        """
+        Args:
+            values: значения по наборам меток (по умолчанию - значения процесса)
+            labelnames: названия меток values (по умолчанию - labelnames метрики)
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples(labelnames or self.labelnames, self.snapshot() if values is None else values))
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+    def _reset_after_fork(self):
+        # Значения и блокировка родителя (могла быть захвачена другим его потоком) процессу не принадлежат
+        self._children = {}
+        self._lock = threading.Lock()
+
+
+class _CounterValue:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name + '_total', documentation, labelnames)
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        """Увеличивает счетчик без меток"""
+        self.labels().inc(amount)
+
+    def _read(self, child: _CounterValue) -> float:
+        return child.value
+
+    def _samples(self, labelnames: Sequence[str], values: Dict[Tuple[str, ...], float]) -> List[str]:
+        return [f'{self.name}{_format_labels(labelnames, key)} {_format_value(value)}'
+                for key, value in values.items()]
+
+
+class _GaugeValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """Текущее значение"""
+
+    kind = 'gauge'
+    per_process = True
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        """Устанавливает значение без меток"""
+        self.labels().set(value)
+
+    def _read(self, child: _GaugeValue) -> float:
+        return float(child.value)
+
+    def _samples(self, labelnames: Sequence[str], values: Dict[Tuple[str, ...], float]) -> List[str]:
+        return [f'{self.name}{_format_labels(labelnames, key)} {_format_value(float(value))}'
+                for key, value in values.items()]
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Записывает длительность блока with в секундах"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        """Записывает значение гистограммы без меток"""
+        self.labels().observe(value)
+
+    def _read(self, child: _HistogramValue) -> list:
+        """[количества по корзинам, сумма, количество]"""
+        with child._lock:
+            return [list(child.counts), child.sum, child.count]
+
+    def _merge(self, total: list, value: list) -> list:
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def _samples(self, labelnames: Sequence[str], values: Dict[Tuple[str, ...], list]) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(labelnames, key, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+# Метка процесса для значений Gauge в многопроцессном режиме
+WORKER_LABEL = 'worker'
+
+_SNAPSHOT_SUFFIX = '.json'
+
+# (pid, файл значений процесса) и pid процесса, в котором запущено сохранение
+_snapshot_file: Optional[Tuple[int, str]] = None
+_flushing_pid: Optional[int] = None
+_multiprocess_lock = threading.Lock()
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus: процесса или (METRICS_MULTIPROC_DIR) всех процессов"""
+    if not METRICS_MULTIPROC_DIR:
+        return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+    write_snapshot()
+    values = _collect()
+    return '\n'.join(
+        metric.render(values[metric.name], metric.labelnames + (WORKER_LABEL,) if metric.per_process else None)
+        for metric in REGISTRY
+    ) + '\n'
+
+
+def _reset_after_fork():
+    global _multiprocess_lock, _flushing_pid
+    _multiprocess_lock = threading.Lock()
+    _flushing_pid = None
+    for metric in REGISTRY:
+        metric._reset_after_fork()
+
+
+# Процесс, созданный fork (gunicorn --preload, multiprocessing), начинает с нулевых значений:
+# иначе значения родителя суммировались бы дважды - из его файла и из файла процесса
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start_multiprocess():
+    """
+    Запускает сохранение значений процесса в METRICS_MULTIPROC_DIR раз в
+    METRICS_FLUSH_INTERVAL секунд и при завершении; вызывается при запуске
+    воркера. Без METRICS_MULTIPROC_DIR ничего не делает.
+    """
+    global _flushing_pid
+    if not METRICS_MULTIPROC_DIR:
+        return
+    with _multiprocess_lock:
+        if _flushing_pid == os.getpid():
+            return
+        _flushing_pid = os.getpid()
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+    atexit.register(_flush)
+
+
+def write_snapshot():
+    """Сохраняет значения метрик процесса в его файл в METRICS_MULTIPROC_DIR (файл заменяется целиком)"""
+    path = _snapshot_path()
+    data = {
+        'pid': os.getpid(),
+        'metrics': {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                    for metric in REGISTRY},
+    }
+    partial = f'{path}.{threading.get_ident()}.tmp'
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(partial, path)
+
+
+def _snapshot_path() -> str:
+    # Файл определяется при первом обращении в процессе: после fork у воркера свой файл
+    global _snapshot_file
+    pid = os.getpid()
+    with _multiprocess_lock:
+        if _snapshot_file is None or _snapshot_file[0] != pid:
+            os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+            name = f'{pid}-{uuid.uuid4().hex[:8]}{_SNAPSHOT_SUFFIX}'
+            _snapshot_file = (pid, os.path.join(METRICS_MULTIPROC_DIR, name))
+        return _snapshot_file[1]
+
+
+def _flush():
+    try:
+        write_snapshot()
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить метрики процесса в {METRICS_MULTIPROC_DIR}: {e}")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        _flush()
+
+
+def _read_snapshots() -> Iterator[dict]:
+    for entry in os.scandir(METRICS_MULTIPROC_DIR):
+        if not entry.name.endswith(_SNAPSHOT_SUFFIX):
+            continue
+        try:
+            with open(entry.path, encoding='utf-8') as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            # Файл удален или поврежден - значения процесса пропускаются
+            continue
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect() -> Dict[str, Dict[Tuple[str, ...], object]]:
+    """Значения всех процессов из METRICS_MULTIPROC_DIR: {название метрики: {набор меток: значение}}"""
+    values: Dict[str, Dict[Tuple[str, ...], object]] = {metric.name: {} for metric in REGISTRY}
+    for snapshot in _read_snapshots():
+        pid = snapshot['pid']
+        alive = None
+        for metric in REGISTRY:
+            items = snapshot['metrics'].get(metric.name)
+            if not items:
+                continue
+            merged = values[metric.name]
+            if metric.per_process:
+                # Текущие значения завершившихся процессов не отдаются
+                if alive is None:
+                    alive = _process_alive(pid)
+                if alive:
+                    for key, value in items:
+                        merged[tuple(key) + (str(pid),)] = value
+                continue
+            for key, value in items:
+                key = tuple(key)
+                merged[key] = metric._merge(merged[key], value) if key in merged else value
+    return values
+
+
+# Процесс ввода в оборот
+
+PIPELINE_STEP_SECONDS = Histogram(
+    'datamark_pipeline_step_seconds', 'Длительность шага процесса ввода в оборот',
+    ('step', 'name', 'status'))
+JOBS = Counter('datamark_jobs', 'Завершенные фоновые задания по статусу', ('status',))
+JOB_SECONDS = Histogram('datamark_job_seconds', 'Длительность выполнения фонового задания', ('status',))
+JOB_QUEUE_SECONDS = Histogram('datamark_job_queue_seconds', 'Время ожидания задания в очереди')
+
+# Клиент API Datamark
+
+API_CALL_SECONDS = Histogram(
+    'datamark_api_call_seconds', 'Длительность вызова метода APIClient', ('call', 'outcome'))
+API_REQUESTS = Counter(
+    'datamark_api_requests', 'HTTP-запросы к API Datamark по методу клиента и коду ответа', ('call', 'status'))
+API_REQUEST_SECONDS = Histogram(
+    'datamark_api_request_seconds', 'Длительность HTTP-запроса к API Datamark', ('call',))
+API_RETRIES = Counter(
+    'datamark_api_retries', 'Повторы запросов к API Datamark по причине', ('call', 'reason'))
+API_CONCURRENCY_LIMIT = Gauge(
+    'datamark_api_concurrency_limit', 'Текущий лимит одновременных запросов к API Datamark')
+API_RATE_LIMIT_WAIT = Counter(
+    'datamark_api_rate_limit_wait_seconds', 'Время ожидания маркера ограничителя частоты', ('endpoint',))
+
+# Разбор файлов и преобразование кодов
+
+PARSE_LINES = Counter('datamark_parse_lines', 'Разобранные строки загруженных файлов', ('app', 'file'))
+PARSE_SECONDS = Counter('datamark_parse_seconds', 'Время разбора загруженных файлов', ('app', 'file'))
+PARSE_LINES_PER_SECOND = Histogram(
+    'datamark_parse_lines_per_second', 'Скорость разбора файла (строк в секунду)', ('app', 'file'),
+    buckets=RATE_BUCKETS)
+CONVERT_BATCH_CODES = Histogram(
+    'datamark_convert_batch_codes', 'Количество кодов, преобразованных одним запросом', ('endpoint',),
+    buckets=SIZE_BUCKETS)
+CONVERT_SECONDS = Histogram('datamark_convert_seconds', 'Длительность преобразования кодов', ('endpoint',))
+RESULT_CACHE_REQUESTS = Counter(
+    'datamark_result_cache_requests', 'Обращения к кэшу результатов преобразования по исходу (hit, miss, not_modified)',
+    ('endpoint', 'outcome'))
+
+# HTTP-запросы к приложениям
+
+HTTP_REQUESTS = Counter(
+    'datamark_http_requests', 'Запросы к приложению по адресу и коду ответа', ('app', 'method', 'route', 'status'))
+HTTP_REQUEST_SECONDS = Histogram(
+    'datamark_http_request_seconds', 'Длительность обработки запроса приложением', ('app', 'method', 'route'))
+
+
+def observe_parse(app: str, file: str, lines: int, seconds: float):
+    """Записывает разбор файла: строки, время и скорость"""
+    PARSE_LINES.labels(app, file).inc(lines)
+    PARSE_SECONDS.labels(app, file).inc(seconds)
+    if seconds > 0 and lines:
+        PARSE_LINES_PER_SECOND.labels(app, file).observe(lines / seconds)
+
+
+# Метод APIClient, выполняемый текущим потоком (метка call для HTTP-запросов)
+_current_call = threading.local()
+
+
+def current_call() -> str:
+    return getattr(_current_call, 'name', None) or 'other'
+
+
+def timed_api_call(method):
+    """
+    Декоратор метода APIClient: длительность вызова и исход (ok - получен
+    результат, error - None, False или исключение). HTTP-запросы внутри вызова
+    помечаются именем самого вложенного метода.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_current_call, 'name', None)
+        _current_call.name = name
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = method(*args, **kwargs)
+            if result is not None and result is not False:
+                outcome = 'ok'
+            return result
+        finally:
+            _current_call.name = outer
+            API_CALL_SECONDS.labels(name, outcome).observe(time.perf_counter() - started)
+
+    return wrapper
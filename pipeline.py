@@ -0,0 +1,818 @@
+"""
+Процесс ввода в оборот товаров из ЕАЭС: авторизация, заказ недостающих кодов,
+скачивание полных кодов, отправка отчетов и отслеживание их статуса
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import REPORT_CONCURRENCY, POLL_INITIAL_DELAY, POLL_MAX_DELAY, MAX_WAIT_TIME
+from api_client import OrderError
+from code_ledger import STATUS_ACCEPTED, STATUS_REJECTED
+from run_store import RUN_RUNNING, RUN_COMPLETED, RUN_FAILED
+from gs1 import split_by_gtin
+from report_batching import iter_batches, merge_batch_statuses
+from metrics import PIPELINE_STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Итоговые статусы отчета
+REPORT_COMPLETED = 'completed'
+REPORT_FAILED = 'failed'
+REPORT_TIMEOUT = 'timeout'
+REPORT_FINAL_STATUSES = (REPORT_COMPLETED, REPORT_FAILED)
+
+# Итоговый статус отчета -> статус кодов в реестре
+LEDGER_STATUSES = {
+    REPORT_COMPLETED: STATUS_ACCEPTED,
+    REPORT_FAILED: STATUS_REJECTED,
+}
+
+# Признак конца очереди между стадиями конвейера
+_DONE = object()
+
+
+def submit_reports(api_client, gtin_codes, max_workers: int = REPORT_CONCURRENCY,
+                   on_submitted: Optional[Callable[[List[str], str, str], None]] = None) -> List[dict]:
+    """
+    Отправляет отчеты о вводе в оборот по всем GTIN параллельно
+
+    Коды каждого GTIN делятся на пакеты (см. report_batching) и отправляются
+    отдельными отчетами через общий пул потоков; в очереди пула одновременно
+    находится не более 2 * max_workers пакетов, поэтому пакеты формируются по
+    мере отправки. Результаты пакетов сводятся в одну запись на GTIN.
+
+    Args:
+        api_client: клиент API
+        gtin_codes: {gtin: [коды]} или итератор пар (gtin, [коды]); итератор
+            читается по мере отправки, поэтому GTIN могут поступать, пока
+            отправляются отчеты по предыдущим
+        max_workers: максимальное количество одновременных запросов
+        on_submitted: вызывается on_submitted(коды пакета, gtin, report_id) для каждого созданного отчета
+
+    Returns:
+        list: [{'gtin', 'report_id', 'report_ids', 'codes_count', 'batches', 'failed_batches'}]
+            для GTIN, по которым создан хотя бы один отчет, в порядке поступления GTIN
+    """
+    items = gtin_codes.items() if isinstance(gtin_codes, dict) else gtin_codes
+    entries = {}
+
+    def iter_work():
+        for gtin, codes_list in items:
+            if not codes_list:
+                continue
+            entry = entries.setdefault(
+                gtin, {'gtin': gtin, 'batch_reports': {}, 'codes_count': 0, 'batches': 0, 'failed_batches': 0}
+            )
+            first_index = entry.setdefault('next_index', 0)
+            for index, batch in enumerate(iter_batches(codes_list), first_index):
+                entry['next_index'] = index + 1
+                yield gtin, index, batch
+
+    def submit(work):
+        gtin, index, batch = work
+        logger.info(f"Отправка отчета для GTIN {gtin}, пакет {index + 1} ({len(batch)} кодов)")
+        report_id = api_client.submit_import_report(batch, gtin)
+        if report_id:
+            logger.info(f"Отчет создан: {report_id} для GTIN {gtin}, пакет {index + 1}")
+            if on_submitted:
+                on_submitted(batch, gtin, report_id)
+        else:
+            logger.warning(f"Не удалось создать отчет для GTIN {gtin}, пакет {index + 1}")
+        return gtin, index, len(batch), report_id
+
+    def collect(futures):
+        for future in futures:
+            gtin, index, codes_count, report_id = future.result()
+            entry = entries[gtin]
+            entry['batches'] += 1
+            if report_id:
+                entry['batch_reports'][index] = report_id
+                entry['codes_count'] += codes_count
+            else:
+                entry['failed_batches'] += 1
+
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+        for work in iter_work():
+            if len(in_flight) >= 2 * max_workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(submit, work))
+        collect(wait(in_flight).done)
+
+    reports = []
+    for entry in entries.values():
+        batch_reports = entry.pop('batch_reports')
+        del entry['next_index']
+        if not batch_reports:
+            continue
+        entry['report_ids'] = [batch_reports[index] for index in sorted(batch_reports)]
+        entry['report_id'] = ', '.join(entry['report_ids'])
+        reports.append(entry)
+    return reports
+
+
+def backoff_delay(attempt: int, initial: float = POLL_INITIAL_DELAY, maximum: float = POLL_MAX_DELAY) -> float:
+    """
+    Пауза перед очередным опросом: экспоненциальный рост с "equal jitter" -
+    половина паузы фиксирована, вторая половина случайна
+    """
+    delay = min(maximum, initial * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class ReportPoller:
+    """
+    Отслеживает статус отчетов по мере их создания
+
+    Отчеты добавляются методом add() из любого потока, пока выполняется run().
+    У каждого отчета своя пауза между опросами (экспоненциальный рост со
+    случайным разбросом) и свой срок max_wait; отчеты, чьи опросы наступают
+    почти одновременно, опрашиваются в одном раунде параллельными запросами.
+    run() завершается после close(), когда у всех отчетов есть итоговый статус,
+    или сразу после stop() - без ожидания итоговых статусов.
+    """
+
+    def __init__(self, api_client, max_workers: int = REPORT_CONCURRENCY, max_wait: float = MAX_WAIT_TIME,
+                 on_progress: Optional[Callable[[Dict[str, str]], None]] = None):
+        self.api_client = api_client
+        self.max_workers = max(1, max_workers)
+        self.max_wait = max_wait
+        self.on_progress = on_progress
+        self.statuses: Dict[str, Optional[str]] = {}
+        self._incoming = queue.Queue()
+        self._stopped = threading.Event()
+        # Опросы, наступающие в пределах этого окна, объединяются в один раунд
+        self._coalesce = POLL_INITIAL_DELAY / 2
+
+    def add(self, report_id: str):
+        self._incoming.put(report_id)
+
+    def close(self):
+        """Новых отчетов не будет"""
+        self._incoming.put(_DONE)
+
+    def stop(self):
+        """Прекращает опрос (запуск прерван ошибкой): статусы больше не запрашиваются и не передаются в on_progress"""
+        self._stopped.set()
+        self._incoming.put(_DONE)
+
+    def run(self) -> Dict[str, str]:
+        """
+        Returns:
+            dict: {report_id: статус}; для незавершенных к сроку отчетов - 'timeout'
+        """
+        statuses = self.statuses
+        # report_id -> [номер попытки, время следующего опроса, срок]
+        schedule = {}
+        closed = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self._stopped.is_set() and (not closed or schedule):
+                timeout = None
+                if schedule:
+                    timeout = max(0.0, min(item[1] for item in schedule.values()) - time.monotonic())
+                try:
+                    item = self._incoming.get(timeout=timeout)
+                    while True:
+                        if item is _DONE:
+                            closed = True
+                        else:
+                            now = time.monotonic()
+                            statuses[item] = None
+                            schedule[item] = [0, now + backoff_delay(0), now + self.max_wait]
+                        item = self._incoming.get_nowait()
+                except queue.Empty:
+                    pass
+
+                if self._stopped.is_set():
+                    break
+                now = time.monotonic()
+                due = [report_id for report_id, item in schedule.items() if item[1] <= now + self._coalesce]
+                if not due:
+                    continue
+
+                for report_id, status in zip(due, executor.map(self.api_client.get_report_status, due)):
+                    statuses[report_id] = status
+                    if status in REPORT_FINAL_STATUSES:
+                        logger.info(f"Отчет {report_id} завершен со статусом {status}")
+                        del schedule[report_id]
+                        continue
+                    item = schedule[report_id]
+                    item[0] += 1
+                    item[1] = time.monotonic() + backoff_delay(item[0])
+                    if item[1] > item[2]:
+                        logger.warning(f"Отчет {report_id} не завершен в течение {self.max_wait} секунд")
+                        statuses[report_id] = REPORT_TIMEOUT
+                        del schedule[report_id]
+
+                if self.on_progress and not self._stopped.is_set():
+                    self.on_progress(dict(statuses))
+
+        return statuses
+
+
+def poll_reports(api_client, report_ids: List[str], max_workers: int = REPORT_CONCURRENCY,
+                 max_wait: float = MAX_WAIT_TIME,
+                 on_progress: Optional[Callable[[Dict[str, str]], None]] = None) -> Dict[str, str]:
+    """
+    Отслеживает статус заранее известных отчетов (см. ReportPoller)
+
+    Опрос не прерывается на первом неуспешном отчете: итоговый статус
+    возвращается для каждого отчета.
+
+    Args:
+        api_client: клиент API (метод get_report_status)
+        report_ids: идентификаторы отчетов
+        max_workers: максимальное количество одновременных запросов
+        max_wait: максимальное время ожидания в секундах
+        on_progress: вызывается после каждого раунда с текущими статусами
+
+    Returns:
+        dict: {report_id: статус}; для незавершенных к сроку отчетов - 'timeout'
+    """
+    poller = ReportPoller(api_client, max_workers, max_wait, on_progress)
+    for report_id in report_ids:
+        poller.add(report_id)
+    poller.close()
+    return poller.run()
+
+
+def build_import_result(products_count: int, codes_count: int, gtin_quantities: dict, gtin_to_codes: dict) -> dict:
+    """
+    Формирует начальный результат обработки и определяет, сколько кодов нужно заказать
+
+    Returns:
+        dict: результат с ключами success, products_count, codes_count, gtins, codes_to_order, steps
+    """
+    codes_to_order = {}
+    for gtin, quantity in gtin_quantities.items():
+        existing_codes_count = len(gtin_to_codes.get(gtin, []))
+        needed = quantity - existing_codes_count
+        if needed > 0:
+            codes_to_order[gtin] = needed
+
+    return {
+        'success': True,
+        'products_count': products_count,
+        'codes_count': codes_count,
+        'gtins': list(gtin_quantities.keys()),
+        'codes_to_order': codes_to_order,
+        'steps': []
+    }
+
+
+def _merge_reports(previous: List[dict], reports: List[dict]) -> List[dict]:
+    """Объединяет записи отчетов по GTIN, отправленных до и после продолжения запуска"""
+    merged = {}
+    for entry in previous + reports:
+        current = merged.get(entry['gtin'])
+        if current is None:
+            merged[entry['gtin']] = dict(entry, report_ids=list(entry['report_ids']))
+            continue
+        current['report_ids'].extend(entry['report_ids'])
+        current['report_id'] = ', '.join(current['report_ids'])
+        for key in ('codes_count', 'batches', 'failed_batches'):
+            current[key] += entry[key]
+    return list(merged.values())
+
+
+class ImportPipeline:
+    """
+    Выполняет шаги процесса ввода в оборот и заполняет result['steps']
+
+    Заказ, скачивание, отправка отчетов и отслеживание их статуса выполняются
+    конвейером: отчеты по GTIN, для которых коды уже есть, отправляются, пока
+    заказ по остальным GTIN еще выполняется; коды заказа скачиваются
+    постранично, и отчет по GTIN отправляется, как только набрано нужное
+    количество кодов; статус каждого отчета начинает отслеживаться сразу после
+    его создания. Стадии связаны ограниченными очередями.
+
+    После каждого изменения шагов вызывается on_update(result), чтобы
+    наблюдатели (очередь заданий) видели промежуточное состояние. Если передан
+    реестр кодов (code_ledger.CodeLedger), уже принятые коды не отправляются
+    повторно, а статусы отправленных кодов записываются в реестр. Если передан
+    пул кодов (code_pool.CodePool), недостающие коды сначала берутся из пула,
+    а излишки заказа сохраняются в него.
+
+    Если передана контрольная точка (run_store.RunCheckpoint), после каждого
+    шага сохраняются результат, план заказа и отправленные отчеты; исходные
+    коды сохраняются один раз, а затем - только добавленные к ним коды (из
+    пула - в плане, скачанные по заказу - отдельно). С resume=True запуск продолжается с сохраненного состояния: созданный заказ
+    не повторяется, отправленные отчеты не отправляются заново, а их статус
+    продолжает отслеживаться.
+    """
+
+    def __init__(self, api_client, gtin_to_codes: dict, result: dict,
+                 on_update: Optional[Callable[[dict], None]] = None, ledger=None, pool=None,
+                 checkpoint=None, resume: bool = False):
+        self.api_client = api_client
+        self.gtin_to_codes = gtin_to_codes
+        self.result = result
+        self.on_update = on_update
+        self.ledger = ledger
+        self.pool = pool
+        self.checkpoint = checkpoint
+        self.resume = resume
+        # Стадии конвейера меняют result из разных потоков
+        self._lock = threading.RLock()
+
+    def _notify(self):
+        if self.on_update:
+            with self._lock:
+                self.on_update(self.result)
+
+    def _save_result(self, status: str = RUN_RUNNING):
+        if self.checkpoint:
+            with self._lock:
+                self.checkpoint.save_result(self.result, status)
+
+    def _save(self, key: str, value):
+        if self.checkpoint:
+            with self._lock:
+                self.checkpoint.save(key, value)
+
+    def _codes_list(self, gtin: str) -> list:
+        """
+        Изменяемый список кодов GTIN для дополнения кодами из пула и заказа;
+        представление CodeView (columnar.py) копируется в список только здесь
+        """
+        codes = self.gtin_to_codes.get(gtin)
+        if not isinstance(codes, list):
+            codes = self.gtin_to_codes[gtin] = list(codes or ())
+        return codes
+
+    def _add_codes(self, added: dict):
+        """Дополняет коды по GTIN кодами из пула или заказа"""
+        for gtin, codes in added.items():
+            self._codes_list(gtin).extend(codes)
+
+    def _start_step(self, step: int, name: str, **fields) -> dict:
+        record = {'step': step, 'name': name, 'status': 'in_progress', 'started_at': time.time()}
+        record.update(fields)
+        with self._lock:
+            # Стадии начинаются не по порядку, а шаги показываются по номерам;
+            # повторно начатый шаг (при продолжении запуска) заменяет прежнюю запись
+            steps = self.result['steps']
+            index = len(steps)
+            while index and steps[index - 1]['step'] > step:
+                index -= 1
+            if index and steps[index - 1]['step'] == step:
+                steps[index - 1] = record
+            else:
+                steps.insert(index, record)
+            self._notify()
+            self._save_result()
+        return record
+
+    @staticmethod
+    def _finish_step(record: dict):
+        record['finished_at'] = time.time()
+        record['duration'] = round(record['finished_at'] - record['started_at'], 3)
+        PIPELINE_STEP_SECONDS.labels(record['step'], record['name'], record['status']).observe(
+            record['finished_at'] - record['started_at'])
+
+    def _update_step(self, record: dict, **fields):
+        with self._lock:
+            record.update(fields)
+            self._notify()
+
+    def _complete_step(self, record: dict, **fields):
+        with self._lock:
+            record.update(fields)
+            record['status'] = 'completed'
+            self._finish_step(record)
+            self._notify()
+            self._save_result()
+
+    def _fail(self, record: dict, error: str) -> dict:
+        with self._lock:
+            self.result['success'] = False
+            record['status'] = 'failed'
+            record['error'] = error
+            self._finish_step(record)
+            self._notify()
+            self._save_result(RUN_FAILED)
+        return self.result
+
+    def _take_from_pool(self, codes_to_order: dict) -> dict:
+        """Покрывает потребность кодами из пула; codes_to_order уменьшается до оставшейся нехватки"""
+        if not self.pool:
+            return {}
+        from_pool = self.pool.allocate(codes_to_order)
+        self._add_codes(from_pool)
+        for gtin, codes in from_pool.items():
+            codes_to_order[gtin] -= len(codes)
+            if codes_to_order[gtin] <= 0:
+                del codes_to_order[gtin]
+        if from_pool:
+            self.result['codes_from_pool'] = {gtin: len(codes) for gtin, codes in from_pool.items()}
+            self._notify()
+        return from_pool
+
+    def _return_to_pool(self, gtins, from_pool: dict, received: dict, order_id: Optional[str]):
+        """
+        Возвращает в пул коды GTIN, отчеты по которым не будут отправлены:
+        выданные из пула и уже скачанные по заказу
+        """
+        for gtin in gtins:
+            returned = set()
+            if self.pool and from_pool.get(gtin):
+                self.pool.add(gtin, from_pool[gtin])
+                returned.update(from_pool[gtin])
+            if self.pool and received.get(gtin):
+                self.pool.add(gtin, received[gtin], order_id)
+                returned.update(received[gtin])
+            if returned:
+                self.gtin_to_codes[gtin] = [code for code in self.gtin_to_codes.get(gtin, []) if code not in returned]
+
+    def _distribute_page(self, page: list, remaining: dict, received: dict, order_id: str) -> Tuple[List[str], int]:
+        """
+        Распределяет страницу скачанных кодов по GTIN (AI 01 в коде); излишки сохраняются в пул
+
+        Returns:
+            tuple: (GTIN, для которых набрано нужное количество кодов; количество кодов, сохраненных в пул)
+        """
+        filled = []
+        pooled = 0
+        for gtin, codes in split_by_gtin(page).items():
+            needed = remaining.get(gtin, 0)
+            if needed:
+                taken = codes[:needed]
+                self._codes_list(gtin).extend(taken)
+                received.setdefault(gtin, []).extend(taken)
+                remaining[gtin] -= len(taken)
+                if not remaining[gtin]:
+                    del remaining[gtin]
+                    filled.append(gtin)
+            elif gtin not in received:
+                logger.warning(f"В заказе {order_id} получены коды для незаказанного GTIN {gtin}: {len(codes)}")
+            surplus = codes[needed:]
+            if self.pool and surplus:
+                pooled += self.pool.add(gtin, surplus, order_id)
+        return filled, pooled
+
+    def _order_missing_codes(self, plan: dict, ready: queue.Queue) -> bool:
+        """
+        Шаги 2-4: заказывает оставшуюся нехватку (если заказ еще не создан),
+        ожидает выпуска кодов и скачивает их постранично. GTIN, для которых
+        набрано нужное количество кодов, передаются в очередь ready, не
+        дожидаясь окончания заказа.
+
+        Returns:
+            bool: False, если шаг завершился ошибкой (result уже заполнен)
+        """
+        api_client = self.api_client
+        codes_to_order = plan['codes_to_order']
+        from_pool = plan['from_pool']
+        remaining = dict(codes_to_order)
+        order_id = plan['order_id']
+
+        if order_id:
+            logger.info(f"Продолжение заказа {order_id}")
+        else:
+            # Шаг 2: Заказ недостающих кодов
+            step = self._start_step(2, 'Заказ недостающих кодов маркировки')
+
+            logger.info(f"Заказ кодов для GTIN: {list(codes_to_order.keys())}")
+            order_id = api_client.order_codes(codes_to_order)
+
+            if not order_id:
+                logger.error("Не удалось создать заказ кодов")
+                self._return_to_pool(remaining, from_pool, {}, None)
+                self._save('plan', dict(plan, returned=True))
+                self._fail(step, 'Ошибка заказа кодов')
+                return False
+
+            logger.info(f"Заказ создан: {order_id}")
+            plan['order_id'] = order_id
+            self._save('plan', plan)
+            self._complete_step(step, order_id=order_id)
+
+        # Шаг 3: Ожидание выполнения заказа
+        wait_step = self._start_step(3, 'Ожидание выполнения заказа', order_id=order_id)
+        download_step = None
+        received = {}
+        downloaded = 0
+        pooled = 0
+
+        logger.info(f"Ожидание выполнения заказа {order_id}")
+        try:
+            # Шаг 4: Скачивание полных кодов - по мере выпуска
+            for page in api_client.iter_order_codes(order_id):
+                if download_step is None:
+                    self._complete_step(wait_step)
+                    download_step = self._start_step(4, 'Скачивание полных кодов', codes_count=0)
+                filled, page_pooled = self._distribute_page(page, remaining, received, order_id)
+                downloaded += len(page)
+                pooled += page_pooled
+                self._update_step(download_step, codes_count=downloaded)
+                for gtin in filled:
+                    logger.info(f"Коды для GTIN {gtin} скачаны полностью")
+                    ready.put((gtin, self.gtin_to_codes[gtin]))
+        except OrderError as e:
+            logger.error(str(e))
+            self._return_to_pool(remaining, from_pool, received, order_id)
+            self._save('plan', dict(plan, returned=True))
+            self._fail(download_step or wait_step, str(e))
+            return False
+
+        if not downloaded:
+            logger.error(f"Не удалось скачать коды для заказа {order_id}")
+            self._return_to_pool(remaining, from_pool, received, order_id)
+            self._save('plan', dict(plan, returned=True))
+            if download_step is None:
+                self._complete_step(wait_step)
+                download_step = self._start_step(4, 'Скачивание полных кодов')
+            self._fail(download_step, 'Ошибка скачивания кодов')
+            return False
+
+        logger.info(f"Заказ {order_id} выполнен, скачано кодов: {downloaded}")
+        self._save('received', received)
+        plan['downloaded'] = True
+        self._save('plan', plan)
+        for gtin, needed in remaining.items():
+            logger.warning(f"Для GTIN {gtin} получено {codes_to_order[gtin] - needed} кодов из {codes_to_order[gtin]}")
+            ready.put((gtin, self.gtin_to_codes[gtin]))
+
+        fields = {'codes_count': downloaded}
+        if pooled:
+            fields['pooled_codes'] = pooled
+        self._complete_step(download_step, **fields)
+        return True
+
+    def _plan(self) -> dict:
+        """
+        Определяет коды для отправки и план заказа: сохраненные при продолжении
+        запуска или новые (с расходом кодов из пула)
+
+        Returns:
+            dict: {'codes_to_order', 'from_pool', 'order_id', 'downloaded'}
+        """
+        if self.resume:
+            saved = self.checkpoint.load('input')
+            self.gtin_to_codes = saved['gtin_to_codes']
+            plan = self.checkpoint.load('plan')
+            if plan and not plan.get('returned'):
+                # Коды запуска - исходные коды с добавленными кодами из пула и скачанными по заказу
+                self._add_codes(plan['from_pool'])
+                if plan['downloaded']:
+                    logger.info("Продолжение запуска: коды заказа уже скачаны")
+                    self._add_codes(self.checkpoint.load('received'))
+                    plan['codes_to_order'] = {}
+                self.result['codes_to_order'] = plan['codes_to_order']
+                return plan
+            # Заказ не создан или не выполнен, а коды из пула возвращены - план составляется заново
+            self.result['codes_to_order'] = saved['codes_to_order']
+
+        codes_to_order = self.result['codes_to_order']
+        from_pool = self._take_from_pool(codes_to_order) if codes_to_order else {}
+        if from_pool and not codes_to_order:
+            logger.info("Недостающие коды полностью покрыты кодами из пула")
+        plan = {'codes_to_order': codes_to_order, 'from_pool': from_pool, 'order_id': None, 'downloaded': False}
+        self._save('plan', plan)
+        return plan
+
+    def _restore_steps(self):
+        """При продолжении запуска сохраняет только выполненные шаги заказа и скачивания"""
+        self.result['steps'] = [step for step in self.result['steps']
+                                if step['status'] == 'completed' and step['step'] in (2, 3, 4)]
+        self.result['success'] = True
+        for key in ('error', 'trace', 'final_status'):
+            self.result.pop(key, None)
+        self.result['resumed'] = self.result.get('resumed', 0) + 1
+
+    def run(self) -> dict:
+        """
+        Выполняет все шаги процесса
+
+        Returns:
+            dict: результат обработки (тот же объект, что был передан в конструктор)
+        """
+        api_client = self.api_client
+        ledger = self.ledger
+        checkpoint = self.checkpoint
+        if self.resume:
+            self._restore_steps()
+        else:
+            self._save_result()
+            self._save('input', {'gtin_to_codes': self.gtin_to_codes,
+                                 'codes_to_order': self.result['codes_to_order']})
+
+        # Шаг 1: Авторизация
+        step = self._start_step(1, 'Авторизация в API')
+
+        if not api_client.authenticate():
+            logger.error("Ошибка авторизации в API")
+            return self._fail(step, 'Ошибка авторизации. Проверьте учетные данные в .env файле')
+
+        logger.info("Авторизация успешна")
+        self._complete_step(step)
+
+        plan = self._plan()
+        gtin_to_codes = self.gtin_to_codes
+        codes_to_order = plan['codes_to_order']
+        skipped = ledger.filter_new(gtin_to_codes) if ledger else {}
+
+        # Отчеты, отправленные до продолжения запуска: их коды не отправляются повторно
+        previous = checkpoint.reports() if self.resume else []
+        sent = {}
+        for report in previous:
+            sent.setdefault(report['gtin'], set()).update(report['codes'])
+        if previous:
+            logger.info(f"Продолжение запуска: ранее отправлено отчетов {len(previous)}")
+
+        # Шаг 5: Отправка отчетов о вводе в оборот
+        report_step = self._start_step(5, 'Отправка отчетов о вводе в оборот', reports=[])
+        if skipped:
+            report_step['skipped_codes'] = skipped
+            if not codes_to_order and not previous and not any(gtin_to_codes.values()):
+                logger.info("Все коды уже введены в оборот, отправка отчетов не требуется")
+                self._complete_step(report_step, message='Все коды уже введены в оборот')
+                self.result['final_status'] = 'completed'
+                self._notify()
+                self._save_result(RUN_COMPLETED)
+                return self.result
+
+        # Шаг 6: Отслеживание статуса отчетов - начинается с первым созданным отчетом
+        status_step = None
+        batch_reports = {}
+        saved_statuses = {}
+
+        def merge_statuses(statuses, failed_gtins=()):
+            # Статусы пакетов сводятся в один статус на GTIN; неотправленный пакет - ошибка GTIN
+            return [
+                {
+                    'gtin': gtin,
+                    'report_id': ', '.join(report_ids),
+                    'status': REPORT_FAILED if gtin in failed_gtins else merge_batch_statuses(
+                        [statuses.get(report_id) for report_id in report_ids], REPORT_COMPLETED, REPORT_FAILED
+                    ),
+                    'batch_statuses': {report_id: statuses.get(report_id) for report_id in report_ids}
+                }
+                for gtin, report_ids in batch_reports.items()
+            ]
+
+        def on_progress(statuses):
+            with self._lock:
+                status_step['report_statuses'] = merge_statuses(statuses)
+                self._notify()
+            if checkpoint:
+                for report_id, status in statuses.items():
+                    if status in REPORT_FINAL_STATUSES and saved_statuses.get(report_id) != status:
+                        checkpoint.set_report_status(report_id, status)
+                        saved_statuses[report_id] = status
+
+        poller = ReportPoller(api_client, on_progress=on_progress)
+        poller_thread = threading.Thread(target=poller.run, name='report-poller', daemon=True)
+
+        def track(gtin, report_id):
+            nonlocal status_step
+            with self._lock:
+                batch_reports.setdefault(gtin, []).append(report_id)
+                if status_step is None:
+                    status_step = self._start_step(6, 'Отслеживание статуса отчетов', report_statuses=[])
+                    logger.info("Ожидание завершения отчетов")
+                    poller_thread.start()
+
+        def on_submitted(batch, gtin, report_id):
+            if ledger:
+                ledger.mark_submitted(batch, gtin, report_id)
+            if checkpoint:
+                checkpoint.add_report(report_id, gtin, batch)
+            track(gtin, report_id)
+            poller.add(report_id)
+
+        previous_reports = {}
+        for report in previous:
+            entry = previous_reports.setdefault(report['gtin'], {
+                'gtin': report['gtin'], 'codes_count': 0, 'batches': 0, 'failed_batches': 0, 'report_ids': []
+            })
+            entry['codes_count'] += len(report['codes'])
+            entry['batches'] += 1
+            entry['report_ids'].append(report['report_id'])
+            entry['report_id'] = ', '.join(entry['report_ids'])
+            track(report['gtin'], report['report_id'])
+            if report['status'] in REPORT_FINAL_STATUSES:
+                poller.statuses[report['report_id']] = report['status']
+                saved_statuses[report['report_id']] = report['status']
+            else:
+                poller.add(report['report_id'])
+
+        # Стадия заказа: GTIN с заказанными кодами поступают в очередь по мере скачивания
+        ready_now = [(gtin, codes) for gtin, codes in gtin_to_codes.items() if gtin not in codes_to_order]
+        ready = queue.Queue(maxsize=max(1, REPORT_CONCURRENCY))
+        order_thread = None
+        if codes_to_order:
+            for gtin in codes_to_order:
+                self._codes_list(gtin)
+
+            def order_stage():
+                try:
+                    self._order_missing_codes(plan, ready)
+                except Exception as e:
+                    logger.error(f"Ошибка стадии заказа: {e}\n{traceback.format_exc()}")
+                    with self._lock:
+                        for record in self.result['steps']:
+                            if record['step'] < 5 and record['status'] == 'in_progress':
+                                record['status'] = 'failed'
+                                record['error'] = str(e)
+                                self._finish_step(record)
+                        self.result['success'] = False
+                        self.result['error'] = str(e)
+                        self._notify()
+                        self._save_result(RUN_FAILED)
+                finally:
+                    ready.put(_DONE)
+
+            order_thread = threading.Thread(target=order_stage, name='order-stage', daemon=True)
+            order_thread.start()
+
+        ready_drained = False
+
+        def iter_ready():
+            nonlocal ready_drained
+            items = iter(ready_now)
+            if order_thread:
+                items = chain(items, iter(ready.get, _DONE))
+            for gtin, codes in items:
+                if gtin in sent:
+                    codes = [code for code in codes if code not in sent[gtin]]
+                yield gtin, codes
+            ready_drained = True
+
+        try:
+            try:
+                reports = submit_reports(api_client, iter_ready(), on_submitted=on_submitted)
+            finally:
+                if order_thread:
+                    # Отправка прервана ошибкой: очередь дочитывается, иначе стадия заказа
+                    # навсегда заблокирована на ready.put
+                    if not ready_drained:
+                        for _ in iter(ready.get, _DONE):
+                            pass
+                    order_thread.join()
+            order_failed = not self.result['success']
+            reports = _merge_reports(list(previous_reports.values()), reports)
+
+            if not reports:
+                if order_failed:
+                    with self._lock:
+                        report_step['status'] = 'failed'
+                        report_step['error'] = 'Отчеты не отправлены из-за ошибки заказа кодов'
+                        self._finish_step(report_step)
+                        self._notify()
+                        self._save_result(RUN_FAILED)
+                    return self.result
+                logger.error("Не удалось отправить ни одного отчета")
+                return self._fail(report_step, 'Не удалось отправить отчеты')
+
+            self._complete_step(report_step, reports=reports)
+        except BaseException:
+            # Запуск прерван ошибкой: опрос отменяется, чтобы поток не записывал статусы
+            # в контрольную точку и реестр после завершения (и параллельно с продолжением запуска)
+            poller.stop()
+            raise
+        finally:
+            # Новых отчетов не будет: иначе поток опроса ждет их бесконечно
+            poller.close()
+            if poller_thread.ident is not None:
+                poller_thread.join()
+        statuses = poller.statuses
+        failed_gtins = {report_info['gtin'] for report_info in reports if report_info['failed_batches']}
+        with self._lock:
+            status_step['report_statuses'] = merge_statuses(statuses, failed_gtins)
+        if ledger:
+            for report_id, status in statuses.items():
+                if status in LEDGER_STATUSES:
+                    ledger.set_report_status(report_id, LEDGER_STATUSES[status])
+        all_reports_completed = all(entry['status'] == REPORT_COMPLETED for entry in status_step['report_statuses'])
+
+        with self._lock:
+            if all_reports_completed:
+                logger.info("Все отчеты успешно завершены")
+                status_step['status'] = 'completed'
+            else:
+                not_completed = [entry['gtin'] for entry in status_step['report_statuses']
+                                 if entry['status'] != REPORT_COMPLETED]
+                logger.warning(f"Некоторые отчеты не завершены, GTIN: {not_completed}")
+                status_step['status'] = 'warning'
+                status_step['message'] = 'Некоторые отчеты не завершены'
+            self._finish_step(status_step)
+
+            completed = all_reports_completed and not order_failed
+            self.result['final_status'] = 'completed' if completed else 'partial'
+            self._notify()
+            self._save_result(RUN_COMPLETED if completed else RUN_FAILED)
+
+        logger.info("Обработка завершена")
+        return self.result
@@ -0,0 +1,194 @@
+"""
+Ограничение нагрузки на API Datamark, общее для всех заданий процесса
+
+Запросы делятся на классы (авторизация, заказ, отчет, скачивание кодов, опрос
+статусов); у каждого класса своя корзина маркеров с допустимой частотой
+запросов. Количество одновременных запросов регулируется по схеме AIMD: после
+успешного ответа лимит плавно растет, после ответа 429/5xx или таймаута
+уменьшается вдвое. Заголовок Retry-After приостанавливает весь класс запросов
+на указанное время. Все клиенты с одним API_BASE_URL используют один
+ограничитель (см. get_api_limiter).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from config import (
+    API_RATE_LIMITS, API_CONCURRENCY_INITIAL, API_CONCURRENCY_MIN, API_CONCURRENCY_MAX
+)
+from metrics import API_CONCURRENCY_LIMIT, API_RATE_LIMIT_WAIT
+
+# Классы запросов
+ENDPOINT_AUTH = 'auth'
+ENDPOINT_ORDER = 'order'
+ENDPOINT_REPORT = 'report'
+ENDPOINT_DOWNLOAD = 'download'
+ENDPOINT_STATUS = 'status'
+ENDPOINT_OTHER = 'other'
+
+# Исход запроса для регулятора одновременности
+OUTCOME_SUCCESS = 'success'
+OUTCOME_OVERLOAD = 'overload'
+OUTCOME_NEUTRAL = 'neutral'
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """'auth=1,order=2' -> {'auth': 1.0, 'order': 2.0}"""
+    rates = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition('=')
+        rates[name.strip()] = float(value)
+    return rates
+
+
+class TokenBucket:
+    """
+    Корзина маркеров: не более rate запросов в секунду с запасом burst
+
+    rate=0 - без ограничения частоты; пауза по Retry-After действует всегда.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Ждет маркер. Returns: время ожидания в секундах"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif not self.rate:
+                    return waited
+                else:
+                    if now > self._updated:
+                        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                        self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу маркеров; после паузы корзина наполняется с нуля"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                self._tokens = 0.0
+                self._updated = until
+
+
+class AIMDLimiter:
+    """
+    Лимит одновременных запросов: +increase/limit за каждый успешный ответ
+    (около +1 за «окно» из limit запросов), *decrease при перегрузке
+
+    Лимит уменьшается не чаще одного раза на «поколение» запросов: ответы на
+    запросы, начатые до последнего уменьшения, его не уменьшают повторно.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, increase: float = 1.0, decrease: float = 0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        API_CONCURRENCY_LIMIT.set(self.limit)
+
+    def acquire(self) -> float:
+        """Ждет свободного места. Returns: момент начала запроса (для release)"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, outcome: str):
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == OUTCOME_SUCCESS:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            elif outcome == OUTCOME_OVERLOAD and started >= self._last_decrease:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = time.monotonic()
+            API_CONCURRENCY_LIMIT.set(self.limit)
+            self._condition.notify_all()
+
+
+class _Slot:
+    """Место для одного запроса; исход задается после получения ответа"""
+
+    __slots__ = ('outcome',)
+
+    def __init__(self):
+        self.outcome = OUTCOME_NEUTRAL
+
+
+class ApiLimiter:
+    """Корзины маркеров по классам запросов и общий регулятор одновременности"""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, initial: int = API_CONCURRENCY_INITIAL,
+                 minimum: int = API_CONCURRENCY_MIN, maximum: int = API_CONCURRENCY_MAX):
+        rates = parse_rates(API_RATE_LIMITS) if rates is None else rates
+        self.buckets = {name: TokenBucket(rate) for name, rate in rates.items()}
+        self.concurrency = AIMDLimiter(initial, minimum, maximum)
+        self._lock = threading.Lock()
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            with self._lock:
+                bucket = self.buckets.setdefault(endpoint, TokenBucket(0))
+        return bucket
+
+    @contextmanager
+    def slot(self, endpoint: str) -> Iterator[_Slot]:
+        """
+        Ждет маркера класса endpoint, затем места среди одновременных запросов;
+        исход запроса (slot.outcome) передается регулятору при выходе из блока
+
+        Маркер ожидается до занятия места: класс, приостановленный по
+        Retry-After, не держит общие места и не блокирует остальные классы.
+        """
+        waited = self.bucket(endpoint).acquire()
+        if waited:
+            API_RATE_LIMIT_WAIT.labels(endpoint).inc(waited)
+        started = self.concurrency.acquire()
+        slot = _Slot()
+        try:
+            yield slot
+        finally:
+            self.concurrency.release(started, slot.outcome)
+
+    def pause(self, endpoint: str, seconds: float):
+        """Приостанавливает класс запросов (ответ с Retry-After)"""
+        self.bucket(endpoint).pause(seconds)
+
+
+_limiters: Dict[str, ApiLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_api_limiter(base_url: str) -> ApiLimiter:
+    """Возвращает общий ограничитель для base_url"""
+    with _limiters_lock:
+        limiter = _limiters.get(base_url)
+        if limiter is None:
+            limiter = _limiters[base_url] = ApiLimiter()
+        return limiter
@@ -0,0 +1,175 @@
+"""
+Фоновое пополнение пула кодов для часто используемых GTIN
+
+По истории потребности (code_pool.CodePool.record_demand) определяются
+популярные GTIN. Если остаток GTIN в пуле опускается ниже порога, коды
+заказываются заранее, чтобы импорт этих GTIN обходился без шагов заказа и
+ожидания его выполнения.
+
+Если процессов приложения несколько, пополнение выполняет только тот, у
+которого аренда REPLENISH_LEASE в общем хранилище (shared_state).
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from config import (
+    REPLENISH_INTERVAL, REPLENISH_WINDOW_DAYS, REPLENISH_MIN_RUNS,
+    REPLENISH_LOW_WATER_RUNS, REPLENISH_TARGET_RUNS, REPLENISH_MAX_ORDER, MAX_WAIT_TIME
+)
+from gs1 import split_by_gtin
+from shared_state import worker_id
+
+logger = logging.getLogger(__name__)
+
+# Название аренды пополнения в общем хранилище
+REPLENISH_LEASE = 'code-pool-replenisher'
+
+
+def plan_replenishment(demand: Dict[str, dict], stock: Dict[str, int],
+                       min_runs: int = REPLENISH_MIN_RUNS,
+                       low_water_runs: float = REPLENISH_LOW_WATER_RUNS,
+                       target_runs: float = REPLENISH_TARGET_RUNS,
+                       max_order: int = REPLENISH_MAX_ORDER) -> Dict[str, dict]:
+    """
+    Рассчитывает пороги и объем пополнения для популярных GTIN
+
+    Args:
+        demand: {gtin: {'runs', 'total', 'average'}} из CodePool.demand
+        stock: {gtin: остаток в пуле} из CodePool.available
+
+    Returns:
+        dict: {gtin: {'stock', 'low_water', 'target', 'order'}} для популярных GTIN;
+            order > 0 - сколько кодов заказать
+    """
+    plan = {}
+    for gtin, stats in demand.items():
+        if stats['runs'] < min_runs:
+            continue
+        low_water = math.ceil(stats['average'] * low_water_runs)
+        target = max(low_water, math.ceil(stats['average'] * target_runs))
+        available = stock.get(gtin, 0)
+        order = min(max_order, target - available) if available < low_water else 0
+        plan[gtin] = {'stock': available, 'low_water': low_water, 'target': target, 'order': order}
+    return plan
+
+
+class Replenisher:
+    """
+    Фоновый поток, периодически пополняющий пул кодов
+
+    Состояние последней проверки доступно через state() и публикуется
+    эндпоинтом /api/pool/replenishment.
+    """
+
+    def __init__(self, api_client, pool, interval: int = REPLENISH_INTERVAL,
+                 window_days: float = REPLENISH_WINDOW_DAYS, store=None):
+        """
+        Args:
+            store: общее хранилище (shared_state.SharedStore) для выбора одного
+                пополняющего процесса; None - пополняет этот процесс
+        """
+        self.api_client = api_client
+        self.pool = pool
+        self.store = store
+        self.interval = interval
+        self.window = window_days * 86400
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._state = {
+            'enabled': True,
+            'active': store is None,
+            'interval': interval,
+            'last_check': None,
+            'in_progress': False,
+            'last_order_id': None,
+            'last_order_at': None,
+            'downloaded': 0,
+            'last_error': None,
+            'gtins': {}
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='code-pool-replenisher', daemon=True)
+        self._thread.start()
+        logger.info(f"Фоновое пополнение пула запущено, интервал {self.interval} с")
+
+    def stop(self):
+        self._stop.set()
+        if self.store is not None:
+            self.store.release_lease(REPLENISH_LEASE, worker_id())
+
+    def state(self) -> dict:
+        with self._lock:
+            return {**self._state, 'gtins': dict(self._state['gtins'])}
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    def _is_active(self) -> bool:
+        """Получает или продлевает аренду; аренда покрывает интервал и ожидание заказа"""
+        if self.store is None:
+            return True
+        active = self.store.claim_lease(REPLENISH_LEASE, worker_id(), self.interval * 2 + MAX_WAIT_TIME)
+        self._update(active=active)
+        return active
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._is_active():
+                    self.check()
+            except Exception as e:
+                logger.error(f"Ошибка фонового пополнения пула: {e}")
+                self._update(last_error=str(e), in_progress=False)
+            self._stop.wait(self.interval)
+
+    def check(self) -> Dict[str, dict]:
+        """
+        Проверяет остатки и при необходимости заказывает коды
+
+        Returns:
+            dict: план пополнения (см. plan_replenishment)
+        """
+        now = time.time()
+        self.pool.prune_demand(now - self.window)
+        plan = plan_replenishment(self.pool.demand(now - self.window), self.pool.available())
+        self._update(last_check=now, gtins=plan)
+
+        codes_to_order = {gtin: item['order'] for gtin, item in plan.items() if item['order'] > 0}
+        if codes_to_order:
+            self._replenish(codes_to_order)
+        return plan
+
+    def _replenish(self, codes_to_order: Dict[str, int]):
+        logger.info(f"Пополнение пула: заказ кодов {codes_to_order}")
+        self._update(in_progress=True, last_error=None, downloaded=0)
+        api_client = self.api_client
+
+        if not api_client.authenticate():
+            raise RuntimeError('Ошибка авторизации')
+        order_id = api_client.order_codes(codes_to_order)
+        if not order_id:
+            raise RuntimeError('Ошибка заказа кодов')
+        self._update(last_order_id=order_id, last_order_at=time.time())
+
+        # Коды добавляются в пул постранично, по мере выпуска, не дожидаясь выполнения всего заказа
+        downloaded = 0
+        for page in api_client.iter_order_codes(order_id):
+            for gtin, codes in split_by_gtin(page).items():
+                self.pool.add(gtin, codes, order_id)
+            downloaded += len(page)
+            self._update(downloaded=downloaded)
+        if not downloaded:
+            raise RuntimeError(f'Коды заказа {order_id} не получены')
+
+        self._update(in_progress=False)
+        logger.info(f"Пул пополнен по заказу {order_id}: {downloaded} кодов")
@@ -0,0 +1,65 @@
+"""
+Разбиение больших отчетов о вводе в оборот на пакеты
+
+Список кодов одного GTIN делится на пакеты, каждый из которых не превышает
+заданного количества кодов и размера сериализованного JSON, чтобы отчеты
+укладывались в ограничения API на размер запроса.
+"""
+
+import json
+from typing import Iterable, Iterator, List
+
+from config import REPORT_BATCH_MAX_CODES, REPORT_BATCH_MAX_BYTES
+
+# Запас на поля отчета помимо списка кодов (productGroup, reason, gtin и т.д.)
+PAYLOAD_OVERHEAD_BYTES = 1024
+
+_encoder = json.JSONEncoder()
+
+
+def serialized_code_size(code: str) -> int:
+    """Размер кода в JSON-массиве в байтах: строка в кавычках с экранированием и запятая"""
+    return len(_encoder.encode(code)) + 1
+
+
+def iter_batches(codes: Iterable[str], max_codes: int = REPORT_BATCH_MAX_CODES,
+                 max_bytes: int = REPORT_BATCH_MAX_BYTES) -> Iterator[List[str]]:
+    """
+    Лениво делит коды на пакеты, ограниченные количеством и размером
+
+    Args:
+        codes: коды одного GTIN
+        max_codes: максимальное количество кодов в пакете
+        max_bytes: максимальный размер сериализованного отчета в байтах
+
+    Yields:
+        list: очередной пакет кодов (не пустой)
+    """
+    limit = max(1, max_bytes - PAYLOAD_OVERHEAD_BYTES)
+    batch = []
+    batch_bytes = 0
+    for code in codes:
+        size = serialized_code_size(code)
+        if batch and (len(batch) >= max_codes or batch_bytes + size > limit):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(code)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def merge_batch_statuses(statuses: List[str], completed: str, failed: str) -> str:
+    """
+    Сводит статусы пакетов одного GTIN в один статус
+
+    Returns:
+        str: completed, если завершены все пакеты; failed, если хотя бы один
+            отклонен; иначе статус первого незавершенного пакета
+    """
+    if all(status == completed for status in statuses):
+        return completed
+    if any(status == failed for status in statuses):
+        return failed
+    return next(status for status in statuses if status != completed)
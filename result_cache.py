@@ -0,0 +1,258 @@
+"""
+Кэш результатов преобразования кодов с адресацией по содержимому
+
+Операторы часто загружают один и тот же файл кодов повторно. Результат
+преобразования сохраняется в файл, имя которого - хэш SHA-256 от параметров
+преобразования и входных данных (ключ), поэтому:
+
+- повторный запрос с теми же данными отдается из кэша без преобразования;
+- ключ служит идентификатором результата для скачивания и значением ETag:
+  клиент, приславший его в If-None-Match, получает 304 без тела ответа;
+- параллельные запросы и процессы не перезаписывают результаты друг друга, а
+  одинаковые результаты записываются в один и тот же файл.
+
+Файлы хранятся в общем каталоге (доступен всем процессам) и удаляются, если к
+ним не обращались ttl секунд или если общий размер кэша превышает max_bytes
+(сначала самые давние по последнему обращению).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import gs1
+
+logger = logging.getLogger(__name__)
+
+# Версия формата результатов: меняется при изменении преобразования, чтобы старые записи не использовались
+CACHE_FORMAT_VERSION = 1
+
+# Параметры преобразования РФ -> РБ, входящие в ключ
+CONVERSION_PARAMS = {
+    'conversion': 'rf_to_rb',
+    'from': gs1.RF_COUNTRY_DIGIT,
+    'to': gs1.RB_COUNTRY_DIGIT,
+    'format': 'lines',
+}
+
+_KEY = re.compile(r'^[0-9a-f]{64}$')
+_META_SUFFIX = '.json'
+_PARTIAL_SUFFIX = '.part'
+
+
+def cache_key(params: dict, chunks: Iterable[bytes]) -> str:
+    """
+    Ключ результата: SHA-256 от версии формата, параметров и содержимого входных данных
+
+    Args:
+        params: параметры преобразования (сериализуются в JSON с сортировкой ключей)
+        chunks: входные данные блоками bytes
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps({'version': CACHE_FORMAT_VERSION, **params}, sort_keys=True).encode('utf-8'))
+    hasher.update(b'\0')
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def iter_code_list(codes: Sequence[str], chunk_size: int = 10000) -> Iterator[bytes]:
+    """
+    Список кодов как входные данные для cache_key: блоками длины кодов и сами
+    коды. Длины делают содержимое однозначным при любых символах в кодах, а
+    блоки не требуют копии всего списка в памяти.
+    """
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size]
+        yield array('I', map(len, chunk)).tobytes()
+        yield '\n'.join(chunk).encode('utf-8')
+
+
+def etag(key: str) -> str:
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], key: str, exists: bool = True) -> bool:
+    """
+    Совпадает ли заголовок If-None-Match (список ETag, W/, *) с ключом результата
+
+    Args:
+        exists: есть ли сохраненный результат; * совпадает только с существующим результатом
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if (tag == '*' and exists) or tag.removeprefix('W/') == etag(key):
+            return True
+    return False
+
+
+class CacheEntry:
+    """Результат в кэше: путь к файлу и метаданные (например, codes_count)"""
+
+    def __init__(self, key: str, path: str, meta: dict):
+        self.key = key
+        self.path = path
+        self.meta = meta
+
+    @property
+    def etag(self) -> str:
+        return etag(self.key)
+
+
+class ResultCache:
+    """
+    Результаты преобразования в каталоге directory: <ключ> - результат,
+    <ключ>.json - метаданные
+
+    enabled=False - результаты сохраняются для скачивания, но повторные
+    запросы всегда преобразуются заново.
+    """
+
+    def __init__(self, directory: str, ttl: float, max_bytes: int, enabled: bool = True):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._prune_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> Optional[str]:
+        """Путь к файлу результата или None (нет, устарел, некорректный ключ); обращение продлевает срок хранения"""
+        if not _KEY.match(key or ''):
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                return None
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Результат из кэша или None (промах или кэш отключен)"""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        if path is None:
+            return None
+        try:
+            with open(path + _META_SUFFIX, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            # Метаданные еще не записаны или повреждены - результат преобразуется заново
+            return None
+        return CacheEntry(key, path, meta)
+
+    @contextmanager
+    def create(self, key: str, encoding: Optional[str] = 'utf-8') -> Iterator[Tuple[object, dict]]:
+        """
+        Сохраняет результат; он становится доступен только после выхода из блока без ошибки
+
+        Args:
+            encoding: кодировка текстового файла; None - файл открывается в двоичном режиме
+
+        Yields:
+            tuple: (открытый на запись файл, словарь метаданных для заполнения)
+        """
+        if not _KEY.match(key):
+            raise ValueError(f'Некорректный ключ результата: {key}')
+        path = os.path.join(self.directory, key)
+        partial = f'{path}.{uuid.uuid4().hex}{_PARTIAL_SUFFIX}'
+        meta = {}
+        try:
+            if encoding is None:
+                f = open(partial, 'wb')
+            else:
+                f = open(partial, 'w', encoding=encoding, newline='\n')
+            with f:
+                yield f, meta
+            meta['created_at'] = time.time()
+            meta_partial = f'{partial}{_META_SUFFIX}'
+            with open(meta_partial, 'w', encoding='utf-8') as mf:
+                json.dump(meta, mf)
+            os.replace(meta_partial, path + _META_SUFFIX)
+            os.replace(partial, path)
+        finally:
+            for leftover in (partial, f'{partial}{_META_SUFFIX}'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self._enforce_limits(key)
+
+    def prune(self, now: Optional[float] = None, keep: Optional[str] = None) -> int:
+        """
+        Удаляет результаты, к которым не обращались ttl секунд, и самые давние
+        сверх max_bytes; незавершенные записи старше ttl тоже удаляются
+
+        Args:
+            keep: ключ результата, который не удаляется из-за размера кэша (только что записанный)
+
+        Returns:
+            int: количество удаленных результатов
+        """
+        now = time.time() if now is None else now
+        entries = []
+        kept_size = 0
+        removed = 0
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                expired = now - stat.st_mtime > self.ttl
+                if name.endswith(_PARTIAL_SUFFIX) or name.endswith(_PARTIAL_SUFFIX + _META_SUFFIX):
+                    if expired:
+                        os.remove(entry.path)
+                    continue
+                if name.endswith(_META_SUFFIX):
+                    # Метаданные без результата (процесс остановился между записью файлов)
+                    if expired and not os.path.exists(entry.path[:-len(_META_SUFFIX)]):
+                        os.remove(entry.path)
+                    continue
+                if expired:
+                    self._remove(entry.path)
+                    removed += 1
+                elif name == keep:
+                    kept_size += stat.st_size
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+
+        total = kept_size + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            removed += 1
+            total -= size
+        if removed:
+            logger.info(f"Из кэша результатов удалено: {removed}, размер кэша {total} байт")
+        return removed
+
+    @staticmethod
+    def _remove(path: str):
+        for name in (path, path + _META_SUFFIX):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+    def _enforce_limits(self, keep: str):
+        # Одновременно каталог просматривает один поток; остальные не ждут его
+        if self._prune_lock.acquire(blocking=False):
+            try:
+                self.prune(keep=keep)
+            finally:
+                self._prune_lock.release()
@@ -0,0 +1,193 @@
+"""
+Контрольные точки запусков импорта (SQLite)
+
+Для каждого запуска хранятся результат с шагами (steps), данные, нужные для
+продолжения (исходные коды, план заказа, скачанные коды), и отправленные
+отчеты с их кодами и статусами. Если процесс остановился или шаг завершился
+ошибкой, запуск можно продолжить: выполненные шаги пропускаются, а заказ и
+уже отправленные отчеты продолжают отслеживаться.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+from columnar import CodeView
+from config import RUN_STORE_DB
+
+logger = logging.getLogger(__name__)
+
+# Статусы запуска
+RUN_RUNNING = 'running'
+RUN_COMPLETED = 'completed'
+RUN_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS run_data (
+    run_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (run_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS run_reports (
+    run_id TEXT NOT NULL,
+    report_id TEXT NOT NULL,
+    gtin TEXT NOT NULL,
+    codes TEXT NOT NULL,
+    status TEXT,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (run_id, report_id)
+) WITHOUT ROWID;
+"""
+
+
+def _json_default(value):
+    # Коды GTIN из CodeBatch (columnar.py) сохраняются списком
+    if isinstance(value, CodeView):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class RunStore:
+    """Хранилище контрольных точек; потокобезопасно (отдельное соединение SQLite на поток)"""
+
+    def __init__(self, path: str = RUN_STORE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save_result(self, run_id: str, result: dict, status: str = RUN_RUNNING):
+        """Сохраняет результат запуска (создает запуск при первом сохранении)"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO runs (run_id, status, result, created_at, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, result = excluded.result, '
+                'updated_at = excluded.updated_at',
+                (run_id, status, json.dumps(result, ensure_ascii=False), now, now)
+            )
+
+    def get(self, run_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            'SELECT run_id, status, result, created_at, updated_at FROM runs WHERE run_id = ?', (run_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'run_id': row[0], 'status': row[1], 'result': json.loads(row[2]),
+                'created_at': row[3], 'updated_at': row[4]}
+
+    def list_runs(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Список запусков (без результата), сначала последние"""
+        query = 'SELECT run_id, status, created_at, updated_at FROM runs'
+        params = []
+        if status:
+            query += ' WHERE status = ?'
+            params.append(status)
+        query += ' ORDER BY updated_at DESC LIMIT ?'
+        params.append(limit)
+        rows = self._connect().execute(query, params)
+        return [dict(zip(('run_id', 'status', 'created_at', 'updated_at'), row)) for row in rows]
+
+    def save_data(self, run_id: str, key: str, value: Any):
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO run_data (run_id, key, value) VALUES (?, ?, ?)',
+                         (run_id, key, json.dumps(value, ensure_ascii=False, default=_json_default)))
+
+    def load_data(self, run_id: str, key: str) -> Any:
+        row = self._connect().execute(
+            'SELECT value FROM run_data WHERE run_id = ? AND key = ?', (run_id, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_report(self, run_id: str, report_id: str, gtin: str, codes: List[str]):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO run_reports (run_id, report_id, gtin, codes, sent_at) VALUES (?, ?, ?, ?, ?)',
+                (run_id, report_id, gtin, json.dumps(codes), time.time())
+            )
+
+    def set_report_status(self, run_id: str, report_id: str, status: str):
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE run_reports SET status = ? WHERE run_id = ? AND report_id = ?',
+                         (status, run_id, report_id))
+
+    def reports(self, run_id: str) -> List[dict]:
+        """
+        Returns:
+            list: [{'report_id', 'gtin', 'codes', 'status'}] в порядке отправки
+        """
+        rows = self._connect().execute(
+            'SELECT report_id, gtin, codes, status FROM run_reports WHERE run_id = ? ORDER BY sent_at', (run_id,)
+        )
+        return [{'report_id': report_id, 'gtin': gtin, 'codes': json.loads(codes), 'status': status}
+                for report_id, gtin, codes, status in rows]
+
+    def prune(self, before: float) -> int:
+        """
+        Удаляет запуски, не обновлявшиеся с момента before
+
+        Returns:
+            int: количество удаленных запусков
+        """
+        conn = self._connect()
+        with conn:
+            run_ids = [row[0] for row in conn.execute(
+                'SELECT run_id FROM runs WHERE updated_at < ?', (before,)
+            )]
+            for table in ('run_reports', 'run_data', 'runs'):
+                conn.executemany(f'DELETE FROM {table} WHERE run_id = ?', ((run_id,) for run_id in run_ids))
+        if run_ids:
+            logger.info(f"Удалено устаревших запусков: {len(run_ids)}")
+        return len(run_ids)
+
+
+class RunCheckpoint:
+    """Контрольные точки одного запуска: RunStore с фиксированным run_id"""
+
+    def __init__(self, store: RunStore, run_id: str):
+        self.store = store
+        self.run_id = run_id
+
+    def save_result(self, result: dict, status: str = RUN_RUNNING):
+        self.store.save_result(self.run_id, result, status)
+
+    def save(self, key: str, value: Any):
+        self.store.save_data(self.run_id, key, value)
+
+    def load(self, key: str) -> Any:
+        return self.store.load_data(self.run_id, key)
+
+    def add_report(self, report_id: str, gtin: str, codes: List[str]):
+        self.store.add_report(self.run_id, report_id, gtin, codes)
+
+    def set_report_status(self, report_id: str, status: str):
+        self.store.set_report_status(self.run_id, report_id, status)
+
+    def reports(self) -> List[dict]:
+        return self.store.reports(self.run_id)
@@ -0,0 +1,240 @@
+"""
+Общее состояние нескольких процессов приложения
+
+Когда приложение запущено несколькими воркерами (uvicorn --workers, gunicorn)
+или в нескольких контейнерах за балансировщиком, запрос о задании может
+попасть не в тот процесс, который его выполняет. Поэтому состояние заданий,
+токен авторизации API и аренды (например, право одного процесса пополнять пул)
+хранятся в общем хранилище, а результаты преобразования - в общем каталоге
+(result_cache.py).
+
+Хранилище подключаемое: SharedStore описывает интерфейс, SQLiteSharedStore -
+реализация по умолчанию, которой достаточно локального диска (или общего тома
+для нескольких контейнеров на одном узле). Другие реализации регистрируются в
+BACKENDS и выбираются настройкой SHARED_STORE.
+"""
+
+import json
+import logging
+from abc import ABC, abstractmethod
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config import SHARED_STORE, SHARED_STORE_DB
+
+logger = logging.getLogger(__name__)
+
+_worker_id: Optional[Tuple[int, str]] = None
+_worker_id_lock = threading.Lock()
+
+
+def worker_id() -> str:
+    """
+    Идентификатор текущего процесса (владелец заданий и аренд)
+
+    Вычисляется при первом обращении в процессе: воркеры, созданные fork после
+    импорта модуля (gunicorn --preload, multiprocessing), получают свои
+    идентификаторы, а не идентификатор родителя.
+    """
+    global _worker_id
+    pid = os.getpid()
+    with _worker_id_lock:
+        if _worker_id is None or _worker_id[0] != pid:
+            _worker_id = (pid, f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}')
+        return _worker_id[1]
+
+
+class SharedStore(ABC):
+    """Интерфейс общего хранилища заданий, токенов и аренд"""
+
+    # Задания
+
+    @abstractmethod
+    def save_job(self, job: dict, owner: str):
+        """Сохраняет снимок задания (Job.to_dict) и отметку активности владельца"""
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Снимок задания с полями owner и heartbeat_at или None"""
+
+    @abstractmethod
+    def touch_jobs(self, job_ids: Iterable[str], owner: str):
+        """Обновляет отметку активности выполняемых заданий"""
+
+    @abstractmethod
+    def prune_jobs(self, before: float):
+        """Удаляет задания, завершенные раньше before"""
+
+    # Токены авторизации
+
+    @abstractmethod
+    def get_token(self, key: str) -> Optional[Tuple[str, float]]:
+        """(токен, момент истечения по time.time()) или None"""
+
+    @abstractmethod
+    def save_token(self, key: str, token: str, expires_at: float):
+        """Сохраняет токен до момента expires_at (по time.time())"""
+
+    @abstractmethod
+    def delete_token(self, key: str, token: str):
+        """Удаляет токен, если он еще текущий"""
+
+    # Аренды
+
+    @abstractmethod
+    def claim_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Получает или продлевает аренду на ttl секунд; False - она у другого владельца"""
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str):
+        """Освобождает аренду, если она у владельца owner"""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    data TEXT NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    finished_at REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tokens (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteSharedStore(SharedStore):
+    """Общее хранилище в SQLite; потокобезопасно и доступно нескольким процессам (WAL)"""
+
+    def __init__(self, path: str = SHARED_STORE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение принадлежит потоку и процессу: после fork открывается новое
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save_job(self, job: dict, owner: str):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, status, owner, data, heartbeat_at, finished_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (job['job_id'], job['status'], owner, json.dumps(job, ensure_ascii=False), time.time(),
+                 job.get('finished_at'))
+            )
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            'SELECT data, owner, heartbeat_at FROM jobs WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[0])
+        job['owner'], job['heartbeat_at'] = row[1], row[2]
+        return job
+
+    def touch_jobs(self, job_ids: Iterable[str], owner: str):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany('UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND owner = ?',
+                             [(now, job_id, owner) for job_id in job_ids])
+
+    def prune_jobs(self, before: float):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (before,))
+
+    def get_token(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._connect().execute('SELECT token, expires_at FROM tokens WHERE key = ?', (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save_token(self, key: str, token: str, expires_at: float):
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO tokens (key, token, expires_at) VALUES (?, ?, ?)',
+                         (key, token, expires_at))
+
+    def delete_token(self, key: str, token: str):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM tokens WHERE key = ? AND token = ?', (key, token))
+
+    def claim_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+                'WHERE leases.owner = excluded.owner OR leases.expires_at < ?',
+                (name, owner, now + ttl, now)
+            )
+            return cursor.rowcount > 0
+
+    def release_lease(self, name: str, owner: str):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+
+
+# Реализации общего хранилища: {название: фабрика}
+BACKENDS: Dict[str, Callable[[], SharedStore]] = {
+    'sqlite': lambda: SQLiteSharedStore(SHARED_STORE_DB),
+}
+
+# Значения SHARED_STORE, при которых состояние хранится только в памяти процесса
+DISABLED_BACKENDS = ('', 'none', 'memory')
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+_store_opened = False
+
+
+def get_shared_store() -> Optional[SharedStore]:
+    """
+    Общее хранилище процесса (открывается при первом обращении)
+
+    Returns:
+        SharedStore или None, если SHARED_STORE отключено (один процесс)
+
+    Raises:
+        ValueError: неизвестное значение SHARED_STORE
+    """
+    global _store, _store_opened
+    with _store_lock:
+        if not _store_opened:
+            backend = SHARED_STORE.lower()
+            if backend not in DISABLED_BACKENDS:
+                factory = BACKENDS.get(backend)
+                if factory is None:
+                    raise ValueError(f"Неизвестное общее хранилище SHARED_STORE={SHARED_STORE}")
+                _store = factory()
+                logger.info(f"Общее хранилище: {backend}, процесс {worker_id()}")
+            _store_opened = True
+        return _store
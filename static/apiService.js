@@ -1,15 +1,113 @@
 // Сервис для работы с API
-import { API_ENDPOINTS } from './constants.js';
+import { API_ENDPOINTS, JOB_STATUS, JOB_EVENTS, JOB_POLL_INTERVAL_MS } from './constants.js';
 
-export const processFiles = async (formData) => {
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+const fetchJob = async (jobId) => {
+    const response = await fetch(`${API_ENDPOINTS.JOBS}/${encodeURIComponent(jobId)}`);
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    return await response.json();
+};
+
+const isFinished = (job) => job.status === JOB_STATUS.COMPLETED || job.status === JOB_STATUS.FAILED;
+
+// Ожидает завершения фонового задания опросом его состояния
+const pollJob = async (jobId, onProgress) => {
+    while (true) {
+        const job = await fetchJob(jobId);
+        
+        if (onProgress && job.result) {
+            onProgress(job.result.steps);
+        }
+        
+        if (isFinished(job)) {
+            return job.result;
+        }
+        
+        await sleep(JOB_POLL_INTERVAL_MS);
+    }
+};
+
+// Ожидает завершения фонового задания по потоку событий (SSE).
+// Шаги приходят по мере изменения; при ошибке потока - переход на опрос
+const streamJob = (jobId, onProgress) => new Promise((resolve, reject) => {
+    const source = new EventSource(`${API_ENDPOINTS.JOBS}/${encodeURIComponent(jobId)}/events`);
+    const steps = new Map();
+    let finished = false;
+    
+    const publishSteps = () => {
+        if (onProgress) {
+            onProgress([...steps.values()].sort((a, b) => a.step - b.step));
+        }
+    };
+    
+    const finish = (job) => {
+        finished = true;
+        source.close();
+        resolve(job.result);
+    };
+    
+    source.addEventListener(JOB_EVENTS.SNAPSHOT, (event) => {
+        const job = JSON.parse(event.data);
+        steps.clear();
+        (job.result?.steps || []).forEach(step => steps.set(step.step, step));
+        publishSteps();
+        if (isFinished(job)) {
+            finish(job);
+        }
+    });
+    
+    const onStep = (event) => {
+        const step = JSON.parse(event.data);
+        steps.set(step.step, step);
+        publishSteps();
+    };
+    source.addEventListener(JOB_EVENTS.STEP, onStep);
+    source.addEventListener(JOB_EVENTS.PROGRESS, onStep);
+    
+    source.addEventListener(JOB_EVENTS.JOB, (event) => {
+        const job = JSON.parse(event.data);
+        if (isFinished(job)) {
+            finish(job);
+        }
+    });
+    
+    source.onerror = () => {
+        if (finished) {
+            return;
+        }
+        finished = true;
+        source.close();
+        pollJob(jobId, onProgress).then(resolve, reject);
+    };
+});
+
+// Ожидает завершения фонового задания, передавая промежуточные шаги в onProgress
+const waitForJob = (jobId, onProgress) => {
+    if (typeof EventSource === 'undefined') {
+        return pollJob(jobId, onProgress);
+    }
+    return streamJob(jobId, onProgress);
+};
+
+export const processFiles = async (formData, onProgress) => {
     const response = await fetch(API_ENDPOINTS.PROCESS, {
         method: 'POST',
         body: formData
     });
     
-    if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
+    const data = await response.json();
+    
+    if (!data.job_id) {
+        if (!response.ok && !data.error) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return data;
     }
     
-    return await response.json();
+    return await waitForJob(data.job_id, onProgress);
 };
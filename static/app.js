@@ -61,7 +61,7 @@ class App {
         const formData = new FormData(this.form);
         
         try {
-            const data = await processFiles(formData);
+            const data = await processFiles(formData, (steps) => this.displayProgress(steps));
             
             if (data.success) {
                 this.displayProgress(data.steps);
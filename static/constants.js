@@ -1,6 +1,26 @@
 // Константы приложения
 export const API_ENDPOINTS = {
-    PROCESS: '/api/process'
+    PROCESS: '/api/process',
+    JOBS: '/api/jobs'
+};
+
+export const JOB_STATUS = {
+    QUEUED: 'queued',
+    RUNNING: 'running',
+    COMPLETED: 'completed',
+    FAILED: 'failed'
+};
+
+export const JOB_POLL_INTERVAL_MS = 1000;
+
+// События потока /api/jobs/<job_id>/events
+export const JOB_EVENTS = {
+    SNAPSHOT: 'snapshot',
+    JOB: 'job',
+    STEP: 'step',
+    PROGRESS: 'progress',
+    REPORT: 'report',
+    REPORT_STATUS: 'report_status'
 };
 
 export const STEP_STATUS = {
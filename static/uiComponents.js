@@ -65,6 +65,13 @@ export const createResultHTML = (data) => {
         infoItems.push(createInfoItem('Заказано кодов:', codesOrdered, true));
     }
     
+    if (data.codes_from_pool && Object.keys(data.codes_from_pool).length > 0) {
+        const codesFromPool = Object.entries(data.codes_from_pool)
+            .map(([gtin, quantity]) => `GTIN ${escapeHtml(gtin)}: ${quantity} шт.`)
+            .join('<br>');
+        infoItems.push(createInfoItem('Взято из пула кодов:', codesFromPool, true));
+    }
+    
     const reportStep = data.steps.find(step => step.reports);
     if (reportStep && reportStep.reports) {
         const reportsInfo = reportStep.reports
@@ -0,0 +1,47 @@
+"""
+Проверки ASGI-точки входа Flask-приложения (asgi.py)
+"""
+
+import a2wsgi
+import pytest
+from starlette.testclient import TestClient
+
+import asgi
+
+CODE = '0104601234567893215abcdefghijkl'
+
+
+@pytest.fixture
+def client():
+    return TestClient(asgi.app)
+
+
+def test_flask_is_mounted_through_a2wsgi():
+    # a2wsgi передает тело запроса Flask по мере поступления, а не после чтения целиком
+    mount = asgi.app.routes[-1]
+    assert isinstance(mount.app, a2wsgi.WSGIMiddleware)
+
+
+def test_flask_upload_through_asgi(client):
+    body = ('\n'.join([CODE, 'not a code']) + '\n').encode()
+
+    response = client.post('/api/validate', files={'codes_file': ('codes.txt', body)})
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report['codes_total'] == 2
+    assert report['codes_rejected'] == 1
+
+
+def test_flask_routes_and_metrics_through_asgi(client):
+    assert client.get('/api/jobs/unknown').status_code == 404
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'route="/api/jobs/<job_id>"' in response.text
+
+
+def test_job_events_of_unknown_job(client):
+    response = client.get('/api/jobs/unknown/events')
+
+    assert response.status_code == 404
+    assert response.json()['success'] is False
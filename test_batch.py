@@ -0,0 +1,70 @@
+"""
+Проверки пакетной обработки партий (batch.py)
+"""
+
+import json
+import os
+
+import pytest
+
+import batch
+from gs1 import convert_code
+
+GTIN = '04601234567893'
+CODES = [f'01{GTIN}215abc{index:09d}' for index in range(3)]
+
+# Подготовка партии с этим именем прерывается (см. crashing_prepare_shipment)
+FAILING_SHIPMENT = 'broken'
+_prepare_shipment = batch.prepare_shipment
+
+
+def write_shipment(directory, name: str) -> batch.Shipment:
+    products_path = directory / f'{name}_products.txt'
+    codes_path = directory / f'{name}_codes.txt'
+    products_path.write_text(f'{GTIN}; product; {len(CODES)}\n', encoding='utf-8')
+    codes_path.write_text('\n'.join(CODES) + '\n', encoding='utf-8')
+    return batch.Shipment(name, str(products_path), str(codes_path))
+
+
+def crashing_prepare_shipment(shipment, *args):
+    if shipment.name == FAILING_SHIPMENT:
+        # Авария процесса пула (нехватка памяти, сигнал) - без исключения в самом процессе
+        os._exit(1)
+    return _prepare_shipment(shipment, *args)
+
+
+def raising_prepare_shipment(shipment, *args):
+    if shipment.name == FAILING_SHIPMENT:
+        raise RuntimeError('Ошибка подготовки')
+    return _prepare_shipment(shipment, *args)
+
+
+def test_run_batch_converts_shipments(tmp_path):
+    shipments = [write_shipment(tmp_path, name) for name in ('first', 'second')]
+    output_dir = tmp_path / 'out'
+
+    summary = batch.run_batch(shipments, str(output_dir), workers=2)
+
+    assert summary['statuses'] == {batch.SHIPMENT_CONVERTED: 2}
+    assert [entry['name'] for entry in summary['shipments']] == ['first', 'second']
+    converted = (output_dir / 'first' / batch.CONVERTED_FILE).read_text(encoding='utf-8')
+    assert converted.split('\n') == [convert_code(code) for code in CODES] + ['']
+    with open(output_dir / batch.SUMMARY_FILE, encoding='utf-8') as f:
+        assert json.load(f)['shipments_count'] == 2
+
+
+@pytest.mark.parametrize('prepare', [crashing_prepare_shipment, raising_prepare_shipment])
+def test_run_batch_records_failed_preparation_and_keeps_summary(tmp_path, monkeypatch, prepare):
+    shipments = [write_shipment(tmp_path, name) for name in (FAILING_SHIPMENT, 'first', 'second')]
+    output_dir = tmp_path / 'out'
+    monkeypatch.setattr(batch, 'prepare_shipment', prepare)
+
+    summary = batch.run_batch(shipments, str(output_dir), workers=1)
+
+    entries = {entry['name']: entry for entry in summary['shipments']}
+    assert set(entries) == {FAILING_SHIPMENT, 'first', 'second'}
+    assert entries[FAILING_SHIPMENT]['status'] == batch.SHIPMENT_FAILED
+    assert entries[FAILING_SHIPMENT]['error']
+    assert sum(summary['statuses'].values()) == len(shipments)
+    assert (output_dir / FAILING_SHIPMENT / batch.RESULT_FILE).exists()
+    assert (output_dir / batch.SUMMARY_FILE).exists()
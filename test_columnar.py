@@ -0,0 +1,92 @@
+"""
+Проверки колоночных контейнеров товаров и кодов (columnar.py)
+"""
+
+import pytest
+
+import gs1
+from columnar import CodeBatch, CodeView, ProductTable
+
+GTIN = '04601234567893'
+OTHER_GTIN = '04601234567800'
+
+
+def make_codes(gtin: str, count: int) -> list:
+    return [f'01{gtin}215serial{index:04d}\x1d91EE06' for index in range(count)]
+
+
+def test_product_table_behaves_like_product_list():
+    products = [{'gtin': GTIN, 'description': 'Обувь', 'quantity': 2},
+                {'gtin': OTHER_GTIN, 'description': 'Сапоги', 'quantity': 1},
+                {'gtin': GTIN, 'description': 'Обувь', 'quantity': 3}]
+
+    table = ProductTable.from_products(products)
+
+    assert len(table) == 3
+    assert list(table) == products
+    assert table[1] == products[1]
+    assert table.gtin_set() == {GTIN, OTHER_GTIN}
+    assert table.quantities_by_gtin() == {GTIN: 5, OTHER_GTIN: 1}
+
+
+def test_code_batch_groups_match_split_by_gtin():
+    codes = [code for pair in zip(make_codes(GTIN, 5), make_codes(OTHER_GTIN, 5)) for code in pair]
+    codes.append('garbage')
+
+    batch = CodeBatch.from_codes(codes)
+
+    assert len(batch) == len(codes)
+    assert list(batch) == codes
+    assert batch.code(3) == codes[3]
+    assert bytes(batch.buffer) == ('\n'.join(codes) + '\n').encode()
+    groups = batch.groups()
+    assert groups == gs1.split_by_gtin(codes)
+    assert all(isinstance(view, CodeView) for view in groups.values())
+
+
+def test_code_batch_append_and_extend_with_known_gtins_and_utf8():
+    batch = CodeBatch()
+    batch.append('0104601234567893215код')
+    batch.extend(['x1', 'x2'], gtins=[OTHER_GTIN, None])
+
+    assert list(batch) == ['0104601234567893215код', 'x1', 'x2']
+    assert batch.groups() == {GTIN: ['0104601234567893215код'], OTHER_GTIN: ['x1']}
+
+
+def test_code_batch_iter_buffers_splits_on_whole_lines():
+    codes = make_codes(GTIN, 10)
+    batch = CodeBatch.from_codes(codes)
+
+    blocks = list(batch.iter_buffers(codes_per_block=3))
+
+    assert len(blocks) == 4
+    assert all(block.endswith(b'\n') for block in blocks)
+    assert b''.join(blocks) == bytes(batch.buffer)
+
+
+def test_code_view_slicing_and_split_do_not_copy():
+    codes = make_codes(GTIN, 10)
+    view = CodeBatch.from_codes(codes).groups()[GTIN]
+
+    taken, rest = view.split(4)
+
+    assert taken == codes[:4]
+    assert rest == codes[4:]
+    assert isinstance(rest[1:3], CodeView)
+    assert rest[1:3].batch is view.batch
+    assert rest[1:3] == codes[5:7]
+    assert view[::3] == codes[::3]
+    assert view[-1] == codes[-1]
+    assert list(reversed(view)) == codes[::-1]
+    with pytest.raises(IndexError):
+        view[10]
+
+
+def test_code_view_equality():
+    codes = make_codes(GTIN, 3)
+    view = CodeBatch.from_codes(codes).view()
+
+    assert view == codes
+    assert view == tuple(codes)
+    assert view != codes[:2]
+    assert view[0:0] == []
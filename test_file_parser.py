@@ -0,0 +1,165 @@
+"""
+Проверки разбора файлов (file_parser.py): gzip, zip, CSV, XLSX и определение кодировки
+"""
+
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from file_parser import (
+    GzipDecompressor, iter_code_lines, iter_gunzip, iter_lines, iter_product_file, iter_product_lines, read_code_batch
+)
+
+CODE = '0104601234567893215abc\x1d91EE06'
+
+_XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def make_xlsx(rows, shared_strings=(), sheet_target='worksheets/sheet1.xml') -> bytes:
+    """Минимальная книга XLSX: строки - списки (значение, тип ячейки) начиная с колонки A"""
+    sheet_rows = []
+    for row_num, row in enumerate(rows, 1):
+        cells = ''.join(
+            f'<c r="{chr(ord("A") + col)}{row_num}"{f" t={chr(34)}{cell_type}{chr(34)}" if cell_type else ""}>'
+            f'<v>{value}</v></c>'
+            for col, (value, cell_type) in enumerate(row)
+        )
+        sheet_rows.append(f'<row r="{row_num}">{cells}</row>')
+    strings = ''.join(f'<si><t>{text}</t></si>' for text in shared_strings)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('xl/workbook.xml', f'<workbook xmlns="{_XLSX_NS}" xmlns:r="{_XLSX_REL_NS}">'
+                                            f'<sheets><sheet name="1" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels',
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         f'<Relationship Id="rId1" Target="{sheet_target}"/></Relationships>')
+        archive.writestr('xl/sharedStrings.xml', f'<sst xmlns="{_XLSX_NS}">{strings}</sst>')
+        archive.writestr('xl/worksheets/sheet1.xml',
+                         f'<worksheet xmlns="{_XLSX_NS}"><sheetData>{"".join(sheet_rows)}</sheetData></worksheet>')
+    return buffer.getvalue()
+
+
+def test_gunzip_reads_concatenated_members():
+    data = gzip.compress(b'first\n') + gzip.compress(b'second\n')
+
+    assert b''.join(iter_gunzip([data[:7], data[7:]])) == b'first\nsecond\n'
+
+
+def test_gunzip_rejects_truncated_stream():
+    data = gzip.compress(b'code\n' * 100)
+
+    with pytest.raises(ValueError, match='обрезан'):
+        b''.join(iter_gunzip([data[:-8]]))
+
+
+def test_gunzip_rejects_corrupt_stream():
+    with pytest.raises(ValueError, match='Ошибка распаковки gzip'):
+        b''.join(iter_gunzip([b'\x1f\x8b' + b'\x00' * 20]))
+
+
+def test_gzip_decompressor_bounds_output():
+    bomb = gzip.compress(b'0' * 10_000_000)
+    decompressor = GzipDecompressor(max_output=1_000_000, chunk_size=64 * 1024)
+
+    pieces = []
+    with pytest.raises(ValueError, match='больше 1000000 байт'):
+        for piece in decompressor.decompress(bomb):
+            pieces.append(len(piece))
+    # Ни один вызов zlib не выдал больше chunk_size, распаковка остановлена у предела
+    assert max(pieces) <= 64 * 1024
+    assert sum(pieces) <= 1_000_000
+
+
+def test_gzip_decompressor_drains_output_of_small_input():
+    data = b'0104601234567893215abc\n' * 100_000
+    decompressor = GzipDecompressor(chunk_size=1024)
+
+    assert b''.join(decompressor.decompress(gzip.compress(data))) == data
+    decompressor.finish()
+
+
+def test_iter_lines_falls_back_to_cp1251():
+    data = b'04601234567893;shoes;1\n' + '04601234567893;Обувь;2'.encode('cp1251')
+
+    assert list(iter_lines([data], 'auto')) == ['04601234567893;shoes;1', '04601234567893;Обувь;2']
+
+
+def test_iter_lines_strips_bom_split_across_chunks():
+    data = '\ufeffстрока\nвторая'.encode('utf-8')
+
+    assert list(iter_lines([data[:1], data[1:2], data[2:]], 'auto')) == ['строка', 'вторая']
+
+
+def test_product_file_in_cp1251_gzip():
+    data = gzip.compress('04601234567893;Обувь;2\n'.encode('cp1251'))
+
+    assert list(iter_product_file(io.BytesIO(data), filename='products.txt.gz')) == [
+        {'gtin': '04601234567893', 'description': 'Обувь', 'quantity': 2}
+    ]
+
+
+def test_csv_products_skip_header_and_pad_gtin():
+    data = 'GTIN,Описание,Количество\n4601234567893,"Обувь, женская",3\n'.encode('utf-8')
+
+    assert list(iter_product_lines(io.BytesIO(data), 'products.csv')) == ['', '04601234567893;Обувь, женская;3']
+
+
+def test_csv_code_lines_are_kept_whole():
+    # ';', ',' и '"' - допустимые символы серийного номера и криптохвоста, строка не делится на колонки
+    data = f'code\n0104600000000002215ab;c,d\x1d91EE06\n"0104600000000002215a""b"\n'.encode('utf-8')
+
+    assert list(iter_code_lines(io.BytesIO(data), 'codes.csv')) == [
+        '', '0104600000000002215ab;c,d\x1d91EE06', '0104600000000002215a"b'
+    ]
+
+
+def test_zip_members_are_read_in_order_skipping_service_files():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('a.txt', f'{CODE}\n')
+        archive.writestr('__MACOSX/._a.txt', b'\x00\x05')
+        archive.writestr('b.csv', '"0104601234567893215x;y"\n')
+
+    assert list(iter_code_lines(io.BytesIO(buffer.getvalue()), 'codes.zip')) == [CODE, '0104601234567893215x;y']
+
+
+def test_zip_from_chunks_is_spooled():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('codes.txt', f'{CODE}\n{CODE}\n')
+    data = buffer.getvalue()
+
+    assert len(read_code_batch([data[:10], data[10:]])) == 2
+
+
+def test_xlsx_products_with_shared_strings_and_numbers():
+    data = make_xlsx([
+        [(0, 's'), (1, 's'), (2, 's')],
+        [('4.601234567893E+12', None), (3, 's'), ('5', 'n')],
+    ], shared_strings=['GTIN', 'Описание', 'Количество', 'Обувь; женская'])
+
+    assert list(iter_product_lines(io.BytesIO(data), 'products.xlsx')) == ['', '04601234567893;Обувь, женская;5']
+
+
+def test_xlsx_codes_take_first_column():
+    code = '0104601234567893215abc[GS]91EE06'
+    data = make_xlsx([[(0, 's'), ('7', None)]], shared_strings=[code])
+
+    assert list(iter_code_lines(io.BytesIO(data), 'codes.xlsx')) == [code]
+
+
+@pytest.mark.parametrize('data, message', [
+    (make_xlsx([[(5, 's')]], shared_strings=['GTIN']), 'отсутствующую общую строку'),
+    (make_xlsx([[('1', None)]], sheet_target='worksheets/missing.xml'), 'нет листа'),
+])
+def test_corrupt_xlsx_is_value_error(data, message):
+    with pytest.raises(ValueError, match=message):
+        list(iter_code_lines(io.BytesIO(data), 'codes.xlsx'))
+
+
+def test_corrupt_zip_is_value_error():
+    with pytest.raises(ValueError, match='Ошибка чтения архива'):
+        list(iter_code_lines(io.BytesIO(b'PK\x03\x04' + b'\x00' * 40), 'codes.zip'))
@@ -0,0 +1,106 @@
+"""
+Проверки разбора и преобразования кодов GS1 (gs1.py)
+"""
+
+import pytest
+
+import gs1
+
+RF_CODE = '0104601234567893215abcdefghijk'
+RB_CODE = '0104601234567893212abcdefghijk'
+
+
+@pytest.mark.parametrize('data', [
+    f'{RF_CODE}\r\n{RF_CODE}\r\n'.encode(),
+    f'\ufeff{RF_CODE}\n{RF_CODE}\n'.encode(),
+    f' {RF_CODE} \n\t{RF_CODE}\n'.encode(),
+])
+def test_convert_buffer_strips_whitespace_cr_and_bom(data):
+    assert bytes(gs1.convert_buffer(data)) == f'{RB_CODE}\n{RB_CODE}\n'.encode()
+
+
+def test_convert_buffer_keeps_trailing_gs():
+    data = f'{RF_CODE}\x1d\n'.encode()
+
+    assert bytes(gs1.convert_buffer(data)) == f'{RB_CODE}\x1d\n'.encode()
+
+
+def test_stream_converter_strips_lines_split_across_chunks():
+    data = f'\ufeff{RF_CODE}\r\n  {RF_CODE}\r'.encode()
+    converter = gs1.StreamConverter()
+
+    out = b''.join(converter.feed(data[index:index + 7]) for index in range(0, len(data), 7)) + converter.flush()
+
+    assert out == f'{RB_CODE}\n{RB_CODE}\n'.encode()
+    assert converter.lines == 2
+
+
+GS_CODE = '0104601234567893215abc\x1d91EE06\x1d92' + 'x' * 44
+
+
+@pytest.mark.parametrize('code, expected', [
+    (GS_CODE, '0104601234567893212abc\x1d91EE06\x1d92' + 'x' * 44),
+    ('0104601234567893215abc[GS]91EE06[GS]92crypto', '0104601234567893212abc[GS]91EE06[GS]92crypto'),
+    (']d20104601234567893215abc\x1d91EE06', ']d20104601234567893212abc\x1d91EE06'),
+    ('0104601234567893215abc\x1d93ab12', '0104601234567893212abc\x1d93ab12'),
+    # Серийный номер не первым элементом - позиция находится разбором
+    ('21512345\x1d0104601234567893', '21212345\x1d0104601234567893'),
+    # Уже код РБ и код, который не разбирается, - без изменений
+    ('0104601234567893212abc', '0104601234567893212abc'),
+    ('garbage', 'garbage'),
+])
+def test_convert_code(code, expected):
+    assert gs1.convert_code(code) == expected
+
+
+def test_convert_code_uses_fixed_offset_when_code_does_not_parse():
+    # Нет разделителя GS перед криптохвостом: серийный номер длиннее 20 символов и разбор невозможен
+    code = '0104601234567893215' + 'a' * 30 + '91EE06'
+    with pytest.raises(gs1.GS1Error):
+        gs1.parse_element_string(code)
+
+    assert gs1.convert_code(code) == '0104601234567893212' + 'a' * 30 + '91EE06'
+    assert gs1.convert_codes([code]) == [gs1.convert_code(code)]
+
+
+def test_convert_buffer_matches_convert_code_for_mixed_lines():
+    codes = [GS_CODE, ']d20104601234567893215abc[GS]93ab12', 'garbage', '', '0104601234567893215xyz']
+    data = ('\n'.join(codes) + '\n').encode()
+
+    assert bytes(gs1.convert_buffer(data)).decode().split('\n') == [gs1.convert_code(code) for code in codes] + ['']
+
+
+def test_convert_buffer_fixed_width_fast_path():
+    data = f'{RF_CODE}\n{RB_CODE}\n{RF_CODE}\n'.encode()
+
+    assert bytes(gs1.convert_buffer(data)) == f'{RB_CODE}\n{RB_CODE}\n{RB_CODE}\n'.encode()
+
+
+def test_stream_converter_handles_chunk_boundaries_and_last_line():
+    codes = [GS_CODE, RF_CODE, ']d20104601234567893215abc\x1d93ab12'] * 50
+    data = '\n'.join(codes).encode()
+    converter = gs1.StreamConverter()
+
+    out = b''.join(converter.feed(data[index:index + 13]) for index in range(0, len(data), 13)) + converter.flush()
+
+    assert out.decode().split('\n') == gs1.convert_codes(codes) + ['']
+    assert converter.lines == len(codes)
+
+
+def test_parse_element_string():
+    assert gs1.parse_element_string(']d20104601234567893215abc[GS]93ab12') == {
+        '01': '04601234567893', '21': '5abc', '93': 'ab12'
+    }
+    with pytest.raises(gs1.GS1Error):
+        gs1.parse_element_string('0104601234567893995abc')
+
+
+def test_split_by_gtin_skips_codes_without_gtin():
+    codes = ['0104601234567893215a', ']d20104601234567893215b', 'garbage']
+
+    assert gs1.split_by_gtin(codes) == {'04601234567893': codes[:2]}
+
+
+def test_gtin_check_digit():
+    assert gs1.is_valid_gtin('04601234567893')
+    assert not gs1.is_valid_gtin('04601234567890')
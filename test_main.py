@@ -0,0 +1,110 @@
+"""
+Проверки FastAPI-приложения (main.py) через TestClient
+"""
+
+import asyncio
+import gzip
+import re
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import gs1
+import main
+
+CODES = ['0104601234567893215abc\x1d91EE06', '0104601234567893215xyz']
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_convert_stream_reads_concatenated_gzip_members(client):
+    body = gzip.compress((CODES[0] + '\n').encode()) + gzip.compress((CODES[1] + '\n').encode())
+
+    response = client.post('/convert/stream', content=body,
+                           headers={'Content-Encoding': 'gzip', 'Accept-Encoding': 'identity'})
+
+    assert response.status_code == 200
+    assert response.text.split('\n') == [gs1.convert_code(code) for code in CODES] + ['']
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('', False),
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('GZIP', True),
+    ('x-gzip', True),
+    ('gzip;q=0', False),
+    ('gzip; q=0.0, identity', False),
+    ('*', True),
+    ('*;q=0', False),
+    ('*, gzip;q=0', False),
+    ('gzip;q=bad', False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert main._accepts_gzip(accept_encoding) is expected
+
+
+def test_convert_stream_respects_refused_gzip(client):
+    response = client.post('/convert/stream', content=(CODES[1] + '\n').encode(),
+                           headers={'Accept-Encoding': 'gzip;q=0'})
+
+    assert response.status_code == 200
+    assert 'content-encoding' not in response.headers
+    assert response.text == gs1.convert_code(CODES[1]) + '\n'
+
+
+@pytest.mark.parametrize('path, request_kwargs', [
+    ('/convert/stream', {'content': b'\x1f\x8bnot gzip', 'headers': {'Content-Encoding': 'gzip'}}),
+    ('/convert/stream/file', {'files': {'codes_file': ('codes.txt.gz', b'not gzip')}}),
+])
+def test_convert_stream_rejects_corrupt_gzip_before_response(client, path, request_kwargs):
+    response = client.post(path, **request_kwargs)
+
+    assert response.status_code == 400
+    assert 'gzip' in response.json()['detail']
+
+
+def test_convert_download_wildcard_etag_requires_cached_result(client):
+    # Уникальный список кодов: результата еще нет в кэше
+    codes = [f'0104601234567893215{uuid.uuid4().hex[:8]}']
+    request_kwargs = {'json': {'codes': codes}, 'headers': {'If-None-Match': '*'}}
+
+    response = client.post('/convert/download', **request_kwargs)
+    assert response.status_code == 200
+    assert response.text == gs1.convert_code(codes[0]) + '\n'
+    etag = response.headers['etag']
+
+    assert client.post('/convert/download', **request_kwargs).status_code == 304
+    response = client.post('/convert/download', json={'codes': codes}, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_process_parses_and_converts_off_event_loop(client, monkeypatch):
+    loop_threads = []
+    iter_product_file = main.iter_product_file
+
+    def tracking_iter_product_file(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            loop_threads.append(True)
+        except RuntimeError:
+            loop_threads.append(False)
+        return iter_product_file(*args, **kwargs)
+
+    monkeypatch.setattr(main, 'iter_product_file', tracking_iter_product_file)
+    code = f'0104601234567893215{uuid.uuid4().hex[:8]}'
+
+    response = client.post('/process', files={
+        'product_file': ('products.txt', b'04601234567893; product; 1\n'),
+        'codes_file': ('codes.txt', (code + '\n').encode()),
+    })
+
+    assert response.status_code == 200
+    # Разбор файлов выполняется в пуле потоков, а не в потоке цикла событий
+    assert loop_threads == [False]
+    download_url = re.search(r'href="(/download/[0-9a-f]{64})"', response.text).group(1)
+    assert client.get(download_url).text == gs1.convert_code(code) + '\n'
@@ -0,0 +1,83 @@
+"""
+Проверки метрик Prometheus (metrics.py)
+"""
+
+import multiprocessing
+import os
+import uuid
+
+import pytest
+
+import metrics
+
+
+def record_in_child(endpoint: str):
+    """Значения воркера, завершившегося до запроса /metrics"""
+    metrics.RESULT_CACHE_REQUESTS.labels(endpoint, 'hit').inc(3)
+    metrics.CONVERT_SECONDS.labels(endpoint).observe(0.1)
+    metrics.API_CONCURRENCY_LIMIT.set(8)
+    metrics.write_snapshot()
+
+
+@pytest.fixture
+def multiproc_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_MULTIPROC_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, '_snapshot_file', None)
+    return tmp_path
+
+
+def test_metric_without_value_type_is_abstract():
+    class Untyped(metrics._Metric):
+        kind = 'untyped'
+
+    with pytest.raises(TypeError):
+        Untyped('datamark_test_untyped', 'Метрика без типа значения')
+
+
+def test_render_process_metrics():
+    endpoint = f'test-{uuid.uuid4().hex[:8]}'
+    metrics.RESULT_CACHE_REQUESTS.labels(endpoint, 'miss').inc()
+    metrics.CONVERT_SECONDS.labels(endpoint).observe(0.2)
+
+    text = metrics.render()
+
+    assert f'datamark_result_cache_requests_total{{endpoint="{endpoint}",outcome="miss"}} 1.0' in text
+    assert f'datamark_convert_seconds_bucket{{endpoint="{endpoint}",le="0.1"}} 0' in text
+    assert f'datamark_convert_seconds_bucket{{endpoint="{endpoint}",le="0.25"}} 1' in text
+    assert f'datamark_convert_seconds_count{{endpoint="{endpoint}"}} 1' in text
+    assert 'worker="' not in text
+
+
+def test_render_merges_values_of_all_processes(multiproc_dir):
+    endpoint = f'test-{uuid.uuid4().hex[:8]}'
+    metrics.RESULT_CACHE_REQUESTS.labels(endpoint, 'hit').inc(2)
+    metrics.CONVERT_SECONDS.labels(endpoint).observe(0.2)
+    metrics.API_CONCURRENCY_LIMIT.set(4)
+    context = multiprocessing.get_context('fork')
+    child = context.Process(target=record_in_child, args=(endpoint,))
+    child.start()
+    child.join(timeout=10)
+    assert child.exitcode == 0
+    # Поврежденный файл (например, запись прервана) не мешает отдать остальные значения
+    (multiproc_dir / 'broken.json').write_text('{')
+
+    text = metrics.render()
+
+    # Счетчики и гистограммы - сумма процессов, в том числе завершившегося
+    assert f'datamark_result_cache_requests_total{{endpoint="{endpoint}",outcome="hit"}} 5.0' in text
+    assert f'datamark_convert_seconds_bucket{{endpoint="{endpoint}",le="0.1"}} 1' in text
+    assert f'datamark_convert_seconds_bucket{{endpoint="{endpoint}",le="0.25"}} 2' in text
+    assert f'datamark_convert_seconds_count{{endpoint="{endpoint}"}} 2' in text
+    # Текущие значения - только работающих процессов, с меткой worker
+    assert f'datamark_api_concurrency_limit{{worker="{os.getpid()}"}} 4.0' in text
+    assert f'worker="{child.pid}"' not in text
+    assert len([name for name in os.listdir(multiproc_dir) if name.endswith('.json')]) == 3
+
+
+def test_start_multiprocess_without_directory_does_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_MULTIPROC_DIR', '')
+    monkeypatch.setattr(metrics, '_flushing_pid', None)
+
+    metrics.start_multiprocess()
+
+    assert metrics._flushing_pid is None
@@ -0,0 +1,170 @@
+"""
+Сквозные проверки ImportPipeline на локальной замене API Datamark (fake_server из conftest.py)
+"""
+
+import threading
+import time
+
+import pytest
+
+from code_ledger import CodeLedger
+from gs1 import gtin_check_digit
+from pipeline import ImportPipeline, ReportPoller, build_import_result
+from run_store import RunStore, RunCheckpoint
+
+
+def make_gtin(number: int) -> str:
+    body = '0460123456%03d' % number
+    return body + gtin_check_digit(body)
+
+
+def make_codes(gtin: str, count: int, prefix: str = 'S') -> list:
+    return [f'01{gtin}21{prefix}{gtin[-4:]}{index:06d}' for index in range(count)]
+
+
+def make_import(gtin_quantities: dict, gtin_to_codes: dict) -> tuple:
+    """(коды по GTIN, начальный результат) - как после разбора файлов"""
+    codes_count = sum(len(codes) for codes in gtin_to_codes.values())
+    result = build_import_result(sum(gtin_quantities.values()), codes_count, gtin_quantities, gtin_to_codes)
+    return {gtin: list(codes) for gtin, codes in gtin_to_codes.items()}, result
+
+
+def reports_codes(result: dict) -> int:
+    step = next(step for step in result['steps'] if step['step'] == 5)
+    return sum(report['codes_count'] for report in step['reports'])
+
+
+class PendingReportsClient:
+    """Клиент API, у которого отчеты никогда не завершаются"""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get_report_status(self, report_id):
+        self.requests += 1
+        return 'in_progress'
+
+
+class InterruptingCheckpoint(RunCheckpoint):
+    """Контрольная точка, после записи второго отчета прерывающая запуск (как остановка процесса)"""
+
+    def __init__(self, store: RunStore, run_id: str):
+        super().__init__(store, run_id)
+        self.reports_added = 0
+
+    def add_report(self, report_id, gtin, codes):
+        super().add_report(report_id, gtin, codes)
+        self.reports_added += 1
+        if self.reports_added == 2:
+            raise RuntimeError('Процесс остановлен')
+
+
+def test_report_poller_stop_cancels_polling():
+    client = PendingReportsClient()
+    progress = []
+    poller = ReportPoller(client, max_wait=300, on_progress=progress.append)
+    poller.add('report')
+    thread = threading.Thread(target=poller.run)
+    thread.start()
+    time.sleep(0.1)
+
+    poller.stop()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    requests, rounds = client.requests, len(progress)
+    time.sleep(0.1)
+    assert (client.requests, len(progress)) == (requests, rounds)
+
+
+def test_import_orders_missing_codes_and_completes(fake_server, api_client):
+    complete, partial = make_gtin(1), make_gtin(2)
+    gtin_to_codes, result = make_import({complete: 2, partial: 5},
+                                        {complete: make_codes(complete, 2), partial: make_codes(partial, 2)})
+
+    result = ImportPipeline(api_client, gtin_to_codes, result).run()
+
+    assert result['success']
+    assert result['final_status'] == 'completed'
+    assert result['codes_to_order'] == {partial: 3}
+    assert reports_codes(result) == 7
+    assert [step['status'] for step in result['steps']] == ['completed'] * 6
+    stats = fake_server.state.stats()
+    assert stats['orders'] == 1
+    assert stats['reports'] == 2
+
+
+@pytest.mark.fake_datamark(rate_limit=3)
+def test_import_retries_throttled_requests(fake_server, api_client):
+    gtins = [make_gtin(number) for number in range(4)]
+    gtin_to_codes, result = make_import({gtin: 3 for gtin in gtins}, {gtin: make_codes(gtin, 1) for gtin in gtins})
+
+    result = ImportPipeline(api_client, gtin_to_codes, result).run()
+
+    assert result['final_status'] == 'completed'
+    assert reports_codes(result) == 12
+    # Ответы 429 с Retry-After были, но все запросы в итоге выполнены
+    assert fake_server.state.responses['429'] > 0
+    assert fake_server.state.stats()['reports'] == len(gtins)
+
+
+def test_import_resumes_from_checkpoint(fake_server, api_client, tmp_path):
+    gtins = [make_gtin(number) for number in range(3)]
+    gtin_to_codes, result = make_import({gtin: 4 for gtin in gtins}, {gtin: make_codes(gtin, 1) for gtin in gtins})
+    store = RunStore(str(tmp_path / 'runs.sqlite3'))
+
+    with pytest.raises(RuntimeError):
+        ImportPipeline(api_client, gtin_to_codes, result, checkpoint=InterruptingCheckpoint(store, 'run')).run()
+    assert store.get('run')['status'] != 'completed'
+    # Опрос статусов прерванного запуска остановлен и не пишет в контрольную точку параллельно с продолжением
+    assert not [thread for thread in threading.enumerate() if thread.name == 'report-poller']
+    sent_before = fake_server.state.stats()['reports']
+    recorded = len(RunCheckpoint(store, 'run').reports())
+
+    result = ImportPipeline(api_client, {}, store.get('run')['result'], checkpoint=RunCheckpoint(store, 'run'),
+                            resume=True).run()
+
+    assert result['final_status'] == 'completed'
+    assert result['resumed'] == 1
+    assert reports_codes(result) == 12
+    stats = fake_server.state.stats()
+    # Заказ не повторяется, записанные в контрольную точку отчеты не отправляются заново
+    assert stats['orders'] == 1
+    assert stats['reports'] == sent_before + len(gtins) - recorded
+    assert store.get('run')['status'] == 'completed'
+
+
+def test_checkpoint_stores_input_once_and_downloaded_codes_separately(fake_server, api_client, tmp_path):
+    gtin = make_gtin(1)
+    gtin_to_codes, result = make_import({gtin: 4}, {gtin: make_codes(gtin, 1)})
+    store = RunStore(str(tmp_path / 'runs.sqlite3'))
+
+    result = ImportPipeline(api_client, gtin_to_codes, result, checkpoint=RunCheckpoint(store, 'run')).run()
+
+    assert result['final_status'] == 'completed'
+    keys = {row[0] for row in store._connect().execute("SELECT key FROM run_data WHERE run_id = 'run'")}
+    assert keys == {'input', 'plan', 'received'}
+    assert store.load_data('run', 'input')['gtin_to_codes'] == {gtin: make_codes(gtin, 1)}
+    received = store.load_data('run', 'received')
+    assert len(received[gtin]) == 3
+    assert set(received[gtin]).isdisjoint(make_codes(gtin, 1))
+
+
+def test_import_skips_codes_already_in_ledger(fake_server, api_client, tmp_path):
+    gtin = make_gtin(1)
+    codes = make_codes(gtin, 3)
+    ledger = CodeLedger(str(tmp_path / 'ledger.sqlite3'))
+
+    gtin_to_codes, result = make_import({gtin: 3}, {gtin: codes})
+    result = ImportPipeline(api_client, gtin_to_codes, result, ledger=ledger).run()
+    assert result['final_status'] == 'completed'
+    assert fake_server.state.stats()['reports'] == 1
+
+    gtin_to_codes, result = make_import({gtin: 3}, {gtin: codes})
+    result = ImportPipeline(api_client, gtin_to_codes, result, ledger=ledger).run()
+
+    assert result['final_status'] == 'completed'
+    report_step = next(step for step in result['steps'] if step['step'] == 5)
+    assert report_step['message'] == 'Все коды уже введены в оборот'
+    assert sum(report_step['skipped_codes'].values()) == 3
+    assert fake_server.state.stats()['reports'] == 1
@@ -0,0 +1,157 @@
+"""
+Проверки ограничения нагрузки на API (rate_limit.py)
+"""
+
+import threading
+import time
+
+import pytest
+
+from rate_limit import (
+    AIMDLimiter, ApiLimiter, TokenBucket, parse_rates,
+    ENDPOINT_ORDER, ENDPOINT_REPORT, OUTCOME_NEUTRAL, OUTCOME_OVERLOAD, OUTCOME_SUCCESS
+)
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('', {}),
+    (None, {}),
+    ('auth=1, order=2.5,', {'auth': 1.0, 'order': 2.5}),
+    ('report=0', {'report': 0.0}),
+])
+def test_parse_rates(spec, expected):
+    assert parse_rates(spec) == expected
+
+
+def test_token_bucket_spends_burst_then_waits_for_rate():
+    started = time.monotonic()
+    bucket = TokenBucket(rate=20, burst=2)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    waited = bucket.acquire()
+
+    # Третий маркер появляется не раньше 1/rate после создания корзины
+    assert 0 < waited <= 0.051
+    assert time.monotonic() - started >= 0.049
+
+
+def test_token_bucket_without_rate_does_not_wait():
+    bucket = TokenBucket(rate=0)
+
+    assert all(bucket.acquire() == 0 for _ in range(100))
+
+
+def test_token_bucket_pause_applies_without_rate_and_refills_from_zero():
+    unlimited = TokenBucket(rate=0)
+    started = time.monotonic()
+    unlimited.pause(0.1)
+    assert unlimited.acquire() > 0
+    assert time.monotonic() - started >= 0.099
+
+    bucket = TokenBucket(rate=20, burst=5)
+    started = time.monotonic()
+    bucket.pause(0.1)
+    # После паузы запаса нет: первый маркер появляется через 1/rate
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.149
+
+
+def test_token_bucket_shorter_pause_does_not_shorten_longer_one():
+    bucket = TokenBucket(rate=0)
+    started = time.monotonic()
+    bucket.pause(0.2)
+    bucket.pause(0.05)
+
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.199
+
+
+def test_aimd_limiter_bounds_and_adjusts_limit():
+    limiter = AIMDLimiter(initial=4, minimum=1, maximum=5)
+
+    started = limiter.acquire()
+    limiter.release(started, OUTCOME_SUCCESS)
+    assert limiter.limit == pytest.approx(4.25)
+
+    started = limiter.acquire()
+    limiter.release(started, OUTCOME_OVERLOAD)
+    assert limiter.limit == pytest.approx(2.125)
+
+    started = limiter.acquire()
+    limiter.release(started, OUTCOME_NEUTRAL)
+    assert limiter.limit == pytest.approx(2.125)
+    assert limiter.in_flight == 0
+
+    for _ in range(5):
+        limiter.release(limiter.acquire(), OUTCOME_OVERLOAD)
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.release(limiter.acquire(), OUTCOME_SUCCESS)
+    assert limiter.limit == 5
+
+
+def test_aimd_limiter_decreases_once_per_generation():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8)
+    started = [limiter.acquire() for _ in range(3)]
+
+    for request_started in started:
+        limiter.release(request_started, OUTCOME_OVERLOAD)
+
+    # Три ответа 429 на запросы, начатые до уменьшения, уменьшают лимит один раз
+    assert limiter.limit == 4
+
+
+def test_aimd_limiter_blocks_over_limit_until_release():
+    limiter = AIMDLimiter(initial=1, minimum=1, maximum=1)
+    started = limiter.acquire()
+    acquired = threading.Event()
+
+    def second():
+        limiter.release(limiter.acquire(), OUTCOME_NEUTRAL)
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    limiter.release(started, OUTCOME_NEUTRAL)
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_paused_endpoint_does_not_hold_concurrency_slot():
+    limiter = ApiLimiter(rates={}, initial=1, minimum=1, maximum=1)
+    limiter.pause(ENDPOINT_ORDER, 0.5)
+    order_done = threading.Event()
+
+    def order():
+        with limiter.slot(ENDPOINT_ORDER):
+            order_done.set()
+
+    thread = threading.Thread(target=order)
+    thread.start()
+    time.sleep(0.05)
+
+    # Заказ ждет окончания паузы, а единственное место свободно для отчетов
+    started = time.monotonic()
+    with limiter.slot(ENDPOINT_REPORT) as slot:
+        slot.outcome = OUTCOME_SUCCESS
+    assert time.monotonic() - started < 0.2
+    assert not order_done.is_set()
+
+    thread.join(timeout=5)
+    assert order_done.is_set()
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_slot_reports_outcome_on_error():
+    limiter = ApiLimiter(rates={}, initial=4, minimum=1, maximum=4)
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot(ENDPOINT_REPORT) as slot:
+            slot.outcome = OUTCOME_OVERLOAD
+            raise RuntimeError('Таймаут')
+
+    assert limiter.concurrency.in_flight == 0
+    assert limiter.concurrency.limit == 2
@@ -0,0 +1,75 @@
+"""
+Проверки фонового пополнения пула кодов (replenisher.py) на локальной замене API Datamark
+"""
+
+import threading
+
+import pytest
+from starlette.testclient import TestClient
+
+import api_client as api_client_module
+import app
+import asgi
+from code_pool import CodePool
+from gs1 import gtin_check_digit
+from replenisher import Replenisher, plan_replenishment
+
+
+def make_gtin(number: int) -> str:
+    body = '0460123456%03d' % number
+    return body + gtin_check_digit(body)
+
+
+def replenisher_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread.name == 'code-pool-replenisher']
+
+
+def test_plan_replenishment():
+    popular, rare, stocked = make_gtin(1), make_gtin(2), make_gtin(3)
+    demand = {
+        popular: {'runs': 3, 'total': 30, 'average': 10.0},
+        rare: {'runs': 1, 'total': 50, 'average': 50.0},
+        stocked: {'runs': 2, 'total': 20, 'average': 10.0},
+    }
+
+    plan = plan_replenishment(demand, {popular: 4, stocked: 25}, min_runs=2, low_water_runs=1,
+                              target_runs=3, max_order=20)
+
+    assert set(plan) == {popular, stocked}
+    assert plan[popular] == {'stock': 4, 'low_water': 10, 'target': 30, 'order': 20}
+    assert plan[stocked]['order'] == 0
+
+
+@pytest.mark.fake_datamark(order_delay=0.5)
+def test_replenisher_adds_codes_as_they_are_issued(fake_server, api_client, tmp_path, monkeypatch):
+    gtin = make_gtin(1)
+    pool = CodePool(str(tmp_path / 'code_pool.sqlite3'))
+    pool.record_demand({gtin: 5})
+    pool.record_demand({gtin: 5})
+    monkeypatch.setattr(api_client_module, 'CHECK_INTERVAL', 0.05)
+    # Коды скачиваются постранично по мере выпуска, без ожидания выполнения всего заказа
+    monkeypatch.setattr(api_client, 'wait_for_order_completion', None)
+    monkeypatch.setattr(api_client, 'download_codes', None)
+    replenisher = Replenisher(api_client, pool)
+
+    plan = replenisher.check()
+
+    assert plan[gtin]['order'] == 15
+    assert pool.available() == {gtin: 15}
+    state = replenisher.state()
+    assert state['in_progress'] is False
+    assert state['downloaded'] == 15
+    assert state['last_order_id']
+    assert fake_server.state.stats()['orders'] == 1
+
+
+def test_replenisher_starts_with_worker_not_on_import(api_client, tmp_path, monkeypatch):
+    assert not replenisher_threads()
+    replenisher = Replenisher(api_client, CodePool(str(tmp_path / 'code_pool.sqlite3')), interval=3600)
+    monkeypatch.setattr(app, 'replenisher', replenisher)
+
+    with TestClient(asgi.app):
+        assert len(replenisher_threads()) == 1
+
+    replenisher._thread.join(timeout=5)
+    assert not replenisher_threads()
@@ -0,0 +1,164 @@
+"""
+Проверки кэша результатов преобразования (result_cache.py)
+"""
+
+import os
+import time
+
+import pytest
+
+from result_cache import ResultCache, cache_key, etag, etag_matches, iter_code_list
+
+KEY = 'a' * 64
+OTHER_KEY = 'b' * 64
+
+
+def write_result(cache: ResultCache, key: str, text: str, **meta):
+    with cache.create(key) as (f, entry_meta):
+        f.write(text)
+        entry_meta.update(meta)
+
+
+def set_accessed(cache: ResultCache, key: str, timestamp: float):
+    path = os.path.join(cache.directory, key)
+    os.utime(path, (timestamp, timestamp))
+
+
+def test_cache_key_depends_on_params_and_content():
+    key = cache_key({'conversion': 'rf_to_rb'}, [b'01', b'23'])
+
+    assert key == cache_key({'conversion': 'rf_to_rb'}, [b'0123'])
+    assert key != cache_key({'conversion': 'rb_to_rf'}, [b'0123'])
+    assert key != cache_key({'conversion': 'rf_to_rb'}, [b'0124'])
+
+
+def test_iter_code_list_separates_codes_unambiguously():
+    params = {'conversion': 'rf_to_rb'}
+
+    assert (cache_key(params, iter_code_list(['ab', 'c'])) !=
+            cache_key(params, iter_code_list(['a', 'bc'])))
+    assert (cache_key(params, iter_code_list(['a\nb'])) !=
+            cache_key(params, iter_code_list(['a', 'b'])))
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('', False),
+    (f'"{KEY}"', True),
+    (f'W/"{KEY}"', True),
+    (f'"{OTHER_KEY}", "{KEY}"', True),
+    (f'"{OTHER_KEY}"', False),
+    (KEY, False),
+    ('*', True),
+])
+def test_etag_matches(header, expected):
+    assert etag(KEY) == f'"{KEY}"'
+    assert etag_matches(header, KEY) is expected
+
+
+def test_wildcard_etag_matches_only_existing_result():
+    assert etag_matches('*', KEY, exists=False) is False
+    assert etag_matches(f'*, "{KEY}"', KEY, exists=False) is True
+
+
+def test_create_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024)
+
+    assert cache.get(KEY) is None
+    write_result(cache, KEY, 'code\n', codes_count=1)
+
+    entry = cache.get(KEY)
+    assert entry.etag == etag(KEY)
+    assert entry.meta['codes_count'] == 1
+    with open(entry.path, encoding='utf-8') as f:
+        assert f.read() == 'code\n'
+    assert sorted(os.listdir(tmp_path)) == [KEY, KEY + '.json']
+
+
+def test_failed_create_leaves_no_result(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024)
+
+    with pytest.raises(RuntimeError):
+        with cache.create(KEY) as (f, meta):
+            f.write('partial')
+            raise RuntimeError('Ошибка преобразования')
+
+    assert cache.get(KEY) is None
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('key', ['', 'A' * 64, 'a' * 63, '../' + 'a' * 61])
+def test_invalid_key(tmp_path, key):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024)
+
+    assert cache.get(key) is None
+    with pytest.raises(ValueError):
+        with cache.create(key):
+            pass
+
+
+def test_disabled_cache_keeps_results_for_download(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024, enabled=False)
+    write_result(cache, KEY, 'code\n')
+
+    assert cache.get(KEY) is None
+    assert cache.path(KEY) == os.path.join(str(tmp_path), KEY)
+
+
+def test_expired_result_is_not_returned_and_pruned(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024)
+    write_result(cache, KEY, 'code\n')
+    set_accessed(cache, KEY, time.time() - 120)
+
+    assert cache.get(KEY) is None
+    assert cache.prune() == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_access_extends_ttl(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024)
+    write_result(cache, KEY, 'code\n')
+    set_accessed(cache, KEY, time.time() - 30)
+
+    assert cache.get(KEY) is not None
+    assert cache.prune(now=time.time() + 45) == 0
+    assert cache.get(KEY) is not None
+
+
+def test_prune_removes_least_recently_used_over_max_bytes(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=3600, max_bytes=25)
+    now = time.time()
+    write_result(cache, KEY, 'x' * 10)
+    set_accessed(cache, KEY, now - 20)
+    write_result(cache, OTHER_KEY, 'y' * 10)
+    set_accessed(cache, OTHER_KEY, now - 10)
+
+    # Третий результат не помещается: удаляется самый давний по обращению, только что записанный остается
+    newest = 'c' * 64
+    write_result(cache, newest, 'z' * 10)
+
+    assert cache.get(KEY) is None
+    assert cache.get(OTHER_KEY) is not None
+    assert cache.get(newest) is not None
+
+
+def test_prune_keeps_just_written_result_over_max_bytes(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=3600, max_bytes=5)
+
+    write_result(cache, KEY, 'x' * 10)
+
+    assert cache.get(KEY) is not None
+
+
+def test_prune_removes_stale_partial_and_orphan_metadata(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, max_bytes=1024)
+    old = time.time() - 120
+    for name in (f'{KEY}.0123.part', f'{KEY}.0123.part.json', f'{OTHER_KEY}.json'):
+        path = tmp_path / name
+        path.write_text('{}')
+        os.utime(path, (old, old))
+    fresh = tmp_path / f'{KEY}.4567.part'
+    fresh.write_text('')
+
+    assert cache.prune() == 0
+    assert os.listdir(tmp_path) == [fresh.name]
@@ -0,0 +1,74 @@
+"""
+Проверки общего состояния процессов (shared_state.py)
+"""
+
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import shared_state
+from shared_state import SharedStore, SQLiteSharedStore, worker_id
+
+
+def child_worker_id(queue):
+    queue.put((os.getpid(), worker_id()))
+
+
+def test_shared_store_is_abstract():
+    class PartialStore(SharedStore):
+        def get_job(self, job_id):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_worker_id_is_computed_per_process():
+    parent = worker_id()
+    assert parent == worker_id()
+    assert f':{os.getpid()}:' in parent
+
+    # Процесс, созданный fork после первого обращения, получает свой идентификатор
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=child_worker_id, args=(queue,))
+    process.start()
+    child_pid, child = queue.get(timeout=10)
+    process.join(timeout=10)
+
+    assert child != parent
+    assert f':{child_pid}:' in child
+    assert shared_state.worker_id() == parent
+
+
+def test_lease_belongs_to_one_owner(tmp_path):
+    store = SQLiteSharedStore(str(tmp_path / 'shared.sqlite3'))
+
+    assert store.claim_lease('replenish', 'first', ttl=60)
+    assert store.claim_lease('replenish', 'first', ttl=60)
+    assert not store.claim_lease('replenish', 'second', ttl=60)
+
+    store.release_lease('replenish', 'first')
+    assert store.claim_lease('replenish', 'second', ttl=0.01)
+    time.sleep(0.02)
+    assert store.claim_lease('replenish', 'first', ttl=60)
+
+
+def test_jobs_and_tokens(tmp_path):
+    store = SQLiteSharedStore(str(tmp_path / 'shared.sqlite3'))
+
+    store.save_job({'job_id': 'job', 'status': 'running'}, owner='worker')
+    job = store.get_job('job')
+    assert (job['status'], job['owner']) == ('running', 'worker')
+    store.save_job({'job_id': 'job', 'status': 'completed', 'finished_at': time.time() - 10}, owner='worker')
+    store.prune_jobs(before=time.time())
+    assert store.get_job('job') is None
+
+    store.save_token('api', 'token', expires_at=100.0)
+    assert store.get_token('api') == ('token', 100.0)
+    store.delete_token('api', 'other')
+    assert store.get_token('api') == ('token', 100.0)
+    store.delete_token('api', 'token')
+    assert store.get_token('api') is None
@@ -0,0 +1,97 @@
+"""
+Проверки предварительной проверки файлов (validator.py)
+"""
+
+import csv
+
+import validator
+from validator import Validator, validate_files
+
+GTIN = '04601234567893'
+OTHER_GTIN = '04601234567800'
+SERIAL = '5abcdefghijkl'
+
+
+def code(gtin: str = GTIN, serial: str = SERIAL, tail: str = '\x1d91EE06\x1d92crypto') -> str:
+    return f'01{gtin}21{serial}{tail}'
+
+
+def errors_by_line(checked: Validator) -> dict:
+    return {(item['file'], item['line']): item['error'] for item in checked.iter_diagnostics()}
+
+
+def test_products_are_checked_and_valid_ones_kept():
+    checked = Validator('shoes')
+    products = checked.validate_products([
+        f'{GTIN};Обувь;2',
+        '4601234567893;Без нуля;1',
+        '04601234567890;Контрольная цифра;1',
+        f'{OTHER_GTIN};Ноль;0',
+        'строка без разделителей',
+        '',
+    ])
+
+    assert [product['gtin'] for product in products] == [GTIN]
+    assert errors_by_line(checked) == {
+        ('products', 2): validator.ERROR_GTIN_FORMAT,
+        ('products', 3): validator.ERROR_GTIN_CHECK_DIGIT,
+        ('products', 4): validator.ERROR_QUANTITY,
+        ('products', 5): validator.ERROR_FORMAT,
+    }
+    assert checked.totals['products'] == 5
+    assert not checked.valid
+
+
+def test_codes_are_checked_against_products_and_rules():
+    lines = [
+        code(),
+        code(tail='[GS]91EE06'),                     # тот же код с другим разделителем - повтор
+        code(serial='5short'),                       # длина серийного номера для shoes - 13
+        code(gtin=OTHER_GTIN),                       # GTIN не из файла товаров
+        ']d2' + code(serial='5bcdefghijklm'),        # нестандартная форма разбирается
+        f'21{SERIAL}',                               # нет AI 01
+        '99garbage',
+    ]
+
+    products, codes, checked = validate_files([f'{GTIN};Обувь;3'], lines, product_group='shoes')
+
+    assert list(codes) == [lines[0], lines[4]]
+    assert errors_by_line(checked) == {
+        ('codes', 2): validator.ERROR_DUPLICATE,
+        ('codes', 3): validator.ERROR_SERIAL_LENGTH,
+        ('codes', 4): validator.ERROR_UNKNOWN_GTIN,
+        ('codes', 6): validator.ERROR_MISSING_AI,
+        ('codes', 7): validator.ERROR_STRUCTURE,
+    }
+    report = checked.report()
+    assert report['codes_total'] == 7
+    assert report['codes_rejected'] == 5
+    assert report['errors'][validator.ERROR_DUPLICATE] == 1
+
+
+def test_codes_without_products_check_gtin_only():
+    checked = Validator('unknown-group')
+
+    codes = checked.validate_codes([code(gtin=OTHER_GTIN), code(gtin='04601234567890'), code(serial='5x')])
+
+    assert list(codes) == [code(gtin=OTHER_GTIN), code(serial='5x')]
+    assert errors_by_line(checked) == {('codes', 2): validator.ERROR_GTIN_CHECK_DIGIT}
+
+
+def test_report_truncates_diagnostics_but_counts_all_errors(tmp_path):
+    checked = Validator('shoes', max_diagnostics=2)
+    checked.validate_codes(['99bad'] * 5)
+
+    report = checked.report(limit=1)
+
+    assert report['codes_rejected'] == 5
+    assert report['errors'] == {validator.ERROR_STRUCTURE: 5}
+    assert len(report['diagnostics']) == 1
+    assert report['diagnostics_truncated']
+
+    path = tmp_path / 'diagnostics.csv'
+    checked.write_diagnostics(str(path))
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f, delimiter=';'))
+    assert rows[0] == ['file', 'line', 'error', 'message', 'value']
+    assert len(rows) == 3
@@ -0,0 +1,282 @@
+"""
+Предварительная проверка файлов товаров и кодов до обращения к API
+
+Ошибки во входных данных иначе обнаруживаются только API - после отправки
+отчета и цикла опроса его статуса. Validator проверяет строки заранее:
+
+- GTIN (в файле товаров и в кодах) - 14 цифр с верной контрольной цифрой;
+- структура кода GS1, обязательные AI и длина серийного номера для товарной
+  группы (config.PRODUCT_GROUP, см. PRODUCT_GROUP_RULES);
+- GTIN кода есть в файле товаров;
+- код не повторяет код из предыдущих строк (сравниваются GTIN и серийный номер,
+  поэтому один код с разными криптохвостами или разделителями - тоже повтор).
+
+Для каждой ошибочной строки формируется диагностика (файл, номер строки, код
+ошибки, сообщение), а сама строка отбрасывается. Коды в стандартной форме
+01<GTIN>21<серийный номер> проверяются без посимвольного разбора, а
+контрольная цифра вычисляется один раз на GTIN, поэтому файл из миллиона кодов
+проверяется за секунды. Корректные строки собираются в колоночные ProductTable
+и CodeBatch (columnar.py).
+"""
+
+import csv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from columnar import CodeBatch, ProductTable
+from config import PRODUCT_GROUP, VALIDATION_MAX_DIAGNOSTICS
+from file_parser import parse_product_line
+from gs1 import AI_GTIN, AI_SERIAL, AI_TABLE, GS, GS_TEXT, GS1Error, is_valid_gtin, parse_element_string
+
+# Файлы
+FILE_PRODUCTS = 'products'
+FILE_CODES = 'codes'
+
+# Коды ошибок
+ERROR_FORMAT = 'format'                    # строка файла товаров не разбирается
+ERROR_QUANTITY = 'quantity'                # количество меньше 1
+ERROR_GTIN_FORMAT = 'gtin_format'          # GTIN не из 14 цифр
+ERROR_GTIN_CHECK_DIGIT = 'gtin_check_digit'
+ERROR_STRUCTURE = 'structure'              # код не разбирается как строка элементов GS1
+ERROR_MISSING_AI = 'missing_ai'
+ERROR_SERIAL_LENGTH = 'serial_length'
+ERROR_UNKNOWN_GTIN = 'unknown_gtin'        # GTIN кода нет в файле товаров
+ERROR_DUPLICATE = 'duplicate'
+
+
+class GroupRules:
+    """Требования к кодам товарной группы: длина серийного номера и обязательные AI"""
+
+    def __init__(self, serial_length: Optional[int], required_ais: Tuple[str, ...] = (AI_GTIN, AI_SERIAL)):
+        self.serial_length = serial_length
+        self.required_ais = required_ais
+
+
+# Товарные группы (Таблица 4.2.1.2) -> требования к коду. Криптохвост (AI 91/92/93)
+# не обязателен: файл кодов содержит неполные коды
+PRODUCT_GROUP_RULES: Dict[str, GroupRules] = {
+    'shoes': GroupRules(13),
+    'lp': GroupRules(13),
+    'tires': GroupRules(13),
+    'perfumery': GroupRules(13),
+    'photo': GroupRules(13),
+    'water': GroupRules(13),
+    'milk': GroupRules(6),
+}
+
+# Для неизвестной группы проверяется только структура и максимальная длина серийного номера
+DEFAULT_RULES = GroupRules(None)
+
+_SERIAL_OFFSET = 18
+_SERIAL_MAX_LENGTH = AI_TABLE[AI_SERIAL][1]
+
+# Корректные коды добавляются в CodeBatch блоками по столько штук
+_CODES_CHUNK = 65536
+
+
+class Validator:
+    """
+    Проверяет строки файлов товаров и кодов и накапливает диагностику
+
+        validator = Validator()
+        products = validator.validate_products(product_lines)
+        codes = validator.validate_codes(code_lines)
+        validator.report()
+
+    Если файл товаров проверен, коды проверяются на соответствие его GTIN.
+    Диагностика хранится для первых max_diagnostics строк (None - для всех),
+    счетчики ошибок - всегда полные.
+    """
+
+    def __init__(self, product_group: str = PRODUCT_GROUP,
+                 max_diagnostics: Optional[int] = VALIDATION_MAX_DIAGNOSTICS):
+        self.rules = PRODUCT_GROUP_RULES.get(product_group, DEFAULT_RULES)
+        self.max_diagnostics = max_diagnostics
+        self.diagnostics: List[Tuple[str, int, str, str, str]] = []
+        self.errors: Dict[str, int] = {}
+        self.totals = {FILE_PRODUCTS: 0, FILE_CODES: 0}
+        self.rejected = {FILE_PRODUCTS: 0, FILE_CODES: 0}
+        self._product_gtins: Optional[set] = None
+        self._gtin_valid: Dict[str, bool] = {}
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def _reject(self, file: str, line_num: int, error: str, message: str, value: str):
+        self.rejected[file] += 1
+        self.errors[error] = self.errors.get(error, 0) + 1
+        if self.max_diagnostics is None or len(self.diagnostics) < self.max_diagnostics:
+            self.diagnostics.append((file, line_num, error, message, value))
+
+    def _check_gtin(self, gtin: str) -> Optional[Tuple[str, str]]:
+        """(код ошибки, сообщение) или None; результат кэшируется по GTIN"""
+        valid = self._gtin_valid.get(gtin)
+        if valid is None:
+            valid = self._gtin_valid[gtin] = is_valid_gtin(gtin)
+        if valid:
+            return None
+        if len(gtin) != 14 or not gtin.isdigit():
+            return ERROR_GTIN_FORMAT, f"GTIN должен состоять из 14 цифр: {gtin}"
+        return ERROR_GTIN_CHECK_DIGIT, f"Неверная контрольная цифра GTIN {gtin}"
+
+    def validate_products(self, lines: Iterable[str]) -> ProductTable:
+        """
+        Проверяет строки файла товаров (GTIN; описание; количество)
+
+        Returns:
+            ProductTable: корректные товары
+        """
+        products = ProductTable()
+        gtins = self._product_gtins if self._product_gtins is not None else set()
+        for line_num, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            self.totals[FILE_PRODUCTS] += 1
+            try:
+                product = parse_product_line(line, line_num)
+            except ValueError as e:
+                self._reject(FILE_PRODUCTS, line_num, ERROR_FORMAT, str(e), line)
+                continue
+            problem = self._check_gtin(product['gtin'])
+            if problem:
+                self._reject(FILE_PRODUCTS, line_num, problem[0], problem[1], line)
+                continue
+            if product['quantity'] < 1:
+                self._reject(FILE_PRODUCTS, line_num, ERROR_QUANTITY,
+                             f"Количество должно быть больше нуля: {product['quantity']}", line)
+                continue
+            gtins.add(product['gtin'])
+            products.append(product['gtin'], product['description'], product['quantity'])
+        self._product_gtins = gtins
+        return products
+
+    def _parse_code(self, code: str) -> Tuple[Optional[str], Optional[str], Optional[Tuple[str, str]]]:
+        """
+        Разбор нестандартного кода: (GTIN, серийный номер, ошибка или None)
+        """
+        serial_length = self.rules.serial_length
+        try:
+            elements = parse_element_string(code, serial_length)
+        except GS1Error as e:
+            if serial_length is None:
+                return None, None, (ERROR_STRUCTURE, str(e))
+            # Код может разбираться без ограничения длины серийного номера - тогда ошибка в его длине
+            try:
+                elements = parse_element_string(code)
+            except GS1Error:
+                return None, None, (ERROR_STRUCTURE, str(e))
+        missing = [ai for ai in self.rules.required_ais if ai not in elements]
+        if missing:
+            return None, None, (ERROR_MISSING_AI, f"Нет обязательных AI: {', '.join(missing)}")
+        return elements[AI_GTIN], elements[AI_SERIAL], None
+
+    def validate_codes(self, lines: Iterable[str]) -> CodeBatch:
+        """
+        Проверяет строки файла кодов (один код на строку)
+
+        Returns:
+            CodeBatch: корректные коды без повторов, в исходном порядке
+        """
+        batch = CodeBatch()
+        codes = []
+        gtins = []
+        seen: Dict[str, int] = {}
+        product_gtins = self._product_gtins
+        # GTIN из файла товаров уже проверены
+        checked_gtins = product_gtins or ()
+        serial_length = self.rules.serial_length
+        check_gtin = self._check_gtin
+        for line_num, line in enumerate(lines, 1):
+            code = line.strip()
+            if not code:
+                continue
+            self.totals[FILE_CODES] += 1
+
+            # Стандартная форма 01<GTIN>21<серийный номер>[разделитель...] - без посимвольного разбора
+            key = None
+            if code.startswith(AI_GTIN) and code.startswith(AI_SERIAL, 16):
+                end = code.find(GS, _SERIAL_OFFSET)
+                if end == -1:
+                    end = code.find(GS_TEXT, _SERIAL_OFFSET)
+                    if end == -1:
+                        end = len(code)
+                length = end - _SERIAL_OFFSET
+                if length == serial_length or (serial_length is None and 0 < length <= _SERIAL_MAX_LENGTH):
+                    key = code[:end]
+                    gtin = code[2:16]
+            if key is None:
+                gtin, serial, problem = self._parse_code(code)
+                if problem:
+                    self._reject(FILE_CODES, line_num, problem[0], problem[1], code)
+                    continue
+                if serial_length is not None and len(serial) != serial_length:
+                    self._reject(FILE_CODES, line_num, ERROR_SERIAL_LENGTH,
+                                 f"Длина серийного номера {len(serial)}, ожидается {serial_length}", code)
+                    continue
+                key = AI_GTIN + gtin + AI_SERIAL + serial
+
+            if gtin not in checked_gtins:
+                problem = check_gtin(gtin)
+                if problem:
+                    self._reject(FILE_CODES, line_num, problem[0], problem[1], code)
+                    continue
+                if product_gtins is not None:
+                    self._reject(FILE_CODES, line_num, ERROR_UNKNOWN_GTIN, f"GTIN {gtin} нет в файле товаров", code)
+                    continue
+            # Ключ повтора - 01<GTIN>21<серийный номер> без криптохвоста
+            first = seen.setdefault(key, line_num)
+            if first != line_num:
+                self._reject(FILE_CODES, line_num, ERROR_DUPLICATE, f"Повтор кода из строки {first}", code)
+                continue
+            codes.append(code)
+            gtins.append(gtin)
+            if len(codes) >= _CODES_CHUNK:
+                batch.extend(codes, gtins)
+                codes = []
+                gtins = []
+        batch.extend(codes, gtins)
+        return batch
+
+    def iter_diagnostics(self) -> Iterable[dict]:
+        for file, line_num, error, message, value in self.diagnostics:
+            yield {'file': file, 'line': line_num, 'error': error, 'message': message, 'value': value}
+
+    def report(self, limit: Optional[int] = None) -> dict:
+        """
+        Сводка проверки: количество строк и отброшенных строк по файлам,
+        ошибки по кодам и диагностика (не более limit строк)
+        """
+        diagnostics = list(self.iter_diagnostics())
+        shown = diagnostics if limit is None else diagnostics[:limit]
+        return {
+            'valid': self.valid,
+            'products_total': self.totals[FILE_PRODUCTS],
+            'products_rejected': self.rejected[FILE_PRODUCTS],
+            'codes_total': self.totals[FILE_CODES],
+            'codes_rejected': self.rejected[FILE_CODES],
+            'errors': dict(self.errors),
+            'diagnostics': shown,
+            'diagnostics_truncated': len(shown) < sum(self.rejected.values()),
+        }
+
+    def write_diagnostics(self, path: str):
+        """Сохраняет диагностику в CSV (разделитель ';')"""
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(('file', 'line', 'error', 'message', 'value'))
+            writer.writerows(self.diagnostics)
+
+
+def validate_files(product_lines: Iterable[str], code_lines: Iterable[str], product_group: str = PRODUCT_GROUP,
+                   max_diagnostics: Optional[int] = VALIDATION_MAX_DIAGNOSTICS) -> Tuple[ProductTable, CodeBatch, Validator]:
+    """
+    Проверяет строки обоих файлов
+
+    Returns:
+        tuple: (корректные товары, корректные коды, Validator с диагностикой)
+    """
+    validator = Validator(product_group, max_diagnostics)
+    products = validator.validate_products(product_lines)
+    codes = validator.validate_codes(code_lines)
+    return products, codes, validator